@@ -25,20 +25,57 @@ from backend.models import (
     THINKING_LEVELS,
     ModelConfig,
 )
-from backend.pricing import estimate_dataset_cost, format_cost, ModelPrice
+from backend.pricing import (
+    estimate_dataset_cost,
+    estimate_dataset_cost_range,
+    format_cost,
+    format_cost_range,
+    ModelPrice,
+)
 from backend.fuzzy_match import find_safe_delimiter
 from backend.classifier import (
+    DEFAULT_CONCURRENCY,
+    ResultTally,
     classify_rows,
     count_tokens_for_prompt,
+    iter_classify,
     estimate_tokens_from_sample,
     apply_results_to_dataframe,
+    summarize_results,
+)
+from backend.cache import get_response_cache
+from backend.checkpoint import RunJournal
+from backend.dataset import CsvDataset
+from backend.label_codes import make_label_codes
+from backend.semantic_cache import DEFAULT_SEMANTIC_THRESHOLD, SemanticCache
+from backend.clustering import (
+    DEFAULT_CLUSTER_THRESHOLD,
+    DEFAULT_SPOT_CHECKS,
+    classify_clusters,
+    cluster_rows,
+    propagate_results,
+)
+from backend.distill import (
+    DEFAULT_TARGET_AGREEMENT,
+    DEFAULT_WARMUP_ROWS,
+    classify_with_distillation,
+)
+from backend.hierarchy import CategoryTree, classify_hierarchical, is_category_tree
+from backend.retrieval import (
+    DEFAULT_TOP_K,
+    RECOMMENDED_MIN_CATEGORIES,
+    CategoryIndex,
+    get_category_index,
 )
+from backend.concurrency import AdaptiveConcurrency
+from backend.output import OUTPUT_DIR, ResultSink
 from backend.feedback import get_prompt_feedback
 from backend.batch import (
-    prepare_batch_requests,
+    iter_batch_requests,
     submit_batch,
     check_batch_status,
     retrieve_batch_results,
+    load_batch_record,
     load_tracked_batches,
     cleanup_batch,
 )
@@ -48,6 +85,11 @@ from backend.arena import (
     export_arena_data,
     DEFAULT_JUDGE_PROMPT,
 )
+from backend.cascade import (
+    run_cascade,
+    DEFAULT_MIN_CONFIDENCE,
+    DEFAULT_MIN_MATCH_SCORE,
+)
 
 st.set_page_config(page_title="LLM Classifier", layout="wide")
 
@@ -58,6 +100,17 @@ def _prompt_cache_key(template: str, categories: list[str]) -> str:
     return hashlib.sha256(raw.encode()).hexdigest()[:12]
 
 
+@st.cache_data(show_spinner="Counting rows...")
+def _count_csv_rows(path: str, mtime: float) -> int:
+    # mtime is only part of the cache key, so an edited file is recounted
+    return CsvDataset(path).count_rows()
+
+
+@st.cache_data(show_spinner="Sampling rows...")
+def _sample_csv(path: str, mtime: float, engine: str, method: str) -> pd.DataFrame:
+    return CsvDataset(path, engine=engine).sample(method=method)
+
+
 # ── Session state defaults ─────────────────────────────────────────────
 if "df" not in st.session_state:
     st.session_state.df = None
@@ -65,6 +118,8 @@ if "results" not in st.session_state:
     st.session_state.results = None
 if "arena_results" not in st.session_state:
     st.session_state.arena_results = None
+if "cascade_results" not in st.session_state:
+    st.session_state.cascade_results = None
 if "prompt_cache" not in st.session_state:
     st.session_state.prompt_cache = {}
 
@@ -72,7 +127,58 @@ if "prompt_cache" not in st.session_state:
 # ── Sidebar: Data Upload ───────────────────────────────────────────────
 st.sidebar.title("📁 Data")
 uploaded_file = st.sidebar.file_uploader("Upload CSV", type=["csv"])
-if uploaded_file is not None:
+local_csv_path = st.sidebar.text_input(
+    "...or path to a large CSV on disk",
+    key="local_csv_path",
+    placeholder="/data/export.csv",
+    help=(
+        "Read in chunks from disk instead of uploading, so there's no upload "
+        "size limit. Only the prompt's columns are loaded during a run; "
+        "previews, test runs and estimates use a sample of rows."
+    ),
+)
+random_csv_sample = st.sidebar.checkbox(
+    "Sample rows at random",
+    value=True,
+    key="random_csv_sample",
+    help=(
+        "Preview and estimate from a random sample of the file instead of "
+        "its first rows (one extra pass over the file). Use this when the "
+        "export is sorted, e.g. by length or date."
+    ),
+)
+use_pyarrow_csv = st.sidebar.checkbox(
+    "Use pyarrow CSV reader",
+    value=False,
+    key="use_pyarrow_csv",
+    help="Faster parsing of large files (requires pyarrow).",
+)
+
+# `dataset` is set when reading from disk; `df` is then only a sample
+dataset: CsvDataset | None = None
+total_rows = 0
+if local_csv_path.strip():
+    try:
+        dataset = CsvDataset(
+            local_csv_path.strip(),
+            engine="pyarrow" if use_pyarrow_csv else "c",
+        )
+        mtime = dataset.path.stat().st_mtime
+        sample_method = "random" if random_csv_sample else "head"
+        st.session_state.df = _sample_csv(
+            str(dataset.path), mtime, dataset.engine, sample_method
+        )
+        total_rows = _count_csv_rows(str(dataset.path), mtime)
+        st.sidebar.success(
+            f"Found {total_rows} rows, {len(st.session_state.df.columns)} "
+            f"columns (previewing "
+            f"{'a random' if random_csv_sample else 'the first'} "
+            f"{len(st.session_state.df)})"
+        )
+    except (OSError, ValueError) as e:
+        dataset = None
+        st.sidebar.error(f"Could not read CSV: {e}")
+elif uploaded_file is not None:
     st.session_state.df = pd.read_csv(uploaded_file)
     st.sidebar.success(
         f"Loaded {len(st.session_state.df)} rows, "
@@ -80,6 +186,201 @@ if uploaded_file is not None:
     )
 
 df = st.session_state.df
+if dataset is None and df is not None:
+    total_rows = len(df)
+
+
+def _full_input(columns: list[str] | None = None):
+    """The whole dataset: chunks streamed from disk, or the in-memory frame."""
+    if dataset is not None:
+        return dataset.chunks(columns)
+    return df
+
+# ── Sidebar: Performance ───────────────────────────────────────────────
+st.sidebar.title("⚡ Performance")
+concurrency = st.sidebar.slider(
+    "Concurrent requests",
+    min_value=1, max_value=64, value=DEFAULT_CONCURRENCY,
+    key="concurrency",
+    help="Maximum number of LLM requests kept in flight at once.",
+)
+adaptive_concurrency = st.sidebar.checkbox(
+    "Adaptive concurrency (AIMD)",
+    value=False,
+    key="adaptive_concurrency",
+    help=(
+        "Start low and grow the in-flight window while latency stays flat; "
+        "halve it on 429/503s or latency spikes. The slider above is the cap."
+    ),
+)
+
+pack_rows = st.sidebar.checkbox(
+    "Pack multiple rows per request",
+    value=False,
+    key="pack_rows",
+    help=(
+        "Send several rows in one request and ask for a JSON array of labels. "
+        "Saves the repeated instructions and category list on short texts."
+    ),
+)
+pack_size: int | None = 1
+if pack_rows:
+    _pack_choice = st.sidebar.number_input(
+        "Rows per request (0 = auto)",
+        min_value=0, max_value=50, value=0, key="pack_size",
+        help="Auto picks the size from the model's context window and token counts.",
+    )
+    pack_size = int(_pack_choice) or None
+
+structured_output = st.sidebar.checkbox(
+    "Structured output (JSON schema)",
+    value=False,
+    key="structured_output",
+    help=(
+        "Constrain answers to a schema whose labels are the categories, so "
+        "labels are decoded directly instead of fuzzy-matched. Applies to "
+        "single-row requests."
+    ),
+)
+
+use_label_codes = st.sidebar.checkbox(
+    "Answer with label codes",
+    value=False,
+    key="use_label_codes",
+    help=(
+        "List categories as short codes (A1, A2, ...) and have the model "
+        "answer with codes, which are decoded back to category names. "
+        "Saves output tokens when category names are long."
+    ),
+)
+
+shortlist_categories = st.sidebar.checkbox(
+    "Shortlist categories by embedding (RAG)",
+    value=False,
+    key="shortlist_categories",
+    help=(
+        "Embed the categories once and list only the ones most similar to "
+        "each row in its prompt. Cuts input tokens on large taxonomies; "
+        "answers are still matched against every category."
+    ),
+)
+retrieval_top_k = DEFAULT_TOP_K
+if shortlist_categories:
+    retrieval_top_k = int(st.sidebar.number_input(
+        "Categories per row",
+        min_value=1, max_value=200, value=DEFAULT_TOP_K, key="retrieval_top_k",
+    ))
+    if pack_rows or use_label_codes:
+        st.sidebar.caption("Row packing and label codes are off while shortlisting.")
+        pack_size = 1
+        use_label_codes = False
+
+reuse_near_duplicates = st.sidebar.checkbox(
+    "Reuse labels for near-duplicate rows",
+    value=False,
+    key="reuse_near_duplicates",
+    help=(
+        "Rows whose prompt column text is nearly identical to an already "
+        "labelled row (e.g. templated emails differing only in names or "
+        "IDs) take that row's label without a request. Similarity is "
+        "estimated with MinHash over character shingles."
+    ),
+)
+near_duplicate_threshold = DEFAULT_SEMANTIC_THRESHOLD
+if reuse_near_duplicates:
+    near_duplicate_threshold = st.sidebar.slider(
+        "Near-duplicate similarity",
+        min_value=0.5, max_value=1.0, value=DEFAULT_SEMANTIC_THRESHOLD, step=0.01,
+        key="near_duplicate_threshold",
+        help="Estimated Jaccard similarity of character shingles needed to reuse a label.",
+    )
+
+use_cache = st.sidebar.checkbox(
+    "Use response cache",
+    value=True,
+    key="use_cache",
+    help=(
+        "Serve repeated requests (same model settings and rendered prompt) "
+        "from the on-disk cache instead of calling the model again."
+    ),
+)
+_cache_stats = get_response_cache().stats()
+st.sidebar.caption(
+    f"Cache: {_cache_stats['entries']} responses, "
+    f"{_cache_stats['bytes'] / 1_000_000:.1f} MB"
+)
+if st.sidebar.button("🗑️ Clear response cache", key="clear_cache_btn"):
+    get_response_cache().clear()
+    st.rerun()
+
+
+def _retrieval_index(categories: list[str]) -> CategoryIndex | None:
+    if not shortlist_categories:
+        return None
+    return get_category_index(categories, top_k=retrieval_top_k)
+
+
+def _semantic_cache() -> SemanticCache | None:
+    if not reuse_near_duplicates:
+        return None
+    return SemanticCache(threshold=near_duplicate_threshold)
+
+
+def _make_controller() -> AdaptiveConcurrency | None:
+    if not adaptive_concurrency:
+        return None
+    return AdaptiveConcurrency(initial=min(4, concurrency), max_limit=concurrency)
+
+
+def _summary_text(summary: dict) -> str:
+    text = (
+        f"{summary['api_calls']} API calls for {summary['rows']} rows"
+        f" | {summary['cache_hits']} from cache"
+    )
+    if summary["packed_rows"]:
+        text += f" | {summary['packed_rows']} rows answered in packed requests"
+    if summary["schema_decoded_rows"]:
+        text += (
+            f" | {summary['schema_decoded_rows']} labels decoded from the "
+            f"output schema"
+        )
+    if summary["code_saved_output_tokens"]:
+        text += (
+            f" | label codes saved {summary['code_saved_output_tokens']:,} "
+            f"output tokens"
+        )
+    if summary["billed_cached_input_tokens"]:
+        text += (
+            f" | {summary['billed_cached_input_tokens']:,} of "
+            f"{summary['billed_input_tokens']:,} input tokens from prompt cache"
+        )
+    if summary["dedup_rows"]:
+        text += (
+            f" | dedup saved {summary['dedup_saved_calls']} calls, "
+            f"{summary['dedup_saved_input_tokens'] + summary['dedup_saved_output_tokens']:,} tokens"
+        )
+    if summary["cluster_rows"]:
+        text += f" | {summary['cluster_rows']} rows labelled from their cluster"
+    if summary["local_rows"]:
+        text += (
+            f" | local model labelled {summary['local_rows']} rows "
+            f"({summary['local_rows'] / summary['rows']:.0%} offloaded)"
+        )
+    if summary["semantic_hits"]:
+        text += (
+            f" | near-duplicates reused {summary['semantic_hits']} labels "
+            f"({summary['semantic_hits'] / summary['rows']:.0%} of rows, "
+            f"{summary['semantic_hits']} calls avoided)"
+        )
+    return text
+
+
+def _progress_text(current: int, total: int, controller) -> str:
+    text = f"Row {current}/{total}"
+    if controller is not None:
+        text += f" · window {controller.window}"
+    return text
+
 
 # ── Tabs ────────────────────────────────────────────────────────────────
 tab_classify, tab_arena, tab_batch = st.tabs(
@@ -108,7 +409,10 @@ with tab_classify:
         st.caption(
             "Available columns: " + ", ".join(f"`{{{c}}}`" for c in available_cols)
         )
-        st.caption("Use `{label_options}` for the category list.")
+        st.caption(
+            "Use `{label_options}` for the category list and `{answer_format}` "
+            "for the answer instruction (category names, or codes with label codes)."
+        )
 
         multi_label = st.checkbox("Multi-label classification", value=False)
         default_prompt = (
@@ -152,6 +456,37 @@ with tab_classify:
         if multi_label:
             delimiter = find_safe_delimiter(categories)
             st.caption(f"Multi-label delimiter: `{delimiter}`")
+        if shortlist_categories:
+            st.caption(
+                f"Each row's prompt lists its {min(retrieval_top_k, len(categories))} "
+                f"closest of {len(categories)} categories (the preview shows all)."
+            )
+        elif len(categories) >= RECOMMENDED_MIN_CATEGORIES:
+            st.caption(
+                f"{len(categories)} categories: consider shortlisting them by "
+                "embedding (sidebar) to cut input tokens."
+            )
+        hierarchical = False
+        category_tree = None
+        if is_category_tree(categories) and not multi_label:
+            tree = CategoryTree.parse(categories)
+            hierarchical = st.checkbox(
+                "Two-stage classification over the category tree",
+                value=False,
+                key="hierarchical",
+                help=(
+                    "Classify into the top-level groups first, then among the "
+                    "chosen group's children only. Applies to test, full-dataset, "
+                    "cluster and local-model runs, without row packing or "
+                    "category shortlisting; batch jobs use their own category list."
+                ),
+            )
+            st.caption(
+                f"Category tree: {len(tree.groups)} groups, "
+                f"{len(tree.leaves())} leaves"
+            )
+            if hierarchical:
+                category_tree = tree
 
         # Prompt preview
         st.subheader("Prompt Preview (Row 1)")
@@ -161,6 +496,7 @@ with tab_classify:
                 categories,
                 multi_label,
                 delimiter if multi_label else "|",
+                make_label_codes(categories) if use_label_codes else None,
             )
             st.code(preview, language="text")
 
@@ -208,29 +544,47 @@ with tab_classify:
             if not errors and categories:
                 token_info = estimate_tokens_from_sample(
                     df, prompt_template, categories,
-                    model_config.model_id, sample_size=5,
+                    model_config.model_id, total_rows=total_rows,
                 )
                 avg_in = token_info["avg_input_tokens"]
+                ci_low, ci_high = token_info["input_tokens_ci"]
                 # Rough output estimate for classification
                 avg_out = 20  # classifications are short
+                thinking = model_config.thinking_budget(planning=True)
 
-                st.metric("Avg input tokens/row", f"{avg_in:.0f}")
-                st.metric("Total rows", len(df))
+                st.metric(
+                    "Avg input tokens/row", f"{avg_in:.0f}",
+                    help=f"95% CI {ci_low:.0f}–{ci_high:.0f}, "
+                    f"p95 {token_info['p95_input_tokens']:.0f} "
+                    f"({token_info['sample_method']} sample)",
+                )
+                st.metric("Total rows", total_rows)
 
                 if selected_model.get("price"):
                     price = selected_model["price"]
-                    full_cost = estimate_dataset_cost(
-                        price, avg_in, avg_out, len(df)
+                    costs = estimate_dataset_cost_range(
+                        price, token_info, avg_out, total_rows, thinking
+                    )
+                    st.metric(
+                        "Estimated total cost", format_cost_range(costs),
+                        help=f"Expected {format_cost(costs['expected'])}",
                     )
-                    st.metric("Estimated total cost", format_cost(full_cost))
+                    if thinking:
+                        st.caption(
+                            f"Includes up to {thinking} thinking tokens/row; "
+                            "the low end assumes no thinking."
+                        )
 
-                    if price.input_cached_per_mtok is not None:
-                        cached_cost = estimate_dataset_cost(
-                            price, avg_in, avg_out, len(df),
-                            cached_input_tokens=int(avg_in * 0.8),
+                    avg_prefix = token_info["avg_prefix_tokens"]
+                    if price.input_cached_per_mtok is not None and avg_prefix:
+                        cached_costs = estimate_dataset_cost_range(
+                            price, token_info, avg_out, total_rows, thinking,
+                            cached_input_tokens=avg_prefix,
                         )
                         st.caption(
-                            f"With prompt caching (~80%): {format_cost(cached_cost)}"
+                            f"With prompt caching ({avg_prefix / avg_in:.0%} of "
+                            f"input is the cacheable prefix): "
+                            f"{format_cost_range(cached_costs)}"
                         )
 
         # ── AI Feedback Button ─────────────────────────────────────────
@@ -244,7 +598,8 @@ with tab_classify:
                 with st.spinner("Getting AI feedback..."):
                     try:
                         feedback = get_prompt_feedback(
-                            model_config, prompt_text, categories, multi_label
+                            model_config, prompt_text, categories, multi_label,
+                            use_cache=use_cache,
                         )
                         st.markdown(feedback)
                     except Exception as e:
@@ -264,23 +619,53 @@ with tab_classify:
                 st.error("Add categories first.")
             else:
                 progress_bar = st.progress(0, text="Classifying...")
+                controller = _make_controller()
 
                 def update_progress(current, total):
                     progress_bar.progress(
-                        current / total, text=f"Row {current}/{total}"
+                        current / total,
+                        text=_progress_text(current, total, controller),
                     )
 
                 try:
-                    results = classify_rows(
-                        df=df,
-                        model_config=model_config,
-                        prompt_template=prompt_template,
-                        categories=categories,
-                        multi_label=multi_label,
-                        delimiter=delimiter if multi_label else "|",
-                        max_rows=test_rows,
-                        progress_callback=update_progress,
-                    )
+                    stage_stats = None
+                    if hierarchical:
+                        run = classify_hierarchical(
+                            df=df,
+                            model_config=model_config,
+                            prompt_template=prompt_template,
+                            tree=category_tree,
+                            max_rows=test_rows,
+                            progress_callback=lambda stage, c, t: progress_bar.progress(
+                                c / t, text=f"{stage}: {c}/{t} rows"
+                            ),
+                            concurrency=concurrency,
+                            controller=controller,
+                            use_cache=use_cache,
+                            structured=structured_output,
+                            use_label_codes=use_label_codes,
+                        )
+                        results = run["results"]
+                        stage_stats = run["stage_stats"]
+                    else:
+                        results = classify_rows(
+                            df=df,
+                            model_config=model_config,
+                            prompt_template=prompt_template,
+                            categories=categories,
+                            multi_label=multi_label,
+                            delimiter=delimiter if multi_label else "|",
+                            max_rows=test_rows,
+                            progress_callback=update_progress,
+                            concurrency=concurrency,
+                            controller=controller,
+                            use_cache=use_cache,
+                            structured=structured_output,
+                            use_label_codes=use_label_codes,
+                            retrieval=_retrieval_index(categories),
+                            semantic_cache=_semantic_cache(),
+                            pack_size=pack_size,
+                        )
                     st.session_state.results = results
                     progress_bar.progress(1.0, text="Complete!")
 
@@ -306,16 +691,23 @@ with tab_classify:
                     avg_in = total_in / len(results) if results else 0
                     avg_out = total_out / len(results) if results else 0
 
+                    summary = summarize_results(results)
                     st.caption(
                         f"Tokens — avg input: {avg_in:.0f}, avg output: {avg_out:.0f}"
                     )
+                    st.caption(_summary_text(summary))
+                    if stage_stats:
+                        for stage, label in (("groups", "Group stage"), ("children", "Child stage")):
+                            st.caption(f"{label}: {_summary_text(stage_stats[stage])}")
 
                     if selected_model.get("price"):
                         sample_cost = selected_model["price"].estimate_cost(
-                            total_in, total_out
+                            summary["billed_input_tokens"],
+                            summary["billed_output_tokens"],
+                            summary["billed_cached_input_tokens"],
                         )
                         full_cost = estimate_dataset_cost(
-                            selected_model["price"], avg_in, avg_out, len(df)
+                            selected_model["price"], avg_in, avg_out, total_rows
                         )
                         st.caption(
                             f"Sample cost: {format_cost(sample_cost)} | "
@@ -327,6 +719,16 @@ with tab_classify:
 
         # ── Save Results ───────────────────────────────────────────────
         st.subheader("Save Results")
+        resume_run = st.checkbox(
+            "Resume from checkpoint",
+            value=True,
+            key="resume_run",
+            help=(
+                "Finished rows are journaled to disk as they complete. Re-running "
+                "the same job (same data, prompt, categories and model settings) "
+                "only processes the rows that are left."
+            ),
+        )
         if st.button("💾 Classify Full Dataset & Save", key="save_btn"):
             if errors:
                 st.error("Fix prompt errors first.")
@@ -336,41 +738,255 @@ with tab_classify:
                 st.warning(
                     "⚠️ For large datasets, consider using Batch Jobs tab instead."
                 )
-                progress_bar = st.progress(0, text="Classifying full dataset...")
-
-                def update_full_progress(current, total):
-                    progress_bar.progress(
-                        current / total, text=f"Row {current}/{total}"
+                prompt_columns = prompt_template.columns_used
+                journal = RunJournal.for_job(
+                    _full_input(prompt_columns), model_config, prompt_template,
+                    categories, multi_label, delimiter if multi_label else "|",
+                    structured=structured_output,
+                    use_label_codes=use_label_codes,
+                    # Only keyed when on, so existing journals still resume
+                    **({"retrieval_top_k": retrieval_top_k} if shortlist_categories else {}),
+                    **({"near_duplicate_threshold": near_duplicate_threshold}
+                       if reuse_near_duplicates else {}),
+                    **({"hierarchical": True} if hierarchical else {}),
+                )
+                if not resume_run:
+                    journal.discard()
+                elif journal.completed:
+                    st.info(
+                        f"Resuming: {len(journal.completed)} of {total_rows} rows "
+                        "already classified."
                     )
+                progress_bar = st.progress(0, text="Classifying full dataset...")
+                controller = _make_controller()
+                output_path = OUTPUT_DIR / f"classified_{journal.key}.csv"
+                tally = ResultTally()
 
                 try:
-                    results = classify_rows(
-                        df=df,
-                        model_config=model_config,
-                        prompt_template=prompt_template,
-                        categories=categories,
-                        multi_label=multi_label,
+                    # Results stream straight to disk; the output file is
+                    # usable while the run is still going.
+                    with ResultSink(
+                        output_path, _full_input(), multi_label=multi_label,
                         delimiter=delimiter if multi_label else "|",
-                        progress_callback=update_full_progress,
-                    )
+                    ) as sink:
+                        for result in iter_classify(
+                            df=_full_input(prompt_columns),
+                            model_config=model_config,
+                            prompt_template=prompt_template,
+                            categories=categories,
+                            multi_label=multi_label,
+                            delimiter=delimiter if multi_label else "|",
+                            concurrency=concurrency,
+                            controller=controller,
+                            use_cache=use_cache,
+                            structured=structured_output,
+                            use_label_codes=use_label_codes,
+                            retrieval=None if hierarchical else _retrieval_index(categories),
+                            semantic_cache=_semantic_cache(),
+                            pack_size=1 if hierarchical else pack_size,
+                            category_tree=category_tree,
+                            journal=journal,
+                            total_rows=total_rows,
+                        ):
+                            sink.add(result)
+                            tally.add(result)
+                            progress_bar.progress(
+                                tally.rows / total_rows,
+                                text=_progress_text(tally.rows, total_rows, controller),
+                            )
                     progress_bar.progress(1.0, text="Complete!")
-
-                    result_df = apply_results_to_dataframe(
-                        df, results, multi_label=multi_label,
-                        delimiter=delimiter if multi_label else "|",
-                    )
-
-                    csv_buffer = io.BytesIO()
-                    result_df.to_csv(csv_buffer, index=False)
-                    st.download_button(
-                        label="📥 Download Classified CSV",
-                        data=csv_buffer.getvalue(),
-                        file_name="classified_output.csv",
-                        mime="text/csv",
-                    )
+                    st.caption(_summary_text(tally.summary()))
+                    st.caption(f"Saved to `{output_path}`")
+
+                    with output_path.open("rb") as f:
+                        st.download_button(
+                            label="📥 Download Classified CSV",
+                            data=f,
+                            file_name="classified_output.csv",
+                            mime="text/csv",
+                        )
                 except Exception as e:
                     st.error(f"Error: {e}")
 
+        # ── Cluster Exploration ────────────────────────────────────────
+        with st.expander("🧩 Classify cluster representatives (exploratory)"):
+            st.caption(
+                "Clusters near-duplicate rows on the prompt columns with MinHash "
+                "LSH before any request, classifies one representative per "
+                "cluster plus spot checks, and copies each representative's "
+                "label to the rest of its cluster."
+            )
+            cluster_threshold = st.slider(
+                "Cluster similarity",
+                0.5, 1.0, DEFAULT_CLUSTER_THRESHOLD, 0.01,
+                key="cluster_threshold",
+            )
+            cluster_spot_checks = st.number_input(
+                "Spot checks per cluster",
+                min_value=0, max_value=10, value=DEFAULT_SPOT_CHECKS,
+                key="cluster_spot_checks",
+                help="Extra members classified per cluster to measure label agreement.",
+            )
+            if st.button("🧩 Cluster & Classify", key="cluster_btn"):
+                if errors:
+                    st.error("Fix prompt errors first.")
+                elif not categories:
+                    st.error("Add categories first.")
+                else:
+                    source = dataset if dataset is not None else df
+                    try:
+                        with st.spinner("Clustering rows..."):
+                            plan = cluster_rows(
+                                source, prompt_template.columns_used,
+                                threshold=cluster_threshold,
+                                spot_checks=int(cluster_spot_checks),
+                            )
+                        st.caption(
+                            f"{plan.num_rows:,} rows in {plan.num_clusters:,} "
+                            f"clusters; classifying {len(plan.sample_rows):,} rows"
+                        )
+                        progress_bar = st.progress(0, text="Classifying representatives...")
+                        controller = _make_controller()
+                        run = classify_clusters(
+                            source, plan, model_config, prompt_template, categories,
+                            multi_label, delimiter if multi_label else "|",
+                            progress_callback=lambda c, t: progress_bar.progress(
+                                c / t, text=_progress_text(c, t, controller)
+                            ),
+                            concurrency=concurrency,
+                            controller=controller,
+                            use_cache=use_cache,
+                            structured=structured_output,
+                            use_label_codes=use_label_codes,
+                            retrieval=None if hierarchical else _retrieval_index(categories),
+                            category_tree=category_tree,
+                        )
+                        output_path = OUTPUT_DIR / (
+                            "clustered_"
+                            f"{_prompt_cache_key(prompt_template.template, categories)}.csv"
+                        )
+                        tally = ResultTally()
+                        with ResultSink(
+                            output_path, _full_input(), multi_label=multi_label,
+                            delimiter=delimiter if multi_label else "|",
+                        ) as sink:
+                            for result in propagate_results(plan, run["classified"]):
+                                sink.add(result)
+                                tally.add(result)
+                        progress_bar.progress(1.0, text="Complete!")
+                        st.caption(_summary_text(tally.summary()))
+                        if run["spot_check_agreement"] is not None:
+                            st.caption(
+                                f"Spot checks: {run['spot_check_agreement']:.0%} of "
+                                f"{run['spot_checks']} agree with their representative; "
+                                f"{len(run['disagreeing_clusters'])} clusters disagree"
+                            )
+                        st.caption(f"Saved to `{output_path}`")
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+
+        # ── Distilled Local Model ──────────────────────────────────────
+        if not multi_label:
+            with st.expander("🎓 Offload confident rows to a local model"):
+                st.caption(
+                    "The first rows go to the LLM; a small local model is trained "
+                    "on their labels and labels later rows itself when its "
+                    "confidence clears a threshold calibrated on held-out LLM "
+                    "labels. The rest still go to the LLM and keep training it. "
+                    "Uses the checkpoint setting above."
+                )
+                distill_warmup = st.number_input(
+                    "Warm-up rows (LLM only)",
+                    min_value=100, max_value=100_000, value=DEFAULT_WARMUP_ROWS,
+                    step=100, key="distill_warmup",
+                )
+                distill_target = st.slider(
+                    "Required agreement with the LLM",
+                    0.8, 0.99, DEFAULT_TARGET_AGREEMENT, 0.01,
+                    key="distill_target",
+                    help="On held-out rows, for predictions above the threshold.",
+                )
+                if st.button("🎓 Classify with Local Model", key="distill_btn"):
+                    if errors:
+                        st.error("Fix prompt errors first.")
+                    elif not categories:
+                        st.error("Add categories first.")
+                    else:
+                        progress_bar = st.progress(0, text="Classifying...")
+                        controller = _make_controller()
+                        try:
+                            journal = RunJournal.for_job(
+                                _full_input(prompt_template.columns_used),
+                                model_config, prompt_template, categories,
+                                structured=structured_output,
+                                use_label_codes=use_label_codes,
+                                distill_warmup_rows=int(distill_warmup),
+                                distill_target_agreement=distill_target,
+                                **({"retrieval_top_k": retrieval_top_k}
+                                   if shortlist_categories and not hierarchical else {}),
+                                **({"hierarchical": True} if hierarchical else {}),
+                            )
+                            if not resume_run:
+                                journal.discard()
+                            elif journal.completed:
+                                st.info(
+                                    f"Resuming: {len(journal.completed)} of "
+                                    f"{total_rows} rows already classified."
+                                )
+                            output_path = OUTPUT_DIR / f"distilled_{journal.key}.csv"
+                            tally = ResultTally()
+                            with ResultSink(output_path, _full_input()) as sink:
+
+                                def record(result):
+                                    sink.add(result)
+                                    tally.add(result)
+
+                                run = classify_with_distillation(
+                                    _full_input(prompt_template.columns_used),
+                                    model_config, prompt_template,
+                                    category_tree.leaves() if hierarchical else categories,
+                                    warmup_rows=int(distill_warmup),
+                                    target_agreement=distill_target,
+                                    progress_callback=lambda c, t: progress_bar.progress(
+                                        min(c / total_rows, 1.0),
+                                        text=_progress_text(c, total_rows, controller),
+                                    ),
+                                    on_result=record,
+                                    concurrency=concurrency,
+                                    controller=controller,
+                                    use_cache=use_cache,
+                                    structured=structured_output,
+                                    use_label_codes=use_label_codes,
+                                    retrieval=(
+                                        None if hierarchical
+                                        else _retrieval_index(categories)
+                                    ),
+                                    category_tree=category_tree,
+                                    journal=journal,
+                                    total_rows=total_rows,
+                                )
+                            progress_bar.progress(1.0, text="Complete!")
+                            st.caption(_summary_text(tally.summary()))
+                            holdout = run["holdout"]
+                            if run["threshold"] is None:
+                                st.caption(
+                                    "The local model never reached the required "
+                                    "agreement; every row went to the LLM."
+                                )
+                            else:
+                                st.caption(
+                                    f"Offloaded {run['offload_ratio']:.0%} of rows "
+                                    f"(confidence ≥ {run['threshold']:.2f}, calibrated "
+                                    f"on {run['calibration_rows']} held-out rows). On "
+                                    f"{holdout['rows']} other held-out LLM-labelled rows the "
+                                    f"model agrees {holdout['agreement']:.0%} overall "
+                                    f"and {holdout['confident_agreement'] or 0:.0%} "
+                                    f"on the {holdout['coverage']:.0%} it would answer"
+                                )
+                            st.caption(f"Saved to `{output_path}`")
+                        except Exception as e:
+                            st.error(f"Error: {e}")
+
 
 # =========================================================================
 #  ARENA TAB
@@ -470,15 +1086,15 @@ with tab_arena:
                     # Use rough token estimate
                     token_info = estimate_tokens_from_sample(
                         df, arena_template, arena_categories,
-                        config.model_id, sample_size=3,
+                        config.model_id, total_rows=total_rows,
                     )
-                    avg_in = token_info["avg_input_tokens"]
                     avg_out = 20
-                    cost = estimate_dataset_cost(
-                        config.price, avg_in, avg_out, len(df)
+                    costs = estimate_dataset_cost_range(
+                        config.price, token_info, avg_out, total_rows,
+                        config.thinking_budget(planning=True),
                     )
                     st.caption(
-                        f"{config.display_name}: {format_cost(cost)}"
+                        f"{config.display_name}: {format_cost_range(costs)}"
                     )
 
         # ── Run Arena ─────────────────────────────────────────────────
@@ -502,12 +1118,88 @@ with tab_arena:
                         progress_callback=lambda p: arena_progress.progress(
                             p, text=f"Progress: {p:.0%}"
                         ),
+                        concurrency=concurrency,
+                        adaptive=adaptive_concurrency,
+                        use_cache=use_cache,
+                        total_rows=total_rows,
                     )
                     st.session_state.arena_results = arena_data
                     arena_progress.progress(1.0, text="Complete!")
                 except Exception as e:
                     st.error(f"Arena error: {e}")
 
+        # ── Cascade ───────────────────────────────────────────────────
+        with st.expander("🪜 Cascade (cheapest model first)"):
+            st.caption(
+                "Runs the selected models in order: every row goes to the "
+                "first, and only rows without a confident match are escalated "
+                "to the next. Put the cheapest model first."
+            )
+            min_match_score = st.slider(
+                "Escalate fuzzy matches scoring below",
+                60, 100, int(DEFAULT_MIN_MATCH_SCORE),
+                key="cascade_min_score",
+            )
+            min_confidence = st.slider(
+                "Escalate answers with confidence below",
+                0.0, 1.0, DEFAULT_MIN_CONFIDENCE, 0.05,
+                key="cascade_min_confidence",
+                help="Logprob confidence; only models that return logprobs (Gemini) report it.",
+            )
+            if st.button("🪜 Run Cascade", key="run_cascade_btn"):
+                if not arena_categories:
+                    st.error("Add categories.")
+                else:
+                    cascade_progress = st.progress(0, text="Running cascade...")
+                    try:
+                        st.session_state.cascade_results = run_cascade(
+                            df=df,
+                            tiers=arena_configs,
+                            prompt_template=arena_template,
+                            categories=arena_categories,
+                            multi_label=arena_multi_label,
+                            delimiter=arena_delimiter,
+                            max_rows=arena_rows,
+                            min_match_score=min_match_score,
+                            min_confidence=min_confidence,
+                            progress_callback=lambda tier, c, t: cascade_progress.progress(
+                                c / t, text=f"Tier {tier + 1}: {c}/{t} rows"
+                            ),
+                            concurrency=concurrency,
+                            use_cache=use_cache,
+                        )
+                        cascade_progress.progress(1.0, text="Complete!")
+                    except Exception as e:
+                        st.error(f"Cascade error: {e}")
+
+            if st.session_state.cascade_results:
+                cascade = st.session_state.cascade_results
+                st.table(pd.DataFrame([
+                    {
+                        "Tier": i + 1,
+                        "Model": tier["model"],
+                        "Rows": tier["rows"],
+                        "Escalated": tier["escalated"],
+                        "Rows/s": f"{tier['rows_per_second']:.1f}",
+                        "p95 Latency": f"{tier['p95_latency_s']:.2f}s",
+                        "Cost": format_cost(tier["cost"]),
+                    }
+                    for i, tier in enumerate(cascade["tier_stats"])
+                ]))
+                line = (
+                    f"Cascade: {format_cost(cascade['total_cost'])} in "
+                    f"{cascade['total_seconds']:.1f}s"
+                )
+                if cascade["single_model_cost"] is not None:
+                    line += (
+                        f" · last model alone (projected from estimated "
+                        f"tokens of every row): "
+                        f"{format_cost(cascade['single_model_cost'])}"
+                    )
+                    if cascade["single_model_seconds"] is not None:
+                        line += f" in {cascade['single_model_seconds']:.1f}s"
+                st.caption(line)
+
         # ── Display Arena Results ─────────────────────────────────────
         if st.session_state.arena_results:
             arena_data = st.session_state.arena_results
@@ -530,6 +1222,7 @@ with tab_arena:
                     "Est. Full Dataset Cost": format_cost(
                         stats["estimated_full_cost"]
                     ),
+                    "Final Window": stats.get("final_window", "—"),
                 })
             st.table(pd.DataFrame(stats_rows))
 
@@ -560,6 +1253,7 @@ with tab_arena:
                                 arena_data, df, arena_template,
                                 arena_categories, judge_config,
                                 judge_prompt, arena_rows,
+                                use_cache=use_cache,
                             )
                             st.markdown(verdict)
                         except Exception as e:
@@ -639,8 +1333,10 @@ with tab_batch:
                         if batch_multi_label
                         else "|"
                     )
-                    requests = prepare_batch_requests(
-                        df, batch_config, batch_template,
+                    # Streamed to the upload file a block at a time
+                    requests = iter_batch_requests(
+                        _full_input(batch_template.columns_used),
+                        batch_config, batch_template,
                         batch_categories, batch_multi_label, batch_delimiter,
                     )
 
@@ -650,6 +1346,13 @@ with tab_batch:
                                 requests, batch_config, batch_description
                             )
                             st.success(f"Batch submitted! ID: `{batch_id}`")
+                            record = load_batch_record(batch_id)
+                            if record.get("dedup_saved_requests"):
+                                st.caption(
+                                    f"Dedup: {record['num_requests']} unique prompts "
+                                    f"for {record['num_rows']} rows "
+                                    f"({record['dedup_saved_requests']} requests saved)"
+                                )
                         except Exception as e:
                             st.error(f"Batch submission error: {e}")
                 else:
@@ -685,8 +1388,11 @@ with tab_batch:
                                 cats = batch_categories
                                 ml = batch.get("multi_label", False)
                                 dlm = batch.get("delimiter", "|")
+                                # Duplicate rows are re-derived from the data
                                 results = retrieve_batch_results(
-                                    bid, cats, ml, dlm
+                                    bid, cats, ml, dlm,
+                                    data=_full_input(batch_template.columns_used),
+                                    prompt_template=batch_template,
                                 )
                                 if results and "error" not in results[0]:
                                     st.dataframe(
@@ -1,9 +1,15 @@
 """Arena mode: compare multiple models and judge results."""
 
 import pandas as pd
-import litellm
 
-from backend.classifier import classify_rows, ClassificationResult
+from backend.classifier import (
+    classify_rows,
+    summarize_results,
+    ClassificationResult,
+    DEFAULT_CONCURRENCY,
+)
+from backend.concurrency import AdaptiveConcurrency
+from backend.llm import complete
 from backend.models import ModelConfig
 from backend.prompt import PromptTemplate
 from backend.pricing import estimate_dataset_cost, format_cost
@@ -40,9 +46,21 @@ def run_arena(
     delimiter: str = "|",
     max_rows: int = 10,
     progress_callback=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    adaptive: bool = False,
+    use_cache: bool = True,
+    total_rows: int | None = None,
 ) -> dict:
     """Run classification with multiple models for comparison.
 
+    Each model's rows are classified concurrently by the async engine,
+    with up to `concurrency` requests in flight.  With `adaptive`, each
+    model gets its own AIMD controller capped at `concurrency`, since
+    headroom differs a lot between models.
+
+    `total_rows` is the full dataset size for cost estimates, when `df` is
+    only a sample of it.
+
     Returns a dict with results from each model and aggregated data.
     """
     all_results = {}
@@ -60,6 +78,12 @@ def run_arena(
                 overall = (model_idx * max_rows + current) / (total_models * max_rows)
                 progress_callback(overall)
 
+        controller = (
+            AdaptiveConcurrency(initial=min(4, concurrency), max_limit=concurrency)
+            if adaptive
+            else None
+        )
+
         results = classify_rows(
             df=df,
             model_config=config,
@@ -69,13 +93,19 @@ def run_arena(
             delimiter=delimiter,
             max_rows=max_rows,
             progress_callback=model_progress,
+            concurrency=concurrency,
+            controller=controller,
+            use_cache=use_cache,
         )
 
         all_results[model_key] = results
 
-        # Calculate token stats
+        # Calculate token stats; the sample cost counts only billed tokens,
+        # not the cache and dedup rows' would-be usage
+        summary = summarize_results(results)
         total_input = sum(r.input_tokens for r in results)
         total_output = sum(r.output_tokens for r in results)
+        total_cached = sum(r.cached_input_tokens for r in results)
         avg_input = total_input / len(results) if results else 0
         avg_output = total_output / len(results) if results else 0
 
@@ -84,15 +114,23 @@ def run_arena(
             "avg_output_tokens": avg_output,
             "total_input_tokens": total_input,
             "total_output_tokens": total_output,
-            "sample_cost": config.price.estimate_cost(total_input, total_output)
+            "total_cached_input_tokens": total_cached,
+            "sample_cost": config.price.estimate_cost(
+                summary["billed_input_tokens"],
+                summary["billed_output_tokens"],
+                summary["billed_cached_input_tokens"],
+            )
             if config.price
             else 0,
             "estimated_full_cost": estimate_dataset_cost(
-                config.price, avg_input, avg_output, len(df)
+                config.price, avg_input, avg_output, total_rows or len(df)
             )
             if config.price
             else 0,
         }
+        token_stats[model_key]["summary"] = summary
+        if controller is not None:
+            token_stats[model_key]["final_window"] = controller.window
 
     return {
         "results": all_results,
@@ -109,6 +147,7 @@ def judge_arena_results(
     judge_config: ModelConfig,
     judge_prompt: str = DEFAULT_JUDGE_PROMPT,
     max_rows: int = 10,
+    use_cache: bool = True,
 ) -> str:
     """Use a judge model to evaluate arena results.
 
@@ -139,15 +178,13 @@ def judge_arena_results(
 
     final_prompt = judge_prompt.format(classifications=classifications_text)
 
-    kwargs = judge_config.to_litellm_kwargs()
-    kwargs["max_tokens"] = 4096
-
-    response = litellm.completion(
-        messages=[{"role": "user", "content": final_prompt}],
-        **kwargs,
+    reply = complete(
+        judge_config,
+        [{"role": "user", "content": final_prompt}],
+        use_cache=use_cache,
+        max_tokens=4096,
     )
-
-    return response.choices[0].message.content.strip()
+    return reply.content
 
 
 def export_arena_data(
@@ -3,15 +3,17 @@
 import json
 import os
 import time
+from collections.abc import Iterable, Iterator
 from datetime import datetime
 from pathlib import Path
 
 import litellm
 import pandas as pd
 
+from backend.dataset import iter_blocks
 from backend.models import ModelConfig
-from backend.prompt import PromptTemplate
-from backend.fuzzy_match import fuzzy_match_label, fuzzy_match_multi_label
+from backend.prompt import PromptTemplate, prompt_hash
+from backend.fuzzy_match import get_matcher
 
 
 BATCH_STATE_DIR = Path(__file__).parent.parent / "batch_state"
@@ -60,6 +62,17 @@ def load_tracked_batches() -> list[dict]:
     return sorted(batches, key=lambda b: b.get("created_at", ""), reverse=True)
 
 
+def load_batch_record(batch_id: str) -> dict:
+    """Load the tracking record for a batch, or {} if it isn't tracked."""
+    filepath = BATCH_STATE_DIR / f"{batch_id}.json"
+    if not filepath.exists():
+        return {}
+    try:
+        return json.loads(filepath.read_text())
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+
 def cleanup_batch(batch_id: str):
     """Remove batch tracking file after completion."""
     filepath = BATCH_STATE_DIR / f"{batch_id}.json"
@@ -67,25 +80,59 @@ def cleanup_batch(batch_id: str):
         filepath.unlink()
 
 
-def prepare_batch_requests(
-    df: pd.DataFrame,
+def _iter_row_prompts(
+    df: pd.DataFrame | Iterable[pd.DataFrame],
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool,
+    delimiter: str,
+    dedup: bool,
+) -> Iterator[tuple[int, int, str]]:
+    """Yield (row index, first row with the same prompt, prompt) per row.
+
+    Without `dedup` every row is its own first row.  Only a hash per
+    distinct prompt is kept.
+    """
+    first_rows: dict[str, int] = {}
+    compiled = prompt_template.compile(categories, multi_label, delimiter)
+    for start, block in iter_blocks(df):
+        for offset, prompt_text in enumerate(compiled.render_frame(block)):
+            idx = start + offset
+            first = idx
+            if dedup:
+                first = first_rows.setdefault(prompt_hash(prompt_text), idx)
+            yield idx, first, prompt_text
+
+
+def iter_batch_requests(
+    df: pd.DataFrame | Iterable[pd.DataFrame],
     model_config: ModelConfig,
     prompt_template: PromptTemplate,
     categories: list[str],
     multi_label: bool = False,
     delimiter: str = "|",
-) -> list[dict]:
-    """Prepare batch request payloads for Vertex AI batch prediction.
-
-    Returns a list of request dicts in the format expected by Vertex AI
-    batch prediction (JSONL format).
+    dedup: bool = True,
+) -> Iterator[dict]:
+    """Yield batch request payloads for Vertex AI batch prediction.
+
+    Requests are in the format expected by Vertex AI batch prediction
+    (JSONL format) and are rendered a block of rows at a time, so inputs
+    larger than memory can be streamed to disk.  With `dedup`, rows with
+    identical rendered prompts share the request of the first of them; each
+    later duplicate yields only a small marker, `{"custom_id": ...,
+    "duplicate_row": idx}`, naming the request that answers it.
+
+    `df` may be an iterable of DataFrame chunks (see CsvDataset.chunks);
+    rows are numbered across chunks.
     """
-    requests = []
-    for idx, (_, row) in enumerate(df.iterrows()):
-        prompt_text = prompt_template.render(
-            row.to_dict(), categories, multi_label, delimiter
-        )
-        request = {
+    rows = _iter_row_prompts(
+        df, prompt_template, categories, multi_label, delimiter, dedup,
+    )
+    for idx, first, prompt_text in rows:
+        if first != idx:
+            yield {"custom_id": f"row-{first}", "duplicate_row": idx}
+            continue
+        yield {
             "custom_id": f"row-{idx}",
             "method": "POST",
             "url": "/v1/chat/completions",
@@ -96,30 +143,87 @@ def prepare_batch_requests(
                 "temperature": model_config.temperature,
             },
         }
-        requests.append(request)
-    return requests
+
+
+def iter_duplicate_rows(
+    df: pd.DataFrame | Iterable[pd.DataFrame],
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+) -> Iterator[tuple[int, str]]:
+    """Yield (row index, custom_id answering it) for every duplicate row.
+
+    Re-renders the prompts a block at a time, so the duplicate groups of a
+    deduplicated batch are rebuilt from the dataset instead of being stored
+    with the batch state.  Pass the same data, template, categories and
+    options the batch was submitted with.
+    """
+    rows = _iter_row_prompts(
+        df, prompt_template, categories, multi_label, delimiter, dedup=True,
+    )
+    for idx, first, _ in rows:
+        if first != idx:
+            yield idx, f"row-{first}"
+
+
+def prepare_batch_requests(
+    df: pd.DataFrame | Iterable[pd.DataFrame],
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    dedup: bool = True,
+) -> list[dict]:
+    """iter_batch_requests' requests as a list, for small inputs.
+
+    Duplicate-row markers are left out.
+    """
+    return [
+        req for req in iter_batch_requests(
+            df, model_config, prompt_template, categories, multi_label,
+            delimiter, dedup,
+        )
+        if "duplicate_row" not in req
+    ]
+
+
+def write_batch_requests(requests: Iterable[dict], path: str | Path) -> dict:
+    """Write requests to a JSONL file as they come, skipping duplicate markers.
+
+    Returns the request and row counts; nothing per row is kept.
+    """
+    num_requests = 0
+    num_rows = 0
+    with open(path, "w") as f:
+        for req in requests:
+            num_rows += 1
+            if "duplicate_row" in req:
+                continue
+            f.write(json.dumps(req) + "\n")
+            num_requests += 1
+    return {"num_requests": num_requests, "num_rows": num_rows}
 
 
 def submit_batch(
-    requests: list[dict],
+    requests: Iterable[dict],
     model_config: ModelConfig,
     description: str = "",
 ) -> str:
     """Submit a batch job to Vertex AI.
 
-    Returns the batch ID for tracking.
+    `requests` may be a list or a generator such as iter_batch_requests;
+    they are streamed to a JSONL file before upload.  Returns the batch ID
+    for tracking.
     """
     import tempfile
 
-    # Write requests to a JSONL file
-    with tempfile.NamedTemporaryFile(
-        mode="w", suffix=".jsonl", delete=False
-    ) as f:
-        for req in requests:
-            f.write(json.dumps(req) + "\n")
+    with tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False) as f:
         jsonl_path = f.name
-
     try:
+        counts = write_batch_requests(requests, jsonl_path)
+
         # Use litellm's batch API
         batch_response = litellm.create_batch(
             input_file_id=jsonl_path,
@@ -133,7 +237,9 @@ def submit_batch(
         save_batch_id(batch_id, {
             "model": model_config.model_id,
             "description": description,
-            "num_requests": len(requests),
+            "num_requests": counts["num_requests"],
+            "num_rows": counts["num_rows"],
+            "dedup_saved_requests": counts["num_rows"] - counts["num_requests"],
         })
 
         return batch_id
@@ -163,8 +269,16 @@ def retrieve_batch_results(
     categories: list[str],
     multi_label: bool = False,
     delimiter: str = "|",
+    data: pd.DataFrame | Iterable[pd.DataFrame] | None = None,
+    prompt_template: PromptTemplate | None = None,
 ) -> list[dict]:
-    """Retrieve and parse results from a completed batch."""
+    """Retrieve and parse results from a completed batch.
+
+    When the batch deduplicated rows and the submitted `data` and
+    `prompt_template` are given, the duplicate groups are rebuilt from them
+    (see iter_duplicate_rows) and each result is copied to every row it
+    answers, with `source` set to "dedup" on the copies.
+    """
     try:
         results = litellm.retrieve_batch(batch_id=batch_id)
         if results.status != "completed":
@@ -173,7 +287,7 @@ def retrieve_batch_results(
         output_file_id = results.output_file_id
         content = litellm.file_content(file_id=output_file_id)
 
-        parsed = []
+        records = []
         for line in content.text.strip().split("\n"):
             record = json.loads(line)
             custom_id = record.get("custom_id", "")
@@ -185,21 +299,41 @@ def retrieve_batch_results(
             response_body = record.get("response", {}).get("body", {})
             choices = response_body.get("choices", [])
             raw = choices[0]["message"]["content"].strip() if choices else ""
+            records.append((custom_id, row_idx, raw, response_body.get("usage", {})))
 
-            usage = response_body.get("usage", {})
+        # Every response is in hand, so match them all in one batch
+        matcher = get_matcher(categories)
+        raws = [raw for _, _, raw, _ in records]
+        if multi_label:
+            matches = [m for m, _ in matcher.match_multi_many(raws, delimiter)]
+        else:
+            matches = [m or raw for (m, _), raw in zip(matcher.match_many(raws), raws)]
 
-            if multi_label:
-                matched = fuzzy_match_multi_label(raw, categories, delimiter)
-            else:
-                matched = fuzzy_match_label(raw, categories) or raw
-
-            parsed.append({
+        parsed = []
+        for (custom_id, row_idx, raw, usage), matched in zip(records, matches):
+            entry = {
                 "row_index": row_idx,
                 "raw_response": raw,
                 "matched_label": matched,
                 "input_tokens": usage.get("prompt_tokens", 0),
                 "output_tokens": usage.get("completion_tokens", 0),
-            })
+                "source": "llm",
+            }
+            parsed.append(entry)
+
+        deduped = load_batch_record(batch_id).get("dedup_saved_requests")
+        if deduped and data is not None and prompt_template is not None:
+            by_custom_id = {
+                custom_id: entry
+                for (custom_id, _, _, _), entry in zip(records, parsed)
+            }
+            duplicates = iter_duplicate_rows(
+                data, prompt_template, categories, multi_label, delimiter,
+            )
+            for dup_idx, custom_id in duplicates:
+                entry = by_custom_id.get(custom_id)
+                if entry is not None:
+                    parsed.append({**entry, "row_index": dup_idx, "source": "dedup"})
 
         # Cleanup after successful retrieval
         update_batch_status(batch_id, "completed_and_retrieved")
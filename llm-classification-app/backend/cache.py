@@ -0,0 +1,151 @@
+"""Persistent on-disk cache of LLM responses.
+
+Responses are stored in a SQLite database (WAL mode, so concurrent readers
+don't block the writer) keyed by a hash of the litellm kwargs and the
+rendered messages.  Re-running the same prompt over the same data, even
+after a restart, is served from disk instead of paying for the call again.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+CACHE_DIR = Path(__file__).parent.parent / "response_cache"
+CACHE_FILENAME = "responses.sqlite"
+
+# Defaults applied by evict() when the cache is opened
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+
+def make_cache_key(litellm_kwargs: dict, messages: list[dict]) -> str:
+    """Stable hash of the request: model kwargs plus rendered messages."""
+    payload = json.dumps(
+        {"kwargs": litellm_kwargs, "messages": messages},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache, safe to share between threads."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                usage TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)"
+        )
+
+    def get(self, key: str) -> dict | None:
+        """Return {"content", "usage"} for a cached response, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, usage FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        return {"content": row[0], "usage": json.loads(row[1])}
+
+    def put(self, key: str, content: str, usage: dict):
+        usage_json = json.dumps(usage)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, content, usage_json, now, now, len(content) + len(usage_json)),
+            )
+
+    def evict(
+        self,
+        max_age_seconds: float | None = DEFAULT_MAX_AGE_SECONDS,
+        max_bytes: int | None = DEFAULT_MAX_BYTES,
+    ) -> int:
+        """Drop entries older than `max_age_seconds`, then least recently
+        used entries until the stored size is under `max_bytes`.
+
+        Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            if max_age_seconds is not None:
+                cur = self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (time.time() - max_age_seconds,),
+                )
+                removed += cur.rowcount
+            if max_bytes is not None:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()[0]
+                if total > max_bytes:
+                    # Walk entries oldest-access first, accumulating what to drop
+                    excess = total - max_bytes
+                    keys = []
+                    for key, size in self._conn.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed_at"
+                    ):
+                        if excess <= 0:
+                            break
+                        keys.append((key,))
+                        excess -= size
+                    self._conn.executemany(
+                        "DELETE FROM responses WHERE key = ?", keys
+                    )
+                    removed += len(keys)
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: ResponseCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide cache in CACHE_DIR, evicting stale entries on open."""
+    global _default_cache
+    with _default_cache_lock:
+        path = CACHE_DIR / CACHE_FILENAME
+        if _default_cache is None or _default_cache.path != path:
+            _default_cache = ResponseCache(path)
+            _default_cache.evict()
+        return _default_cache
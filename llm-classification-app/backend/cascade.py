@@ -0,0 +1,185 @@
+"""Cascade mode: a cheap model first, stronger models only for shaky rows.
+
+Every row goes to the first tier (e.g. Gemini Flash Lite).  Rows whose
+answer didn't match a category, only matched fuzzily, or came with a low
+logprob confidence are escalated to the next tier, and so on; the last
+tier's answers are kept as they are.  Per-tier stats record rows, wall
+time, request latency and cost, along with a projection of what sending
+every row to the last tier would have cost, so the cascade can be
+compared against a single large model.  The projection estimates input
+tokens over every row rather than scaling up the escalated rows, which
+are the harder and often longer ones.
+"""
+
+import time
+
+import pandas as pd
+
+from backend.classifier import (
+    ClassificationResult,
+    classify_rows,
+    estimate_tokens_from_sample,
+    summarize_results,
+)
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+
+# Fuzzy-matched answers scoring below this are escalated.  Matching itself
+# accepts scores from 60, so this catches answers just over that line.
+DEFAULT_MIN_MATCH_SCORE = 85.0
+# Answers the model gave less than this probability are escalated (only
+# for models that return logprobs)
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+
+def needs_escalation(
+    result: ClassificationResult,
+    categories: list[str],
+    min_match_score: float = DEFAULT_MIN_MATCH_SCORE,
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+) -> bool:
+    """True if a result is too uncertain to keep from a cheaper tier."""
+    labels = (
+        result.matched_label
+        if isinstance(result.matched_label, list)
+        else [result.matched_label]
+    )
+    if not labels or any(label not in categories for label in labels):
+        return True
+    if result.match_score is not None and result.match_score < min_match_score:
+        return True
+    return result.confidence is not None and result.confidence < min_confidence
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def _tier_stats(
+    config: ModelConfig,
+    results: list[ClassificationResult],
+    seconds: float,
+    escalated: int,
+) -> dict:
+    summary = summarize_results(results)
+    latencies = [r.latency_s for r in results if r.source in ("llm", "packed")]
+    cost = (
+        config.price.estimate_cost(
+            summary["billed_input_tokens"],
+            summary["billed_output_tokens"],
+            summary["billed_cached_input_tokens"],
+        )
+        if config.price
+        else 0
+    )
+    return {
+        "model": config.display_name,
+        "rows": len(results),
+        "escalated": escalated,
+        "seconds": seconds,
+        "rows_per_second": len(results) / seconds if seconds else 0.0,
+        "mean_latency_s": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p95_latency_s": _percentile(latencies, 95),
+        "cost": cost,
+        "summary": summary,
+    }
+
+
+def run_cascade(
+    df: pd.DataFrame,
+    tiers: list[ModelConfig],
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    max_rows: int | None = None,
+    min_match_score: float = DEFAULT_MIN_MATCH_SCORE,
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+    progress_callback=None,
+    **classify_kwargs,
+) -> dict:
+    """Classify rows with `tiers` of models, cheapest first.
+
+    Each tier is a normal classify_rows run over the rows still pending;
+    `classify_kwargs` (concurrency, use_cache, structured, ...) apply to
+    every tier.  `progress_callback(tier_index, current, total)` reports
+    progress within each tier.
+
+    Returns a dict with:
+        results: final results in row order
+        row_tiers: index of the tier that answered each row
+        tier_stats: per-tier rows, escalations, timing and cost
+        total_cost / total_seconds: for the whole cascade
+        single_model_cost: projected cost of sending every row to the last
+            tier, from input tokens estimated over all rows and the mean
+            output tokens per row (None without a price for that model)
+        single_model_seconds: projected time for the same, from the last
+            tier's measured throughput (None if no row reached it).  It is
+            measured on escalated rows only, so it leans pessimistic
+    """
+    if not tiers:
+        raise ValueError("A cascade needs at least one model")
+    if classify_kwargs.get("journal") is not None:
+        # Each tier numbers its subset of rows from 0, so one journal
+        # can't describe them all
+        raise ValueError("Checkpoint journals aren't supported in cascade mode")
+    rows = df.head(max_rows) if max_rows else df
+    results: list[ClassificationResult | None] = [None] * len(rows)
+    row_tiers = [0] * len(rows)
+    tier_stats = []
+    pending = list(range(len(rows)))
+
+    for tier_idx, config in enumerate(tiers):
+        if not pending:
+            break
+        last = tier_idx == len(tiers) - 1
+
+        def tier_progress(current, total, tier_idx=tier_idx):
+            if progress_callback:
+                progress_callback(tier_idx, current, total)
+
+        start = time.perf_counter()
+        tier_results = classify_rows(
+            rows.iloc[pending].reset_index(drop=True),
+            config, prompt_template, categories, multi_label, delimiter,
+            progress_callback=tier_progress,
+            **classify_kwargs,
+        )
+        seconds = time.perf_counter() - start
+
+        escalated = []
+        for row_idx, result in zip(pending, tier_results):
+            result.row_index = row_idx
+            results[row_idx] = result
+            row_tiers[row_idx] = tier_idx
+            if not last and needs_escalation(
+                result, categories, min_match_score, min_confidence
+            ):
+                escalated.append(row_idx)
+        tier_stats.append(_tier_stats(config, tier_results, seconds, len(escalated)))
+        pending = escalated
+
+    single_model_cost = single_model_seconds = None
+    if tiers[-1].price and len(rows):
+        tokens = estimate_tokens_from_sample(
+            rows, prompt_template, categories, tiers[-1].model_id
+        )
+        output_tokens = sum(r.output_tokens for r in results) / len(rows)
+        single_model_cost = tiers[-1].price.estimate_cost(
+            tokens["estimated_total_input_tokens"], output_tokens * len(rows)
+        )
+    if len(tier_stats) == len(tiers) and tier_stats[-1]["rows_per_second"]:
+        single_model_seconds = len(rows) / tier_stats[-1]["rows_per_second"]
+    return {
+        "results": results,
+        "row_tiers": row_tiers,
+        "tier_stats": tier_stats,
+        "total_cost": sum(t["cost"] for t in tier_stats),
+        "total_seconds": sum(t["seconds"] for t in tier_stats),
+        "single_model_cost": single_model_cost,
+        "single_model_seconds": single_model_seconds,
+    }
@@ -0,0 +1,152 @@
+"""Crash-safe checkpoint journal for long classification runs.
+
+Each finished row is appended to a JSONL journal as soon as it completes.
+The journal is keyed by the job (dataset fingerprint, prompt, categories
+and model config), so re-running the same job after a crash, disconnect or
+Streamlit rerun skips rows that are already paid for.
+"""
+
+import hashlib
+import json
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+import pandas as pd
+
+from backend.dataset import as_chunks
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+
+CHECKPOINT_DIR = Path(__file__).parent.parent / "checkpoints"
+# Bytes read at a time when looking back for a torn final line
+_TAIL_BLOCK = 64 * 1024
+
+
+def _ensure_checkpoint_dir():
+    CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def dataset_fingerprint(
+    data: pd.DataFrame | Iterable[pd.DataFrame], columns: list[str]
+) -> str:
+    """Hash the values of the columns a prompt uses, in row order.
+
+    `data` may be a DataFrame or an iterable of chunks; rows are hashed
+    individually, so the result doesn't depend on where chunks split.
+    """
+    digest = hashlib.sha256()
+    rows, cols = 0, list(columns)
+    for chunk in as_chunks(data):
+        cols = [c for c in columns if c in chunk.columns]
+        rows += len(chunk)
+        if cols:
+            row_hashes = pd.util.hash_pandas_object(chunk[cols], index=False)
+            digest.update(row_hashes.to_numpy().tobytes())
+    digest.update(json.dumps([rows, cols]).encode())
+    return digest.hexdigest()
+
+
+def job_key(
+    df: pd.DataFrame | Iterable[pd.DataFrame],
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    **options,
+) -> str:
+    """Identify a classification job; any change to its inputs is a new job."""
+    payload = {
+        "dataset": dataset_fingerprint(df, prompt_template.columns_used),
+        "prompt": hashlib.sha256(prompt_template.template.encode()).hexdigest(),
+        "categories": categories,
+        "model": model_config.to_litellm_kwargs(),
+        "multi_label": multi_label,
+        "delimiter": delimiter,
+        "options": options,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:24]
+
+
+class RunJournal:
+    """Append-only JSONL journal of finished rows for one job."""
+
+    def __init__(self, key: str, fsync: bool = False):
+        _ensure_checkpoint_dir()
+        self.key = key
+        self.path = CHECKPOINT_DIR / f"{key}.jsonl"
+        self.fsync = fsync
+        self.completed: dict[int, dict] = self._load()
+        self._file = None
+
+    @classmethod
+    def for_job(cls, df: pd.DataFrame | Iterable[pd.DataFrame],
+                model_config: ModelConfig,
+                prompt_template: PromptTemplate, categories: list[str],
+                multi_label: bool = False, delimiter: str = "|",
+                **options) -> "RunJournal":
+        return cls(job_key(
+            df, model_config, prompt_template, categories, multi_label,
+            delimiter, **options,
+        ))
+
+    def _load(self) -> dict[int, dict]:
+        """Read finished rows, ignoring a torn final line from a crash."""
+        completed = {}
+        if not self.path.exists():
+            return completed
+        with self.path.open() as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                completed[record["row_index"]] = record
+        return completed
+
+    def _drop_torn_tail(self):
+        """Truncate a partial final line left by a crash, so the next
+        record starts on a line of its own."""
+        if not self.path.exists():
+            return
+        with self.path.open("r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                start = max(0, pos - _TAIL_BLOCK)
+                f.seek(start)
+                block = f.read(pos - start)
+                if pos == end and block.endswith(b"\n"):
+                    return
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    f.truncate(start + newline + 1)
+                    return
+                pos = start
+            f.truncate(0)
+
+    def append(self, record: dict):
+        """Durably record one finished row."""
+        if self._file is None:
+            self._drop_torn_tail()
+            self._file = self.path.open("a")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.completed[record["row_index"]] = record
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Delete the journal, e.g. to force a fresh run."""
+        self.close()
+        self.completed = {}
+        if self.path.exists():
+            self.path.unlink()
@@ -1,15 +1,52 @@
 """Classification logic: single-label, multi-label, token counting."""
 
+import asyncio
 import json
-import time
-from dataclasses import dataclass
+import math
+import queue
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import TYPE_CHECKING
 
-import litellm
 import pandas as pd
 
-from backend.fuzzy_match import fuzzy_match_label, fuzzy_match_multi_label, find_safe_delimiter
+from backend.checkpoint import RunJournal
+from backend.dataset import iter_blocks, row_texts
+from backend.concurrency import (
+    AdaptiveConcurrency,
+    FixedConcurrency,
+    call_with_retries,
+    DEFAULT_MAX_RETRIES,
+)
+from backend.fuzzy_match import find_safe_delimiter, get_matcher
+from backend.llm import LLMReply, complete, acomplete, count_tokens_for_prompt
+from backend.sampling import mean_standard_error, sample_index, z_score
+from backend.tokens import estimate_row_tokens
 from backend.models import ModelConfig
-from backend.prompt import PromptTemplate
+from backend.packing import (
+    estimate_pack_size,
+    parse_packed_response,
+    render_packed_parts,
+    split_usage,
+)
+from backend.prompt import CompiledPrompt, PromptTemplate, build_messages, prompt_hash
+from backend.retrieval import LABEL_SLOT, CategoryIndex, fill_label_slot
+from backend.semantic_cache import SemanticCache
+from backend.structured import decode_structured, extract_json_labels, response_format
+from backend.label_codes import decode_label_codes, make_label_codes, saved_output_tokens
+
+if TYPE_CHECKING:
+    # backend.distill and backend.hierarchy import this module
+    from backend.distill import Distiller
+    from backend.hierarchy import CategoryTree
+
+
+# Number of requests kept in flight by the async engine when the caller
+# doesn't choose one.
+DEFAULT_CONCURRENCY = 8
 
 
 @dataclass
@@ -19,6 +56,129 @@ class ClassificationResult:
     matched_label: str | list[str]
     input_tokens: int
     output_tokens: int
+    # Where the result came from: "llm" (fresh call), "packed" (one of
+    # several rows answered by a single call), "cache" (on-disk response
+    # cache) or "dedup" (copied from an identical prompt this run)
+    source: str = "llm"
+    # Number of rows answered by the request that produced this result
+    pack_size: int = 1
+    # Part of input_tokens read from the provider's prompt cache
+    cached_input_tokens: int = 0
+    # True if the label was read from a schema-constrained reply rather
+    # than fuzzy-matched
+    schema_decoded: bool = False
+    # Output tokens saved by answering with label codes instead of names
+    code_saved_output_tokens: int = 0
+    # How closely the answer matched a category (0-100): 100 for exact,
+    # schema-decoded or code answers, the fuzzy score otherwise, and the
+    # weakest label's score for multi-label.  None if not measured.
+    match_score: float | None = None
+    # Seconds the provider took for the request that produced this result
+    # (rate-limiter waits excluded; 0 for cache hits)
+    latency_s: float = 0.0
+    # The model's probability for its answer (exp of the answer's summed
+    # token logprobs), for models that return logprobs; otherwise None
+    confidence: float | None = None
+    # If this row was retried alone after a billed packed request answered
+    # none of its rows: that pack's size and this row's share of its usage
+    # (not included in the token counts above)
+    failed_pack_size: int = 0
+    failed_pack_input_tokens: int = 0
+    failed_pack_output_tokens: int = 0
+    failed_pack_cached_input_tokens: int = 0
+
+
+def _fuzzy_match_reply(
+    raw: str, categories: list[str], multi_label: bool, delimiter: str
+) -> tuple[str | list[str], float]:
+    """Fuzzy-match free text, or each label of a JSON answer.
+
+    Returns the match and its score (the weakest label's, for multi-label).
+    """
+    matcher = get_matcher(categories)
+    json_labels = extract_json_labels(raw)
+    if multi_label:
+        if json_labels is None:
+            return matcher.match_multi(raw, delimiter)
+        scored = matcher.match_many(json_labels)
+        matched = list(dict.fromkeys(m for m, _ in scored if m))
+        return matched, min((score for _, score in scored), default=0.0)
+    text = json_labels[0] if json_labels else raw
+    match, score = matcher.match(text)
+    return match or raw, score
+
+
+def _result_from_reply(
+    reply: LLMReply,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    structured: bool = False,
+    label_codes: dict[str, str] | None = None,
+    model: str = "",
+) -> ClassificationResult:
+    """Build a ClassificationResult from an LLM reply.
+
+    With `label_codes` the answer holds codes (or a schema enum of codes),
+    which are mapped back to categories; category names are still
+    fuzzy-matched if the model ignored the codes.
+    """
+    raw = reply.content
+    options = list(label_codes) if label_codes else categories
+
+    matched = decode_structured(raw, options, multi_label) if structured else None
+    schema_decoded = matched is not None
+    saved = 0
+    score = 100.0
+    if label_codes:
+        matched = decode_label_codes(
+            raw if matched is None else delimiter.join(_as_list(matched)),
+            label_codes, multi_label, delimiter,
+        )
+        if matched is not None:
+            saved = saved_output_tokens(matched, label_codes, model)
+    if matched is None:
+        schema_decoded = False
+        matched, score = _fuzzy_match_reply(raw, categories, multi_label, delimiter)
+
+    return ClassificationResult(
+        row_index=0,
+        raw_response=raw,
+        matched_label=matched,
+        input_tokens=reply.input_tokens,
+        output_tokens=reply.output_tokens,
+        source="cache" if reply.from_cache else "llm",
+        cached_input_tokens=reply.cached_tokens,
+        schema_decoded=schema_decoded,
+        code_saved_output_tokens=saved,
+        match_score=score,
+        confidence=reply.probability,
+    )
+
+
+def _as_list(labels: str | list[str]) -> list[str]:
+    return labels if isinstance(labels, list) else [labels]
+
+
+def _structured_overrides(
+    categories: list[str], multi_label: bool, structured: bool,
+    label_codes: dict[str, str] | None = None,
+) -> dict:
+    if not structured:
+        return {}
+    options = list(label_codes) if label_codes else categories
+    return {"response_format": response_format(options, multi_label)}
+
+
+def _request_overrides(
+    model_config: ModelConfig, categories: list[str], multi_label: bool,
+    structured: bool, label_codes: dict[str, str] | None = None,
+) -> dict:
+    """litellm overrides for a single-row classification request."""
+    overrides = _structured_overrides(categories, multi_label, structured, label_codes)
+    if model_config.supports_logprobs():
+        overrides["logprobs"] = True
+    return overrides
 
 
 def classify_single_row(
@@ -27,30 +187,506 @@ def classify_single_row(
     categories: list[str],
     multi_label: bool = False,
     delimiter: str = "|",
+    use_cache: bool = True,
+    prefix: str = "",
+    structured: bool = False,
+    label_codes: dict[str, str] | None = None,
 ) -> ClassificationResult:
-    """Classify a single row using litellm."""
-    kwargs = model_config.to_litellm_kwargs()
+    """Classify a single row using litellm, consulting the response cache first.
 
-    response = litellm.completion(
-        messages=[{"role": "user", "content": prompt_text}],
-        **kwargs,
+    `prefix` is the static part of the prompt (see PromptTemplate.render_parts),
+    sent as a cacheable system message ahead of `prompt_text`.  With
+    `structured`, the answer is constrained to a JSON schema of the
+    categories and decoded directly; fuzzy matching is the fallback.
+    Pass the `label_codes` the prompt was rendered with to decode code answers.
+
+    Logprobs are requested where the model supports them, giving the
+    result a `confidence`; `match_score` records how well the answer
+    matched a category.
+    """
+    reply = complete(
+        model_config, build_messages(prompt_text, prefix), use_cache=use_cache,
+        **_request_overrides(
+            model_config, categories, multi_label, structured, label_codes
+        ),
+    )
+    result = _result_from_reply(
+        reply, categories, multi_label, delimiter, structured, label_codes,
+        model_config.to_litellm_kwargs()["model"],
     )
+    result.latency_s = reply.latency_s
+    return result
 
-    raw = response.choices[0].message.content.strip()
-    usage = response.usage
 
-    if multi_label:
-        matched = fuzzy_match_multi_label(raw, categories, delimiter)
-    else:
-        matched = fuzzy_match_label(raw, categories) or raw
+async def aclassify_single_row(
+    model_config: ModelConfig,
+    prompt_text: str,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    use_cache: bool = True,
+    prefix: str = "",
+    structured: bool = False,
+    label_codes: dict[str, str] | None = None,
+) -> ClassificationResult:
+    """Async variant of classify_single_row using litellm.acompletion."""
+    reply = await acomplete(
+        model_config, build_messages(prompt_text, prefix), use_cache=use_cache,
+        **_request_overrides(
+            model_config, categories, multi_label, structured, label_codes
+        ),
+    )
+    result = _result_from_reply(
+        reply, categories, multi_label, delimiter, structured, label_codes,
+        model_config.to_litellm_kwargs()["model"],
+    )
+    result.latency_s = reply.latency_s
+    return result
 
-    return ClassificationResult(
-        row_index=0,
-        raw_response=raw,
-        matched_label=matched,
-        input_tokens=usage.prompt_tokens if usage else 0,
-        output_tokens=usage.completion_tokens if usage else 0,
+
+async def aclassify_packed_rows(
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    items: list[tuple[int, dict]],
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    use_cache: bool = True,
+) -> tuple[dict[int, ClassificationResult], LLMReply | None]:
+    """Classify several rows in one request.
+
+    `items` are (row_index, row) pairs.  Returns results keyed by row index
+    for the rows the model answered with a valid label; the rest are
+    missing and should be retried individually.  The call's token usage is
+    split across the answered rows; if there are none, the reply is
+    returned as well so the billed call isn't lost, else None.
+    """
+    prefix, items_text = render_packed_parts(
+        prompt_template,
+        [(str(idx), row) for idx, row in items],
+        categories, multi_label, delimiter,
+    )
+    reply = await acomplete(
+        model_config, build_messages(items_text, prefix), use_cache=use_cache
+    )
+    answers = parse_packed_response(
+        reply.content, [str(idx) for idx, _ in items],
+        categories, multi_label, delimiter,
+    )
+    answered = [idx for idx, _ in items if str(idx) in answers]
+    if not answered:
+        return {}, (None if reply.from_cache else reply)
+
+    input_shares = split_usage(reply.input_tokens, len(answered))
+    output_shares = split_usage(reply.output_tokens, len(answered))
+    cached_shares = split_usage(reply.cached_tokens, len(answered))
+    results = {}
+    for idx, in_tok, out_tok, cached_tok in zip(
+        answered, input_shares, output_shares, cached_shares
+    ):
+        raw_label, matched, score = answers[str(idx)]
+        results[idx] = ClassificationResult(
+            row_index=idx,
+            raw_response=raw_label,
+            matched_label=matched,
+            input_tokens=in_tok,
+            output_tokens=out_tok,
+            source="cache" if reply.from_cache else "packed",
+            pack_size=len(answered),
+            cached_input_tokens=cached_tok,
+            match_score=score,
+            latency_s=reply.latency_s,
+        )
+    return results, None
+
+
+def _network_latency(answer) -> float | None:
+    """Provider latency of a single or packed answer, or None if no request
+    reached the provider (cache hits), for the concurrency controller."""
+    results = answer.values() if isinstance(answer, dict) else [answer]
+    latencies = [r.latency_s for r in results if r.source in ("llm", "packed")]
+    return max(latencies) if latencies else None
+
+
+def _packed_latency(answer) -> float | None:
+    results, failed = answer
+    return failed.latency_s if failed is not None else _network_latency(results)
+
+
+def _row_text(row: dict, fields: list[str]) -> str:
+    """The prompt column values of a row, for near-duplicate matching."""
+    return " ".join(str(row.get(col, "")) for col in fields)
+
+
+def _matched_category(result: ClassificationResult, categories: list[str]) -> bool:
+    labels = _as_list(result.matched_label)
+    return bool(labels) and all(label in categories for label in labels)
+
+
+async def _iter_prompts(
+    data: pd.DataFrame | Iterable[pd.DataFrame],
+    compiled: CompiledPrompt,
+    max_rows: int | None = None,
+    with_rows: bool = False,
+    shortlist: Callable[[list[str]], Awaitable[list[list[str]]]] | None = None,
+) -> AsyncIterator[tuple[int, dict | None, tuple[str, str]]]:
+    """(row index, row dict, (prefix, suffix)) for each row.
+
+    Prompts are rendered a block of rows at a time, column-wise; row dicts
+    are only built if `with_rows` (packed requests need them).  With
+    `shortlist`, `compiled` holds LABEL_SLOT in place of the categories,
+    which is filled with the categories `shortlist` retrieves for each
+    row's prompt column text.
+    """
+    for start, block in iter_blocks(data, max_rows):
+        prefix, suffixes = compiled.render_frame_parts(block)
+        if shortlist is not None:
+            shortlists = await shortlist(row_texts(block, compiled.fields))
+            parts = fill_label_slot(prefix, suffixes, shortlists)
+        else:
+            parts = [(prefix, suffix) for suffix in suffixes]
+        rows = block.to_dict("records") if with_rows else [None] * len(block)
+        for offset, (row, part) in enumerate(zip(rows, parts)):
+            yield start + offset, row, part
+
+
+async def _arun_engine(
+    data: pd.DataFrame | Iterable[pd.DataFrame],
+    total: int,
+    on_result: Callable[[ClassificationResult], None],
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    progress_callback=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    controller: AdaptiveConcurrency | None = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    use_cache: bool = True,
+    dedup: bool = True,
+    pack_size: int = 1,
+    journal: RunJournal | None = None,
+    should_stop: Callable[[], bool] | None = None,
+    structured: bool = False,
+    use_label_codes: bool = False,
+    max_rows: int | None = None,
+    retrieval: CategoryIndex | None = None,
+    semantic_cache: SemanticCache | None = None,
+    category_tree: "CategoryTree | None" = None,
+    local_model: "Distiller | None" = None,
+):
+    """Core async engine: classify the rows of `data` (a DataFrame or
+    chunks), reporting each result to `on_result` as soon as it finishes
+    (in completion order).  `total` is only used for progress and sizing;
+    0 means unknown.
+
+    Nothing but the dedup index is retained, so callers decide whether to
+    collect results (aclassify_rows) or stream them (iter_classify).
+
+    With `category_tree`, rows are classified into its groups and each
+    answer is refined among the group's children straight away, so a
+    row's result is final when it is reported.
+
+    With `local_model`, each row is offered to its `predict` before any
+    request, and every other result is passed to its `learn` with the
+    row's prompt column text, so it trains on the run as it goes.
+    """
+    completed = 0
+    if retrieval is not None and (pack_size > 1 or use_label_codes):
+        # Packs share one category block and codes are numbered over the
+        # full list; shortlists differ per row
+        raise ValueError(
+            "Category retrieval can't be combined with row packing or label codes"
+        )
+    if category_tree is not None:
+        if multi_label or pack_size > 1 or retrieval is not None:
+            raise ValueError(
+                "Category trees are single-label and can't be combined with "
+                "row packing or category retrieval"
+            )
+        categories = list(category_tree.groups)
+        child_prompts: dict[str, tuple[CompiledPrompt, dict[str, str] | None]] = {}
+    label_codes = make_label_codes(categories) if use_label_codes else None
+    compiled = prompt_template.compile(
+        [LABEL_SLOT] if retrieval is not None else categories,
+        multi_label, delimiter, label_codes,
+    )
+    if controller is None:
+        controller = FixedConcurrency(concurrency)
+    pending = _iter_prompts(
+        data, compiled, max_rows,
+        with_rows=(
+            pack_size > 1 or semantic_cache is not None or category_tree is not None
+            or local_model is not None
+        ),
+        shortlist=(
+            (lambda texts: retrieval.ashortlist(texts, controller, max_retries))
+            if retrieval is not None else None
+        ),
+    )
+    # Near-duplicate matching and the local model work on the row text
+    needs_text = semantic_cache is not None or local_model is not None
+    # Held while pulling rows, so each is handed to exactly one worker even
+    # when the next block's shortlists are being fetched
+    pulling = asyncio.Lock()
+    # prompt hash -> finished result, or the list of duplicate rows still
+    # waiting on the in-flight request for that prompt
+    groups: dict[str, ClassificationResult | list[int]] = {}
+
+    def finish(
+        result: ClassificationResult, record: bool = True, text: str | None = None
+    ):
+        """Report a result; `text` is its row's prompt column text, which
+        `local_model` learns from."""
+        nonlocal completed
+        if journal is not None and record:
+            journal.append(asdict(result))
+        if local_model is not None and text is not None:
+            local_model.learn(text, result)
+        on_result(result)
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, total)
+
+    async def take_pack() -> list[tuple[int, dict | None, tuple[str, str], str | None]]:
+        """Pull up to `pack_size` unique rows, settling duplicates on the way."""
+        pack = []
+        async with pulling:
+            async for idx, row_dict, (prefix, suffix) in pending:
+                text = _row_text(row_dict, compiled.fields) if needs_text else None
+                if journal is not None and idx in journal.completed:
+                    finish(
+                        ClassificationResult(**journal.completed[idx]),
+                        record=False, text=text,
+                    )
+                    continue
+                key = prompt_hash(prefix + suffix) if dedup else None
+                if key is not None and key in groups:
+                    group = groups[key]
+                    if isinstance(group, list):
+                        group.append(idx)
+                    else:
+                        finish(replace(group, row_index=idx, source="dedup"), text=text)
+                    continue
+                if semantic_cache is not None:
+                    hit = semantic_cache.lookup(text)
+                    if hit is not None:
+                        result = replace(hit[0], row_index=idx, source="semantic")
+                        if key is not None:
+                            groups[key] = result
+                        finish(result, text=text)
+                        continue
+                if local_model is not None:
+                    result = local_model.predict(idx, text)
+                    if result is not None:
+                        if key is not None:
+                            groups[key] = result
+                        finish(result)
+                        continue
+                if key is not None:
+                    groups[key] = []
+                pack.append((idx, row_dict, (prefix, suffix), key))
+                if len(pack) >= pack_size:
+                    break
+        return pack
+
+    async def refine(result: ClassificationResult, row_dict: dict) -> ClassificationResult:
+        """Classify a row among its group's children and combine the answers."""
+        group = result.matched_label
+        children = category_tree.groups.get(group) if isinstance(group, str) else None
+        if not children:
+            return result
+        if group not in child_prompts:
+            codes = make_label_codes(children) if use_label_codes else None
+            child_prompts[group] = (
+                prompt_template.compile(children, False, delimiter, codes), codes
+            )
+        child_compiled, codes = child_prompts[group]
+        prefix, suffix = child_compiled.render_parts(row_dict)
+        second = await call_with_retries(
+            lambda: aclassify_single_row(
+                model_config, suffix, children, False, delimiter, use_cache,
+                prefix=prefix, structured=structured, label_codes=codes,
+            ),
+            controller,
+            max_retries,
+            latency_of=_network_latency,
+        )
+        return category_tree.combine(result, second, group)
+
+    async def worker():
+        while not (should_stop and should_stop()) and (pack := await take_pack()):
+            answered: dict[int, ClassificationResult] = {}
+            failed_shares: dict[int, tuple[int, int, int]] = {}
+            if len(pack) > 1:
+                answered, failed = await call_with_retries(
+                    lambda: aclassify_packed_rows(
+                        model_config, prompt_template,
+                        [(idx, row_dict) for idx, row_dict, _, _ in pack],
+                        categories, multi_label, delimiter, use_cache,
+                    ),
+                    controller,
+                    max_retries,
+                    latency_of=_packed_latency,
+                )
+                if failed is not None:
+                    # Every row is retried alone; each carries a share of
+                    # the pack's usage so the tally still counts it
+                    failed_shares = dict(zip(
+                        (idx for idx, _, _, _ in pack),
+                        zip(
+                            split_usage(failed.input_tokens, len(pack)),
+                            split_usage(failed.output_tokens, len(pack)),
+                            split_usage(failed.cached_tokens, len(pack)),
+                        ),
+                    ))
+
+            for idx, row_dict, (prefix, suffix), key in pack:
+                result = answered.get(idx)
+                if result is None:
+                    result = await call_with_retries(
+                        lambda: aclassify_single_row(
+                            model_config, suffix, categories, multi_label,
+                            delimiter, use_cache, prefix=prefix,
+                            structured=structured, label_codes=label_codes,
+                        ),
+                        controller,
+                        max_retries,
+                        latency_of=_network_latency,
+                    )
+                if category_tree is not None:
+                    result = await refine(result, row_dict)
+                result.row_index = idx
+                if idx in failed_shares:
+                    result.failed_pack_size = len(pack)
+                    (
+                        result.failed_pack_input_tokens,
+                        result.failed_pack_output_tokens,
+                        result.failed_pack_cached_input_tokens,
+                    ) = failed_shares[idx]
+                text = _row_text(row_dict, compiled.fields) if needs_text else None
+                if semantic_cache is not None and _matched_category(result, categories):
+                    semantic_cache.add(text, result)
+                finish(result, text=text)
+
+                if key is not None:
+                    # Duplicates share the prompt, so also the row text
+                    for dup_idx in groups[key]:
+                        finish(replace(result, row_index=dup_idx, source="dedup"), text=text)
+                    groups[key] = result
+
+    num_workers = max(1, min(controller.max_limit, total or controller.max_limit))
+    try:
+        await asyncio.gather(*(worker() for _ in range(num_workers)))
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+_END_OF_RUN = object()
+
+
+async def aclassify_rows(
+    df: pd.DataFrame,
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    max_rows: int | None = None,
+    progress_callback=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    controller: AdaptiveConcurrency | None = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    use_cache: bool = True,
+    dedup: bool = True,
+    pack_size: int = 1,
+    journal: RunJournal | None = None,
+    structured: bool = False,
+    use_label_codes: bool = False,
+    retrieval: CategoryIndex | None = None,
+    semantic_cache: SemanticCache | None = None,
+    category_tree: "CategoryTree | None" = None,
+    local_model: "Distiller | None" = None,
+) -> list[ClassificationResult]:
+    """Classify rows concurrently with at most `concurrency` requests in flight.
+
+    A fixed pool of workers pulls rows from a shared iterator, so memory
+    stays proportional to `concurrency` rather than the number of rows.
+    Results are returned in row order; `progress_callback(current, total)`
+    is called as each row completes.
+
+    If `controller` is given it replaces the static limit: the window
+    adapts to latency and 429/503s (up to `controller.max_limit`).
+    Overloaded requests are retried with jittered backoff either way.
+
+    With `dedup`, rows whose rendered prompts are identical share one
+    request: the first row is sent and the others receive a copy of its
+    result with `source="dedup"`.
+
+    With `pack_size` > 1, each request carries up to that many (unique) rows
+    and asks for a JSON array of labels; rows the model skips or mangles
+    are retried one at a time.
+
+    With a `journal`, rows it already holds are returned without any
+    request and every new result is appended to it as soon as it finishes.
+
+    With `retrieval` (a CategoryIndex), each row's prompt lists only the
+    categories most similar to its prompt column text; answers are still
+    matched against all `categories`.
+
+    With a `semantic_cache`, a row whose prompt column text is a near
+    duplicate of an already labelled row reuses that row's result
+    (`source="semantic"`) instead of making a request.
+
+    With a `category_tree`, each row is classified into the tree's groups
+    and then among its group's children (see backend/hierarchy.py);
+    `categories` is ignored and labels are "Parent > Child" paths.
+
+    With a `local_model` (a Distiller), rows it is confident about are
+    labelled locally (`source="local"`) and it learns from the others.
+    """
+    rows_to_process = df.head(max_rows) if max_rows else df
+    total = len(rows_to_process)
+    results: list[ClassificationResult | None] = [None] * total
+
+    def collect(result: ClassificationResult):
+        results[result.row_index] = result
+
+    await _arun_engine(
+        rows_to_process, total, collect,
+        model_config, prompt_template, categories, multi_label, delimiter,
+        progress_callback=progress_callback,
+        concurrency=concurrency,
+        controller=controller,
+        max_retries=max_retries,
+        use_cache=use_cache,
+        dedup=dedup,
+        pack_size=pack_size,
+        journal=journal,
+        structured=structured,
+        use_label_codes=use_label_codes,
+        retrieval=retrieval,
+        semantic_cache=semantic_cache,
+        category_tree=category_tree,
+        local_model=local_model,
     )
+    return results
+
+
+def _run_sync(coro):
+    """Run a coroutine to completion from synchronous code.
+
+    Uses asyncio.run() normally; if an event loop is already running in
+    this thread (e.g. inside Jupyter), runs it on a helper thread instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
 
 
 def classify_rows(
@@ -62,9 +698,25 @@ def classify_rows(
     delimiter: str = "|",
     max_rows: int | None = None,
     progress_callback=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    controller: AdaptiveConcurrency | None = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    use_cache: bool = True,
+    dedup: bool = True,
+    pack_size: int | None = 1,
+    journal: RunJournal | None = None,
+    structured: bool = False,
+    use_label_codes: bool = False,
+    retrieval: CategoryIndex | None = None,
+    semantic_cache: SemanticCache | None = None,
+    category_tree: "CategoryTree | None" = None,
+    local_model: "Distiller | None" = None,
 ) -> list[ClassificationResult]:
     """Classify multiple rows with progress tracking.
 
+    Runs the async engine (`aclassify_rows`) to completion, keeping up to
+    `concurrency` requests in flight (or as many as `controller` allows).
+
     Args:
         df: DataFrame to classify
         model_config: Model configuration
@@ -74,39 +726,248 @@ def classify_rows(
         delimiter: Delimiter for multi-label output
         max_rows: Limit number of rows (for testing)
         progress_callback: Callable(current, total) for progress updates
+        concurrency: Maximum number of concurrent requests
+        controller: Optional AIMD controller that adapts the in-flight window
+        max_retries: Retries per row on 429/503 responses
+        use_cache: Serve repeated prompts from the on-disk response cache
+        dedup: Send one request per unique rendered prompt
+        pack_size: Rows per request (1 = no packing, None = choose from the
+            model's context window and measured token counts)
+        journal: Checkpoint journal; finished rows are skipped and new
+            results appended as they complete (see RunJournal.for_job)
+        structured: Constrain answers to a JSON schema of the categories
+            and decode them directly (packed requests stay free-form JSON)
+        use_label_codes: List categories as codes (A1, A2, ...) and ask for
+            codes back, decoded to category names (single-row requests)
+        retrieval: CategoryIndex whose top-k categories per row replace the
+            full list in `{label_options}` (not with packing or label codes)
+        semantic_cache: SemanticCache reusing results for near-duplicate
+            rows (see backend/semantic_cache.py); its stats() give the hit rate
+        category_tree: CategoryTree to classify into its groups, then among
+            the chosen group's children, instead of `categories`
+            (single-label, not with packing or retrieval)
+        local_model: Distiller answering the rows it is confident about
+            and learning from the rest (see backend/distill.py)
     """
-    rows_to_process = df.head(max_rows) if max_rows else df
-    total = len(rows_to_process)
-    results = []
-
-    for idx, (_, row) in enumerate(rows_to_process.iterrows()):
-        prompt_text = prompt_template.render(
-            row.to_dict(), categories, multi_label, delimiter
+    if pack_size is None:
+        pack_size = estimate_pack_size(
+            df, model_config, prompt_template, categories, multi_label, delimiter
+        )
+    return _run_sync(
+        aclassify_rows(
+            df=df,
+            model_config=model_config,
+            prompt_template=prompt_template,
+            categories=categories,
+            multi_label=multi_label,
+            delimiter=delimiter,
+            max_rows=max_rows,
+            progress_callback=progress_callback,
+            concurrency=concurrency,
+            controller=controller,
+            max_retries=max_retries,
+            use_cache=use_cache,
+            dedup=dedup,
+            pack_size=pack_size,
+            journal=journal,
+            structured=structured,
+            use_label_codes=use_label_codes,
+            retrieval=retrieval,
+            semantic_cache=semantic_cache,
+            category_tree=category_tree,
+            local_model=local_model,
         )
+    )
+
+
+def iter_classify(
+    df: pd.DataFrame | Iterable[pd.DataFrame],
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    max_rows: int | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    controller: AdaptiveConcurrency | None = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    use_cache: bool = True,
+    dedup: bool = True,
+    pack_size: int | None = 1,
+    journal: RunJournal | None = None,
+    structured: bool = False,
+    use_label_codes: bool = False,
+    retrieval: CategoryIndex | None = None,
+    semantic_cache: SemanticCache | None = None,
+    category_tree: "CategoryTree | None" = None,
+    local_model: "Distiller | None" = None,
+    buffer_size: int = 1000,
+    total_rows: int | None = None,
+) -> Iterator[ClassificationResult]:
+    """Yield results as they finish, in completion order (not row order).
+
+    Takes the same options as classify_rows, but nothing is accumulated:
+    the engine runs on a background thread and hands results over through
+    a queue of `buffer_size`.  If the consumer falls behind, the engine
+    pauses; if the consumer stops iterating, no new rows are started.
+    Errors from the engine are re-raised in the consumer.
 
-        result = classify_single_row(
-            model_config, prompt_text, categories, multi_label, delimiter
+    `df` may also be an iterable of DataFrame chunks (e.g.
+    `CsvDataset.chunks()`), read lazily; rows are numbered across chunks
+    and `total_rows`, if known, sizes the worker pool.
+    """
+    if isinstance(df, pd.DataFrame):
+        total = min(len(df), max_rows) if max_rows else len(df)
+        sample = df
+    else:
+        total = total_rows or 0
+        sample = None
+    if pack_size is None:
+        if sample is None:
+            # Size packs from the first chunk, then put it back
+            chunks = iter(df)
+            sample = next(chunks, pd.DataFrame())
+            df = chain([sample], chunks)
+        pack_size = estimate_pack_size(
+            sample, model_config, prompt_template, categories, multi_label, delimiter
         )
-        result.row_index = idx
+    handoff: queue.Queue = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
 
-        results.append(result)
+    def put(item):
+        # Block while the queue is full, unless the consumer has gone away
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
 
-        if progress_callback:
-            progress_callback(idx + 1, total)
+    def run():
+        try:
+            asyncio.run(_arun_engine(
+                df, total, put,
+                model_config, prompt_template, categories, multi_label, delimiter,
+                concurrency=concurrency,
+                controller=controller,
+                max_retries=max_retries,
+                use_cache=use_cache,
+                dedup=dedup,
+                pack_size=pack_size,
+                journal=journal,
+                structured=structured,
+                use_label_codes=use_label_codes,
+                retrieval=retrieval,
+                semantic_cache=semantic_cache,
+                category_tree=category_tree,
+                local_model=local_model,
+                should_stop=stop.is_set,
+                max_rows=max_rows,
+            ))
+        except BaseException as e:
+            put(e)
+        else:
+            put(_END_OF_RUN)
+
+    thread = threading.Thread(target=run, name="iter_classify", daemon=True)
+    thread.start()
+    try:
+        while (item := handoff.get()) is not _END_OF_RUN:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
 
-    return results
 
+class ResultTally:
+    """Running totals behind summarize_results, for streamed runs that
+    don't keep their results around."""
 
-def count_tokens_for_prompt(prompt_text: str, model_id: str) -> int:
-    """Estimate token count for a prompt using litellm.
+    def __init__(self):
+        self.rows = 0
+        self.packed_rows = 0
+        self.cache_hits = 0
+        self.dedup_rows = 0
+        self.semantic_hits = 0
+        self.cluster_rows = 0
+        self.local_rows = 0
+        self.schema_decoded_rows = 0
+        self.billed_input_tokens = 0
+        self.billed_output_tokens = 0
+        self.billed_cached_input_tokens = 0
+        self.code_saved_output_tokens = 0
+        self.dedup_saved_input_tokens = 0
+        self.dedup_saved_output_tokens = 0
+        # A packed call is shared by the pack_size rows it answered
+        self._api_calls = 0.0
 
-    Falls back to character-based estimation (~4 chars/token) if
-    litellm token counting fails (e.g., unsupported model, missing tokenizer).
+    def add(self, result: ClassificationResult):
+        self.rows += 1
+        self.schema_decoded_rows += result.schema_decoded
+        if result.source in ("llm", "packed"):
+            self._api_calls += 1 / result.pack_size
+            self.billed_input_tokens += result.input_tokens
+            self.billed_output_tokens += result.output_tokens
+            self.billed_cached_input_tokens += result.cached_input_tokens
+            self.code_saved_output_tokens += result.code_saved_output_tokens
+        if result.failed_pack_size and result.source in ("llm", "packed", "cache"):
+            # Copies (dedup, semantic, cluster) don't repeat the failed call
+            self._api_calls += 1 / result.failed_pack_size
+            self.billed_input_tokens += result.failed_pack_input_tokens
+            self.billed_output_tokens += result.failed_pack_output_tokens
+            self.billed_cached_input_tokens += result.failed_pack_cached_input_tokens
+        if result.source == "packed":
+            self.packed_rows += 1
+        elif result.source == "cache":
+            self.cache_hits += 1
+        elif result.source == "dedup":
+            self.dedup_rows += 1
+            self.dedup_saved_input_tokens += result.input_tokens
+            self.dedup_saved_output_tokens += result.output_tokens
+        elif result.source == "semantic":
+            self.semantic_hits += 1
+        elif result.source == "cluster":
+            self.cluster_rows += 1
+        elif result.source == "local":
+            self.local_rows += 1
+
+    def summary(self) -> dict:
+        return {
+            "rows": self.rows,
+            "api_calls": round(self._api_calls),
+            "packed_rows": self.packed_rows,
+            "cache_hits": self.cache_hits,
+            "dedup_rows": self.dedup_rows,
+            "schema_decoded_rows": self.schema_decoded_rows,
+            "billed_input_tokens": self.billed_input_tokens,
+            "billed_output_tokens": self.billed_output_tokens,
+            "billed_cached_input_tokens": self.billed_cached_input_tokens,
+            "code_saved_output_tokens": self.code_saved_output_tokens,
+            "dedup_saved_calls": self.dedup_rows,
+            "dedup_saved_input_tokens": self.dedup_saved_input_tokens,
+            "dedup_saved_output_tokens": self.dedup_saved_output_tokens,
+            "semantic_hits": self.semantic_hits,
+            "cluster_rows": self.cluster_rows,
+            "local_rows": self.local_rows,
+        }
+
+
+def summarize_results(results: Iterable[ClassificationResult]) -> dict:
+    """Summarise where a run's results came from and what it was billed.
+
+    Token fields on "cache", "dedup", "semantic" and "cluster" results
+    describe what the row would have cost; only "llm" and "packed" results
+    were billed, plus the failed-pack shares rows carry after a packed
+    request answered none of them.
+    `billed_cached_input_tokens` is the part of the billed input that the
+    provider served from its prompt cache (at the cached-input rate).
     """
-    try:
-        return litellm.token_counter(model=model_id, text=prompt_text)
-    except Exception:
-        return len(prompt_text) // 4
+    tally = ResultTally()
+    for result in results:
+        tally.add(result)
+    return tally.summary()
 
 
 def estimate_tokens_from_sample(
@@ -114,26 +975,116 @@ def estimate_tokens_from_sample(
     prompt_template: PromptTemplate,
     categories: list[str],
     model_id: str,
-    sample_size: int = 5,
+    sample_size: int = 30,
+    method: str = "stratified",
+    total_rows: int | None = None,
+    confidence: float = 0.95,
+    seed: int = 0,
 ) -> dict:
-    """Estimate average token counts from a sample of rows."""
-    sample = df.head(min(sample_size, len(df)))
-    token_counts = []
+    """Estimate input tokens per row: mean, p95 and a confidence interval.
+
+    Every row of `df` gets a fast length-based estimate (backend.tokens).
+    A `sample_size` sample drawn by `method` ("stratified" by length,
+    "random" or "head") is tokenized exactly, and the ratio of exact to
+    estimated tokens corrects every row.  The interval on the mean combines
+    the uncertainty in that correction with, when `df` is only a sample of
+    `total_rows`, the sampling error of the mean itself.
+
+    `avg_prefix_tokens` is the static prompt prefix (instructions and
+    categories), the part a provider prompt cache can serve.
+    """
+    model = "vertex_ai/" + model_id
+    total = total_rows or len(df)
+    estimates, prefix_tokens = estimate_row_tokens(
+        df, prompt_template, categories, model
+    )
+    estimates = estimates.reset_index(drop=True)
+    if estimates.empty:
+        return {
+            "avg_input_tokens": 0, "p95_input_tokens": 0,
+            "input_tokens_ci": (0, 0), "avg_prefix_tokens": prefix_tokens,
+            "sample_counts": [], "sample_method": method,
+            "total_rows": total, "estimated_total_input_tokens": 0,
+        }
 
-    for _, row in sample.iterrows():
-        prompt_text = prompt_template.render(row.to_dict(), categories)
-        tokens = count_tokens_for_prompt(prompt_text, "vertex_ai/" + model_id)
-        token_counts.append(tokens)
+    idx = sample_index(estimates, sample_size, method, seed=seed)
+    prompts = prompt_template.compile(categories).render_frame(df.iloc[idx])
+    exact = pd.Series(
+        [count_tokens_for_prompt(prompt, model) for prompt in prompts],
+        index=idx,
+        dtype=float,
+    )
+    sampled = estimates[idx].clip(lower=1)
+    correction = exact.sum() / sampled.sum()
+    tokens = estimates * correction
 
-    avg_input = sum(token_counts) / len(token_counts) if token_counts else 0
+    avg_input = float(tokens.mean())
+    ratio_se = mean_standard_error(exact / sampled, len(estimates))
+    rows_se = mean_standard_error(tokens, total)
+    half_width = z_score(confidence) * math.hypot(
+        float(estimates.mean()) * ratio_se, rows_se
+    )
     return {
         "avg_input_tokens": avg_input,
-        "sample_counts": token_counts,
-        "total_rows": len(df),
-        "estimated_total_input_tokens": avg_input * len(df),
+        "p95_input_tokens": float(tokens.quantile(0.95)),
+        "input_tokens_ci": (max(0.0, avg_input - half_width), avg_input + half_width),
+        "avg_prefix_tokens": prefix_tokens,
+        "sample_counts": exact.astype(int).tolist(),
+        "sample_method": method,
+        "total_rows": total,
+        "estimated_total_input_tokens": avg_input * total,
     }
 
 
+def format_label(
+    result: ClassificationResult, multi_label: bool = False, delimiter: str = "|"
+) -> str | None:
+    """The matched label as written to output: multi-labels joined by `delimiter`."""
+    if multi_label and isinstance(result.matched_label, list):
+        return delimiter.join(result.matched_label)
+    return result.matched_label
+
+
+def results_table(
+    results: Iterable[ClassificationResult | None],
+    num_rows: int,
+    column_name: str = "classification",
+    multi_label: bool = False,
+    delimiter: str = "|",
+    index: pd.Index | None = None,
+) -> pd.DataFrame:
+    """Results as a table of their own, one row per row position.
+
+    Row `i` holds the result whose `row_index` is `i` (empty if there is
+    none), so the table lines up with the source by position.  Pass the
+    source's `index` to give the table the same labels, e.g. for
+    `pd.concat([df, table], axis=1)`; the source frame itself is untouched.
+    """
+    labels = [None] * num_rows
+    raw = [None] * num_rows
+    scores = [float("nan")] * num_rows
+    confidence = [float("nan")] * num_rows
+    for result in results:
+        if result is None or not 0 <= result.row_index < num_rows:
+            continue
+        i = result.row_index
+        labels[i] = format_label(result, multi_label, delimiter)
+        raw[i] = result.raw_response
+        if result.match_score is not None:
+            scores[i] = result.match_score
+        if result.confidence is not None:
+            confidence[i] = result.confidence
+    return pd.DataFrame(
+        {
+            column_name: labels,
+            "raw_response": raw,
+            "match_score": scores,
+            "confidence": confidence,
+        },
+        index=index if index is not None else pd.RangeIndex(num_rows),
+    )
+
+
 def apply_results_to_dataframe(
     df: pd.DataFrame,
     results: list[ClassificationResult],
@@ -141,19 +1092,16 @@ def apply_results_to_dataframe(
     multi_label: bool = False,
     delimiter: str = "|",
 ) -> pd.DataFrame:
-    """Apply classification results to a copy of the DataFrame."""
-    df_out = df.copy()
-    df_out[column_name] = None
-    df_out["raw_response"] = None
-
-    for result in results:
-        if result.row_index < len(df_out):
-            if multi_label and isinstance(result.matched_label, list):
-                df_out.at[result.row_index, column_name] = delimiter.join(
-                    result.matched_label
-                )
-            else:
-                df_out.at[result.row_index, column_name] = result.matched_label
-            df_out.at[result.row_index, "raw_response"] = result.raw_response
+    """Return `df` with the results attached as new columns.
 
+    Adds `column_name`, `raw_response`, `match_score` and `confidence`
+    (the last two are empty where they weren't measured).  Results are
+    matched to rows by position (`row_index`), whatever `df`'s index is.
+    The columns are built in one pass and added to a shallow copy, so the
+    source data isn't duplicated; use results_table to keep them apart.
+    """
+    table = results_table(results, len(df), column_name, multi_label, delimiter)
+    df_out = df.copy(deep=False)
+    for col in table.columns:
+        df_out[col] = table[col].to_numpy()
     return df_out
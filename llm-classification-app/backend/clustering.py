@@ -0,0 +1,277 @@
+"""Cluster near-duplicate rows with MinHash LSH and classify one per cluster.
+
+For exploratory runs over large exports, rows are clustered on the text of
+their prompt columns before any request.  Rows are clustered greedily in
+order: each row's MinHash signature is looked up in an LSH index of the
+cluster representatives so far, and the row joins the most similar one
+whose estimated similarity is at least `threshold`; otherwise it starts a
+new cluster.  Every member is therefore within the threshold of its
+representative, and clusters can't chain through intermediate rows.  The
+representative of a cluster (its first row) and up to `spot_checks`
+random other members are classified through classify_rows; every other
+row takes its representative's label with `source="cluster"`.
+Spot-check agreement measures how far the propagated labels can be
+trusted.
+
+The greedy assignment is sequential and runs in the main process, since
+each row depends on the representatives before it.  Rows repeating a
+signature earlier in their block reuse its assignment, so the Python loop
+runs once per distinct signature of a block; on mostly distinct texts it
+is the bottleneck at millions of rows (`python benchmarks/cluster_rows.py`
+measures it).
+
+Clustering is out of core: chunks are streamed, signatures are computed
+in worker processes a block at a time, and only the representatives'
+signatures are kept.  The rows to classify are read in a second
+pass, so `data` is a DataFrame or a CsvDataset, not a one-shot iterator.
+"""
+
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from backend.classifier import ClassificationResult, classify_rows
+from backend.dataset import CsvDataset, iter_blocks, row_texts
+from backend.minhash import DEFAULT_NUM_PERM, LSHIndex, MinHasher
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+
+DEFAULT_CLUSTER_THRESHOLD = 0.8
+DEFAULT_SPOT_CHECKS = 1
+# Rows per signature task handed to a worker process
+SIGNATURE_BLOCK_ROWS = 5000
+
+
+@dataclass
+class ClusterPlan:
+    """Cluster assignments for every row and the rows to classify."""
+    cluster_ids: np.ndarray  # per row, the position of its representative
+    sample_rows: np.ndarray  # sorted positions: representatives + spot checks
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.cluster_ids)
+
+    @property
+    def num_clusters(self) -> int:
+        return int(np.count_nonzero(self.cluster_ids == np.arange(self.num_rows)))
+
+
+def _chunks(data: pd.DataFrame | CsvDataset, columns: list[str]):
+    if isinstance(data, CsvDataset):
+        return data.chunks(columns)
+    return [data]
+
+
+def _signatures(texts: list[str], num_perm: int) -> np.ndarray:
+    """MinHash signatures of a block of texts; runs in worker processes."""
+    return MinHasher(num_perm).signatures(texts)
+
+
+def _signature_hashes(signatures: np.ndarray) -> np.ndarray:
+    mix = np.random.default_rng(0).integers(
+        0, 1 << 63, size=signatures.shape[1], dtype=np.uint64
+    ) * 2 + 1
+    # uint64 overflow wraps, as in MinHasher
+    return (signatures.astype(np.uint64) * mix).sum(axis=1, dtype=np.uint64)
+
+
+def _assign_clusters(
+    blocks: Iterable[np.ndarray], threshold: float, num_perm: int = DEFAULT_NUM_PERM
+) -> np.ndarray:
+    """Per row, the position of its representative: the most similar
+    earlier representative at or above `threshold`, or the row itself.
+
+    Within a block, rows with identical signatures are assigned once, in
+    order of their first row, and band keys are hashed for the block in
+    one pass; only the per-signature LSH lookups run in Python.
+    """
+    index = LSHIndex(threshold, num_perm)
+    parts = []
+    row = 0
+    for signatures in blocks:
+        if not len(signatures):
+            continue
+        # Rows compared by a 64-bit hash of the whole signature, which
+        # sorts far faster than the rows themselves
+        _, first, inverse = np.unique(
+            _signature_hashes(signatures), return_index=True, return_inverse=True
+        )
+        order = np.argsort(first)
+        distinct = signatures[first[order]]
+        band_keys = index.band_keys(distinct)
+        ids = np.empty(len(distinct), dtype=np.int64)
+        for i, position in enumerate((first[order] + row).tolist()):
+            hit = index.query(distinct[i], band_keys[i])
+            if hit is None:
+                # Copied so the index doesn't keep the whole block alive
+                index.add(position, distinct[i].copy(), band_keys[i])
+                ids[i] = position
+            else:
+                ids[i] = hit[0]
+        # ids is in first-row order; map back to np.unique's sorted order
+        by_unique = np.empty_like(ids)
+        by_unique[order] = ids
+        parts.append(by_unique[inverse])
+        row += len(signatures)
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+
+def _spot_check_rows(cluster_ids: np.ndarray, per_cluster: int, seed: int) -> np.ndarray:
+    """Up to `per_cluster` random non-representative rows of each cluster."""
+    members = np.flatnonzero(cluster_ids != np.arange(len(cluster_ids)))
+    if per_cluster <= 0 or not len(members):
+        return np.empty(0, dtype=np.int64)
+    shuffled = np.random.default_rng(seed).permutation(members)
+    shuffled = shuffled[np.argsort(cluster_ids[shuffled], kind="stable")]
+    groups = cluster_ids[shuffled]
+    first = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    rank = np.arange(len(shuffled)) - np.repeat(first, np.diff(np.r_[first, len(shuffled)]))
+    return shuffled[rank < per_cluster]
+
+
+def _pooled_signatures(
+    pool: ProcessPoolExecutor, blocks: Iterable[list[str]], num_perm: int, ahead: int
+) -> Iterator[np.ndarray]:
+    """Signature blocks computed in `pool`, in order, with at most `ahead`
+    blocks in flight."""
+    in_flight = deque()
+    for texts in blocks:
+        in_flight.append(pool.submit(_signatures, texts, num_perm))
+        if len(in_flight) >= ahead:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def cluster_rows(
+    data: pd.DataFrame | CsvDataset,
+    columns: list[str],
+    threshold: float = DEFAULT_CLUSTER_THRESHOLD,
+    spot_checks: int = DEFAULT_SPOT_CHECKS,
+    max_rows: int | None = None,
+    processes: int | None = None,
+    num_perm: int = DEFAULT_NUM_PERM,
+    seed: int = 0,
+) -> ClusterPlan:
+    """Cluster rows on the text of `columns`.
+
+    `processes` worker processes compute signatures (default: one per
+    CPU; 0 or 1 computes them in this process).  At most two blocks per
+    worker are in flight, so memory doesn't grow with the file.
+    """
+    blocks = (
+        row_texts(block, columns)
+        for _, block in iter_blocks(_chunks(data, columns), max_rows, SIGNATURE_BLOCK_ROWS)
+    )
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1:
+        cluster_ids = _assign_clusters(
+            (_signatures(texts, num_perm) for texts in blocks), threshold, num_perm
+        )
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            cluster_ids = _assign_clusters(
+                _pooled_signatures(pool, blocks, num_perm, 2 * processes),
+                threshold, num_perm,
+            )
+    if not len(cluster_ids):
+        return ClusterPlan(cluster_ids, np.empty(0, dtype=np.int64))
+
+    representatives = np.flatnonzero(cluster_ids == np.arange(len(cluster_ids)))
+    sample = np.union1d(representatives, _spot_check_rows(cluster_ids, spot_checks, seed))
+    return ClusterPlan(cluster_ids, sample)
+
+
+def select_rows(
+    data: pd.DataFrame | CsvDataset, rows: np.ndarray, columns: list[str]
+) -> pd.DataFrame:
+    """The rows at sorted positions `rows`, read in one pass."""
+    picked = []
+    last = int(rows[-1]) + 1 if len(rows) else 0
+    for start, block in iter_blocks(_chunks(data, columns), last):
+        lo, hi = np.searchsorted(rows, [start, start + len(block)])
+        if hi > lo:
+            picked.append(block.iloc[rows[lo:hi] - start])
+    if not picked:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(picked, ignore_index=True)
+
+
+def _label_key(label) -> tuple:
+    return tuple(label) if isinstance(label, list) else (label,)
+
+
+def classify_clusters(
+    data: pd.DataFrame | CsvDataset,
+    plan: ClusterPlan,
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    progress_callback=None,
+    **classify_kwargs,
+) -> dict:
+    """Classify a plan's sample rows; `classify_kwargs` go to classify_rows.
+
+    Returns a dict with:
+        classified: results of the classified rows, by row position
+        clusters / rows / classified_rows: sizes
+        spot_checks: spot-checked rows
+        spot_check_agreement: share of spot checks labelled like their
+            representative (None without spot checks)
+        disagreeing_clusters: representatives of clusters with a
+            disagreeing spot check
+    """
+    if classify_kwargs.get("journal") is not None:
+        # The sample is numbered from 0, not by its rows' positions
+        raise ValueError("Checkpoint journals aren't supported for cluster runs")
+    sample_df = select_rows(data, plan.sample_rows, prompt_template.columns_used)
+    results = classify_rows(
+        sample_df, model_config, prompt_template, categories, multi_label,
+        delimiter, progress_callback=progress_callback, **classify_kwargs,
+    )
+    classified: dict[int, ClassificationResult] = {}
+    for row, result in zip(plan.sample_rows.tolist(), results):
+        result.row_index = row
+        classified[row] = result
+
+    spot_rows = [row for row in classified if plan.cluster_ids[row] != row]
+    agreeing, disagreeing = 0, set()
+    for row in spot_rows:
+        representative = int(plan.cluster_ids[row])
+        if (_label_key(classified[row].matched_label)
+                == _label_key(classified[representative].matched_label)):
+            agreeing += 1
+        else:
+            disagreeing.add(representative)
+    return {
+        "classified": classified,
+        "clusters": plan.num_clusters,
+        "rows": plan.num_rows,
+        "classified_rows": len(classified),
+        "spot_checks": len(spot_rows),
+        "spot_check_agreement": agreeing / len(spot_rows) if spot_rows else None,
+        "disagreeing_clusters": sorted(disagreeing),
+    }
+
+
+def propagate_results(
+    plan: ClusterPlan, classified: dict[int, ClassificationResult]
+) -> Iterator[ClassificationResult]:
+    """A result for every row, in row order: classified rows keep their
+    own, the rest copy their representative's with `source="cluster"`."""
+    for row, representative in enumerate(plan.cluster_ids.tolist()):
+        own = classified.get(row)
+        if own is not None:
+            yield own
+        else:
+            yield replace(classified[representative], row_index=row, source="cluster")
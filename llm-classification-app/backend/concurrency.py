@@ -0,0 +1,258 @@
+"""Concurrency control for the async classification engine.
+
+`FixedConcurrency` caps in-flight requests at a static limit.
+`AdaptiveConcurrency` is an AIMD controller: it grows the window additively
+while latency and errors stay flat, and halves it on 429/503 responses or
+latency spikes.  Both share the same interface so the engine doesn't care
+which one it is given.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+import litellm
+
+
+DEFAULT_MAX_RETRIES = 5
+
+_OVERLOAD_ERRORS = (litellm.RateLimitError, litellm.ServiceUnavailableError)
+_OVERLOAD_STATUS_CODES = {429, 503}
+
+
+def is_overload_error(exc: Exception) -> bool:
+    """True for errors meaning "slow down": 429 rate limits and 503s."""
+    if isinstance(exc, _OVERLOAD_ERRORS):
+        return True
+    return getattr(exc, "status_code", None) in _OVERLOAD_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+@dataclass
+class Ticket:
+    """Handed out by slot(); identifies one request for feedback."""
+    started: float
+    epoch: int
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+class _Gate:
+    """Waits until fewer than `limit` requests are in flight."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._cond: asyncio.Condition | None = None
+        self._loop = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Conditions bind to the loop they're first used on; a controller
+        # may be reused across runs, each with its own asyncio.run() loop.
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    async def enter(self, limit_fn):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < limit_fn())
+            self.in_flight += 1
+
+    async def leave(self):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+
+class FixedConcurrency:
+    """Static in-flight limit; ignores latency and error feedback."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._gate = _Gate()
+
+    @property
+    def window(self) -> int:
+        return self.limit
+
+    @property
+    def max_limit(self) -> int:
+        return self.limit
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._gate.enter(lambda: self.limit)
+        try:
+            yield Ticket(started=time.monotonic(), epoch=0)
+        finally:
+            await self._gate.leave()
+
+    def on_success(self, ticket: Ticket, latency: float | None = None):
+        pass
+
+    def on_overload(self, ticket: Ticket):
+        pass
+
+    def on_error(self, ticket: Ticket):
+        pass
+
+    def snapshot(self) -> dict:
+        return {"window": self.limit, "in_flight": self._gate.in_flight}
+
+
+class AdaptiveConcurrency:
+    """AIMD concurrency controller driven by observed latency and overloads.
+
+    - Every success adds `increase / window` to the window, i.e. roughly
+      +`increase` per window's worth of completions, as long as the p95
+      latency of recent requests stays within `latency_tolerance` × the
+      best p95 seen and the recent error rate is below `max_error_rate`.
+      Only provider calls are sampled for latency: cache hits and
+      rate-limiter waits would skew the baseline.
+    - A 429/503 or a latency spike multiplies the window by `decrease`.
+      Only one cut is applied per "generation": requests started before the
+      last cut can't trigger another, so a burst of 429s halves once.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        max_error_rate: float = 0.05,
+        sample_size: int = 50,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+
+        self._latencies: deque[float] = deque(maxlen=sample_size)
+        self._outcomes: deque[bool] = deque(maxlen=sample_size)  # True = error
+        self._baseline_p95: float | None = None
+        self._epoch = 0
+        self._gate = _Gate()
+
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+        self.decreases = 0
+
+    @property
+    def window(self) -> int:
+        return int(self.limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._gate.enter(lambda: self.window)
+        try:
+            yield Ticket(started=time.monotonic(), epoch=self._epoch)
+        finally:
+            await self._gate.leave()
+
+    def p95_latency(self) -> float | None:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def _cut(self, ticket: Ticket):
+        if ticket.epoch != self._epoch:
+            return  # already reacted to this generation of requests
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self._epoch += 1
+        self.decreases += 1
+
+    def on_success(self, ticket: Ticket, latency: float | None = None):
+        """Record a completed request.  `latency` is the provider's time for
+        it, or None if it never reached the provider (a cache hit), which
+        adds no latency sample."""
+        self.successes += 1
+        self._outcomes.append(False)
+
+        if latency is not None:
+            self._latencies.append(latency)
+            p95 = self.p95_latency()
+            # Need a reasonably full sample before judging latency
+            if len(self._latencies) >= max(5, self._latencies.maxlen // 5):
+                if self._baseline_p95 is None or p95 < self._baseline_p95:
+                    self._baseline_p95 = p95
+                elif p95 > self._baseline_p95 * self.latency_tolerance:
+                    self._cut(ticket)
+                    # Latency has shifted; re-learn the baseline at the new window
+                    self._latencies.clear()
+                    self._baseline_p95 = None
+                    return
+
+        if self.error_rate() <= self.max_error_rate:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def on_overload(self, ticket: Ticket):
+        self.overloads += 1
+        self._outcomes.append(True)
+        self._cut(ticket)
+
+    def on_error(self, ticket: Ticket):
+        self.errors += 1
+        self._outcomes.append(True)
+
+    def snapshot(self) -> dict:
+        return {
+            "window": self.window,
+            "in_flight": self._gate.in_flight,
+            "p95_latency": self.p95_latency(),
+            "error_rate": self.error_rate(),
+            "successes": self.successes,
+            "overloads": self.overloads,
+            "decreases": self.decreases,
+        }
+
+
+async def call_with_retries(
+    call, controller, max_retries: int = DEFAULT_MAX_RETRIES, latency_of=None
+):
+    """Await `call()` inside a controller slot, retrying overloads with backoff.
+
+    The backoff sleep happens outside the slot so a waiting retry doesn't
+    hold back other requests.  `latency_of(result)` gives the latency fed
+    to the controller (None for no sample); without it, the time the call
+    held its slot is used.
+    """
+    for attempt in range(max_retries + 1):
+        async with controller.slot() as ticket:
+            try:
+                result = await call()
+            except Exception as e:
+                if not is_overload_error(e):
+                    controller.on_error(ticket)
+                    raise
+                controller.on_overload(ticket)
+                if attempt >= max_retries:
+                    raise
+            else:
+                latency = latency_of(result) if latency_of else ticket.elapsed()
+                controller.on_success(ticket, latency)
+                return result
+        await asyncio.sleep(backoff_delay(attempt))
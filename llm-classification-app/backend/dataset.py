@@ -0,0 +1,147 @@
+"""Chunked, column-pruned CSV input for datasets larger than memory.
+
+`CsvDataset` reads a CSV from disk in chunks, loading only the columns a
+prompt uses.  Previews and token/cost estimates work on `sample()`; the
+classifier, checkpoint fingerprint and batch preparation consume
+`chunks()`, with rows numbered from 0 across chunks.
+"""
+
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_CHUNK_ROWS = 50_000
+SAMPLE_ROWS = 1000
+CSV_ENGINES = ("c", "pyarrow")
+
+# Rows converted to dicts at a time, so a large in-memory frame isn't
+# duplicated as a list of dicts
+_ROW_BLOCK = 1000
+
+
+@dataclass
+class CsvDataset:
+    """A CSV on disk, read lazily."""
+    path: Path
+    engine: str = "c"
+    chunk_rows: int = DEFAULT_CHUNK_ROWS
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+        if self.engine not in CSV_ENGINES:
+            raise ValueError(
+                f"Unknown CSV engine '{self.engine}', expected one of {CSV_ENGINES}"
+            )
+
+    def chunks(self, columns: list[str] | None = None) -> Iterator[pd.DataFrame]:
+        """Yield DataFrames of consecutive rows, optionally only `columns`.
+
+        Chunks carry a RangeIndex that continues from the previous chunk.
+        """
+        if self.engine == "pyarrow":
+            yield from self._pyarrow_chunks(columns)
+            return
+        with pd.read_csv(
+            self.path, usecols=columns, chunksize=self.chunk_rows
+        ) as reader:
+            yield from reader
+
+    def _pyarrow_chunks(self, columns: list[str] | None) -> Iterator[pd.DataFrame]:
+        # pandas' own engine="pyarrow" can't stream (no chunksize), so use
+        # pyarrow's streaming reader directly; chunks are sized in bytes.
+        try:
+            import pyarrow.csv as pacsv
+        except ImportError as e:
+            raise ImportError(
+                "The pyarrow CSV engine requires pyarrow: pip install pyarrow"
+            ) from e
+
+        convert_options = pacsv.ConvertOptions(include_columns=columns or [])
+        offset = 0
+        with pacsv.open_csv(self.path, convert_options=convert_options) as reader:
+            for batch in reader:
+                chunk = batch.to_pandas()
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+
+    def sample(
+        self, nrows: int = SAMPLE_ROWS, method: str = "head", seed: int = 0
+    ) -> pd.DataFrame:
+        """`nrows` rows, all columns, for previews and estimates.
+
+        "head" reads just the first rows.  "random" is a uniform sample of
+        the whole file (a full pass, keeping the rows with the smallest
+        random keys), for exports sorted by something that matters, like
+        length.  Either way the result is indexed from 0.
+        """
+        if method == "head":
+            return pd.read_csv(self.path, nrows=nrows)
+        if method != "random":
+            raise ValueError(f"Unknown sample method '{method}'")
+        rng = np.random.default_rng(seed)
+        kept, kept_keys = None, None
+        for chunk in self.chunks():
+            keys = pd.Series(rng.random(len(chunk)), index=chunk.index)
+            if kept is not None:
+                chunk, keys = pd.concat([kept, chunk]), pd.concat([kept_keys, keys])
+            kept_keys = keys.nsmallest(nrows)
+            kept = chunk.loc[kept_keys.index]
+        if kept is None:
+            return pd.read_csv(self.path, nrows=0)
+        return kept.sort_index().reset_index(drop=True)
+
+    def columns(self) -> list[str]:
+        return list(pd.read_csv(self.path, nrows=0).columns)
+
+    def count_rows(self) -> int:
+        """Number of data rows; a full pass over a single column."""
+        return sum(len(chunk) for chunk in self.chunks(self.columns()[:1]))
+
+
+def as_chunks(data: pd.DataFrame | Iterable[pd.DataFrame]) -> Iterable[pd.DataFrame]:
+    """Treat an in-memory DataFrame as a single chunk."""
+    return [data] if isinstance(data, pd.DataFrame) else data
+
+
+def row_texts(block: pd.DataFrame, columns: list[str]) -> list[str]:
+    """Each row's values in `columns` joined by spaces (missing columns are
+    skipped), built column-wise."""
+    present = [col for col in columns if col in block.columns]
+    if not present:
+        return [""] * len(block)
+    texts = block[present[0]].astype(str)
+    for col in present[1:]:
+        texts = texts + " " + block[col].astype(str)
+    return texts.tolist()
+
+
+def iter_blocks(
+    data: pd.DataFrame | Iterable[pd.DataFrame],
+    max_rows: int | None = None,
+    block_rows: int = _ROW_BLOCK,
+) -> Iterator[tuple[int, pd.DataFrame]]:
+    """(position of first row, block) pairs of at most `block_rows` rows,
+    numbered from 0 across chunks and stopping after `max_rows` rows."""
+    start = 0
+    for chunk in as_chunks(data):
+        for offset in range(0, len(chunk), block_rows):
+            if max_rows is not None and start >= max_rows:
+                return
+            block = chunk.iloc[offset:offset + block_rows]
+            if max_rows is not None:
+                block = block.iloc[:max_rows - start]
+            yield start, block
+            start += len(block)
+
+
+def iter_rows(
+    data: pd.DataFrame | Iterable[pd.DataFrame], max_rows: int | None = None
+) -> Iterator[tuple[int, dict]]:
+    """(row position, row dict) pairs, numbered from 0 across chunks."""
+    for start, block in iter_blocks(data, max_rows):
+        yield from enumerate(block.to_dict("records"), start)
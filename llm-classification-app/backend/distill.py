@@ -0,0 +1,330 @@
+"""Distil LLM labels into a local classifier that answers confident rows.
+
+Once a few thousand rows have LLM labels, a small CPU model trained on
+them can take over the easy rows.  `LocalClassifier` is a linear softmax
+model over hashed TF-IDF features (word unigrams and bigrams hashed into a
+fixed number of buckets), trained incrementally with SGD, in NumPy only.
+
+`classify_with_distillation` streams the rows through one classification
+run, with a `Distiller` deciding per row: the first `warmup_rows` go to
+the LLM, with every `holdout_every`-th one held out; the model is trained
+on the rest.  Held-out rows alternate between a calibration set, on
+which a probability threshold is chosen so that predictions above it
+agree with the LLM at least `target_agreement` of the time, and an
+evaluation set that measures the model and threshold without having
+picked them.  After that, rows the model predicts above the threshold are
+labelled locally (source "local") and the rest go to the LLM, whose new
+labels keep training the model.
+"""
+
+import re
+import zlib
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from backend.classifier import ClassificationResult, iter_classify
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+
+DEFAULT_FEATURES = 1 << 16
+DEFAULT_WARMUP_ROWS = 2000
+DEFAULT_TARGET_AGREEMENT = 0.95
+# Every n-th warm-up row is held out, alternately to calibrate the
+# threshold and to measure the model
+DEFAULT_HOLDOUT_EVERY = 5
+# Calibration rows needed above a threshold before it is trusted
+MIN_CALIBRATION_ROWS = 20
+WARMUP_EPOCHS = 5
+LEARNING_RATE = 0.5
+BLOCK_ROWS = 1000
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _features(text: str, n_features: int) -> tuple[np.ndarray, np.ndarray]:
+    """Hashed bucket indices and sublinear term counts (1 + log tf)."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    terms = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    counts: dict[int, int] = {}
+    for term in terms:
+        bucket = zlib.crc32(term.encode()) % n_features
+        counts[bucket] = counts.get(bucket, 0) + 1
+    indices = np.fromiter(counts, dtype=np.int64, count=len(counts))
+    tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return indices, tf
+
+
+class LocalClassifier:
+    """Incrementally trained softmax regression over hashed TF-IDF features.
+
+    Only categories seen in training can be predicted.
+    """
+
+    def __init__(self, n_features: int = DEFAULT_FEATURES, seed: int = 0):
+        self.n_features = n_features
+        self.classes: list[str] = []
+        self._class_index: dict[str, int] = {}
+        self.weights = np.zeros((n_features, 0), dtype=np.float32)
+        self.bias = np.zeros(0, dtype=np.float32)
+        self._doc_freq = np.zeros(n_features, dtype=np.int64)
+        self._docs = 0
+        self._rng = np.random.default_rng(seed)
+
+    def _vector(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        indices, tf = _features(text, self.n_features)
+        idf = np.log((1 + self._docs) / (1 + self._doc_freq[indices])) + 1
+        values = tf * idf.astype(np.float32)
+        norm = np.linalg.norm(values)
+        return indices, values / norm if norm else values
+
+    def _add_classes(self, labels: list[str]):
+        new = [label for label in dict.fromkeys(labels) if label not in self._class_index]
+        for label in new:
+            self._class_index[label] = len(self.classes)
+            self.classes.append(label)
+        if new:
+            self.weights = np.hstack(
+                [self.weights, np.zeros((self.n_features, len(new)), dtype=np.float32)]
+            )
+            self.bias = np.concatenate([self.bias, np.zeros(len(new), dtype=np.float32)])
+
+    def _scores(self, indices: np.ndarray, values: np.ndarray) -> np.ndarray:
+        logits = values @ self.weights[indices] + self.bias
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def partial_fit(self, texts: list[str], labels: list[str], epochs: int = 1):
+        """Update document frequencies and take SGD steps over the examples."""
+        if not texts:
+            return
+        for text in texts:
+            self._doc_freq[_features(text, self.n_features)[0]] += 1
+        self._docs += len(texts)
+        self._add_classes(labels)
+        vectors = [self._vector(text) for text in texts]
+        targets = [self._class_index[label] for label in labels]
+        for _ in range(epochs):
+            for i in self._rng.permutation(len(texts)):
+                indices, values = vectors[i]
+                grad = self._scores(indices, values)
+                grad[targets[i]] -= 1
+                self.weights[indices] -= LEARNING_RATE * np.outer(values, grad)
+                self.bias -= LEARNING_RATE * grad
+
+    def predict(self, texts: list[str]) -> tuple[list[str | None], np.ndarray]:
+        """Most likely category and its probability for each text."""
+        if not self.classes:
+            return [None] * len(texts), np.zeros(len(texts))
+        labels, probs = [], np.empty(len(texts))
+        for i, text in enumerate(texts):
+            scores = self._scores(*self._vector(text))
+            best = int(scores.argmax())
+            labels.append(self.classes[best])
+            probs[i] = scores[best]
+        return labels, probs
+
+
+def calibrate_threshold(
+    predicted: list[str | None],
+    probs: np.ndarray,
+    truth: list[str],
+    target_agreement: float = DEFAULT_TARGET_AGREEMENT,
+    min_rows: int = MIN_CALIBRATION_ROWS,
+) -> float | None:
+    """Lowest probability at which predictions at or above it agree with
+    `truth` at least `target_agreement` of the time, over at least
+    `min_rows` rows; None if no threshold qualifies."""
+    order = np.argsort(-probs, kind="stable")
+    correct = np.array([predicted[i] == truth[i] for i in order], dtype=float)
+    counts = np.arange(1, len(order) + 1)
+    agreement = np.cumsum(correct) / counts
+    ok = np.flatnonzero((agreement >= target_agreement) & (counts >= min_rows))
+    if not len(ok):
+        return None
+    return float(probs[order[ok[-1]]])
+
+
+@dataclass
+class _Holdout:
+    texts: list[str]
+    labels: list[str]
+
+    def evaluate(self, model: LocalClassifier, threshold: float | None) -> dict:
+        predicted, probs = model.predict(self.texts)
+        agree = [p == t for p, t in zip(predicted, self.labels)]
+        confident = probs >= threshold if threshold is not None else np.zeros(len(agree), bool)
+        return {
+            "rows": len(self.labels),
+            "agreement": float(np.mean(agree)) if agree else None,
+            "coverage": float(confident.mean()) if len(agree) else 0.0,
+            "confident_agreement": (
+                float(np.mean(np.array(agree)[confident])) if confident.any() else None
+            ),
+        }
+
+
+def _local_result(row: int, label: str, prob: float) -> ClassificationResult:
+    return ClassificationResult(
+        row_index=row, raw_response=label, matched_label=label,
+        input_tokens=0, output_tokens=0, source="local",
+        match_score=100.0, confidence=prob,
+    )
+
+
+class Distiller:
+    """Routes one run's rows between a LocalClassifier and the LLM.
+
+    The classification engine offers each row to `predict` before any
+    request and passes every other result to `learn` (see
+    classifier._arun_engine).  Until `warmup_rows` results have been
+    learned nothing is predicted; every `holdout_every`-th of those rows
+    is held out.  The model is then trained on the rest, and afterwards
+    updated every `block_rows` new labels, recalibrating the threshold
+    each time.
+    """
+
+    def __init__(
+        self,
+        categories: list[str],
+        warmup_rows: int = DEFAULT_WARMUP_ROWS,
+        target_agreement: float = DEFAULT_TARGET_AGREEMENT,
+        holdout_every: int = DEFAULT_HOLDOUT_EVERY,
+        n_features: int = DEFAULT_FEATURES,
+        block_rows: int = BLOCK_ROWS,
+    ):
+        self.categories = set(categories)
+        self.warmup_rows = warmup_rows
+        self.target_agreement = target_agreement
+        self.holdout_every = holdout_every
+        self.block_rows = block_rows
+        self.model = LocalClassifier(n_features)
+        self.calibration = _Holdout([], [])
+        self.holdout = _Holdout([], [])
+        self.threshold: float | None = None
+        self.trained = False
+        self._learned = 0
+        self._texts: list[str] = []
+        self._labels: list[str] = []
+
+    def predict(self, row: int, text: str) -> ClassificationResult | None:
+        """A local result for `row` if the model clears the threshold."""
+        if self.threshold is None:
+            return None
+        (label,), (prob,) = self.model.predict([text])
+        if prob < self.threshold:
+            return None
+        return _local_result(row, label, float(prob))
+
+    def learn(self, text: str, result: ClassificationResult):
+        """Take an LLM-labelled row as a training or held-out example."""
+        if result.source == "local":
+            return
+        self._learned += 1
+        label = result.matched_label
+        if label in self.categories:
+            if not self.trained and result.row_index % self.holdout_every == 0:
+                held = (
+                    self.calibration
+                    if result.row_index // self.holdout_every % 2 == 0
+                    else self.holdout
+                )
+                held.texts.append(text)
+                held.labels.append(label)
+            else:
+                self._texts.append(text)
+                self._labels.append(label)
+        if not self.trained and self._learned >= self.warmup_rows:
+            self.model.partial_fit(self._texts, self._labels, epochs=WARMUP_EPOCHS)
+            self.trained = True
+        elif self.trained and len(self._texts) >= self.block_rows:
+            self.model.partial_fit(self._texts, self._labels)
+        else:
+            return
+        self._texts, self._labels = [], []
+        if self.calibration.labels:
+            predicted, probs = self.model.predict(self.calibration.texts)
+            self.threshold = calibrate_threshold(
+                predicted, probs, self.calibration.labels, self.target_agreement
+            )
+
+
+def classify_with_distillation(
+    data: pd.DataFrame | Iterable[pd.DataFrame],
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    max_rows: int | None = None,
+    warmup_rows: int = DEFAULT_WARMUP_ROWS,
+    target_agreement: float = DEFAULT_TARGET_AGREEMENT,
+    holdout_every: int = DEFAULT_HOLDOUT_EVERY,
+    n_features: int = DEFAULT_FEATURES,
+    block_rows: int = BLOCK_ROWS,
+    progress_callback=None,
+    on_result: Callable[[ClassificationResult], None] | None = None,
+    **classify_kwargs,
+) -> dict:
+    """Classify rows with the LLM, handing confident rows to a local model.
+
+    Single-label only.  All rows go through one iter_classify stream, with
+    a Distiller routing them; `classify_kwargs` go to iter_classify, so a
+    `journal` resumes the run (journaled rows also retrain the model).
+    `progress_callback(current, total)` is called as rows finish, with
+    total 0 when unknown.  With `on_result`, results are passed to it in
+    completion order instead of being collected.
+
+    Returns a dict with:
+        results: results in row order (source "local" for offloaded
+            rows); None with `on_result`
+        threshold: the calibrated probability threshold (None if the
+            model never reached `target_agreement` on the calibration rows)
+        local_rows / llm_rows / offload_ratio: how rows were answered
+        calibration_rows: held-out rows the threshold was calibrated on
+        holdout: the other held-out rows, the model's agreement with
+            their LLM labels, and its coverage and agreement above the
+            threshold
+    """
+    if classify_kwargs.get("multi_label"):
+        raise ValueError("Distillation is single-label only")
+    if isinstance(data, pd.DataFrame):
+        total = min(len(data), max_rows or len(data))
+    else:
+        total = classify_kwargs.get("total_rows") or 0
+    distiller = Distiller(
+        categories, warmup_rows, target_agreement, holdout_every, n_features, block_rows,
+    )
+    results: list[ClassificationResult] | None = None
+    if on_result is None:
+        results = []
+        on_result = results.append
+    local_rows = llm_rows = 0
+
+    stream = iter_classify(
+        data, model_config, prompt_template, categories, max_rows=max_rows,
+        local_model=distiller, **classify_kwargs,
+    )
+    for result in stream:
+        if result.source == "local":
+            local_rows += 1
+        else:
+            llm_rows += 1
+        on_result(result)
+        if progress_callback:
+            progress_callback(local_rows + llm_rows, total)
+
+    if results is not None:
+        results.sort(key=lambda r: r.row_index)
+    rows_done = local_rows + llm_rows
+    return {
+        "results": results,
+        "threshold": distiller.threshold,
+        "local_rows": local_rows,
+        "llm_rows": llm_rows,
+        "offload_ratio": local_rows / rows_done if rows_done else 0.0,
+        "calibration_rows": len(distiller.calibration.labels),
+        "holdout": distiller.holdout.evaluate(distiller.model, distiller.threshold),
+    }
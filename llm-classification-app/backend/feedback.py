@@ -1,6 +1,6 @@
 """AI feedback on prompts and categories."""
 
-import litellm
+from backend.llm import complete
 from backend.models import ModelConfig
 from backend.prompt import FEEDBACK_PROMPT
 
@@ -10,6 +10,7 @@ def get_prompt_feedback(
     prompt_template: str,
     categories: list[str],
     multi_label: bool = False,
+    use_cache: bool = True,
 ) -> str:
     """Get AI feedback on the classification prompt and categories."""
     classification_type = "multi-label" if multi_label else "single-label"
@@ -21,13 +22,11 @@ def get_prompt_feedback(
         classification_type=classification_type,
     )
 
-    kwargs = model_config.to_litellm_kwargs()
     # Override max_tokens for feedback - needs room for detailed response
-    kwargs["max_tokens"] = 4096
-
-    response = litellm.completion(
-        messages=[{"role": "user", "content": feedback_prompt}],
-        **kwargs,
+    reply = complete(
+        model_config,
+        [{"role": "user", "content": feedback_prompt}],
+        use_cache=use_cache,
+        max_tokens=4096,
     )
-
-    return response.choices[0].message.content.strip()
+    return reply.content
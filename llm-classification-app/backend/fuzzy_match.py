@@ -1,62 +1,297 @@
-"""Fuzzy matching for classification results against known categories."""
+"""Fuzzy matching for classification results against known categories.
 
+A `CategoryMatcher` is built once per category list (`get_matcher` caches
+them): exact, case-insensitive answers are a dict lookup, fuzzy answers
+are remembered in an LRU (models repeat the same few misspellings), and
+`match_many` scores a large batch of answers in one `process.cdist` call
+spread over all cores (small batches use `extractOne` per answer).  The
+module-level functions use the shared matcher for their category list.
+
+Taxonomies with thousands of categories make scoring every category per
+answer the hot spot, so large lists get a trigram inverted index: an
+answer is only scored against the categories sharing the most trigrams
+with it.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
 from rapidfuzz import fuzz, process
 
 
+DEFAULT_THRESHOLD = 60
+# Distinct fuzzy answers remembered per matcher
+MATCH_CACHE_SIZE = 4096
+# Category lists at least this long are matched through a trigram index
+INDEX_MIN_CATEGORIES = 500
+# Categories scored per answer when using the index
+SHORTLIST_SIZE = 64
+# Fewer fuzzy answers than this are scored one by one: a parallel cdist
+# call costs a thread-pool dispatch, which dwarfs scoring a handful
+PARALLEL_MIN_QUERIES = 32
+
+DELIMITER_CANDIDATES = ["|", "||", ";;", "###", "^^^"]
+_DELIMITER_RUN_RE = re.compile(r"[|;#^]+")
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from lowercase trigrams to category positions."""
+
+    def __init__(self, categories: list[str]):
+        postings: dict[str, list[int]] = {}
+        sizes = []
+        for i, cat in enumerate(categories):
+            grams = _trigrams(cat)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.postings = {g: np.array(ids, dtype=np.int32) for g, ids in postings.items()}
+        self.sizes = np.array(sizes, dtype=np.float64)
+
+    def shortlist(self, text: str, size: int = SHORTLIST_SIZE) -> np.ndarray:
+        """Positions of the (up to) `size` categories most similar to `text`
+        by trigram Dice coefficient, in category order.  Empty if no
+        category shares a trigram."""
+        grams = _trigrams(text)
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.sizes))
+        candidates = np.flatnonzero(shared)
+        if len(candidates) > size:
+            dice = shared[candidates] / (self.sizes[candidates] + len(grams))
+            candidates = np.sort(candidates[np.argpartition(-dice, size)[:size]])
+        return candidates
+
+
+class CategoryMatcher:
+    """Matches model answers against a fixed list of categories.
+
+    `use_index` matches through a trigram index; it defaults to on for
+    lists of INDEX_MIN_CATEGORIES or more.
+    """
+
+    def __init__(
+        self,
+        categories: list[str],
+        threshold: int = DEFAULT_THRESHOLD,
+        cache_size: int = MATCH_CACHE_SIZE,
+        workers: int = -1,
+        use_index: bool | None = None,
+    ):
+        self.categories = list(categories)
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.workers = workers
+        self._exact: dict[str, str] = {}
+        for cat in self.categories:
+            # The first category wins if two differ only in case
+            self._exact.setdefault(cat.lower(), cat)
+        self._cache: OrderedDict[str, tuple[str | None, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        if use_index is None:
+            use_index = len(self.categories) >= INDEX_MIN_CATEGORIES
+        self._index = TrigramIndex(self.categories) if use_index else None
+
+    def _lookup(self, text: str) -> tuple[str | None, float] | None:
+        exact = self._exact.get(text.lower())
+        if exact is not None:
+            return exact, 100.0
+        with self._lock:
+            hit = self._cache.get(text)
+            if hit is not None:
+                self._cache.move_to_end(text)
+            return hit
+
+    def _remember(self, text: str, result: tuple[str | None, float]):
+        with self._lock:
+            self._cache[text] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _score(self, text: str) -> tuple[str | None, float]:
+        choices = self.categories
+        if self._index is not None:
+            shortlist = self._index.shortlist(text)
+            # Nothing shares a trigram (very short or garbled answers):
+            # fall back to scoring the whole list
+            if len(shortlist):
+                choices = [self.categories[i] for i in shortlist]
+        found = process.extractOne(
+            text, choices, scorer=fuzz.ratio, score_cutoff=self.threshold
+        )
+        return (found[0], float(found[1])) if found else (None, 0.0)
+
+    def match(self, prediction: str) -> tuple[str | None, float]:
+        """(closest category or None, score 0-100) for one answer."""
+        if not prediction or not self.categories:
+            return None, 0.0
+        text = prediction.strip()
+        hit = self._lookup(text)
+        if hit is not None:
+            return hit
+        result = self._score(text)
+        self._remember(text, result)
+        return result
+
+    def match_many(self, predictions: list[str]) -> list[tuple[str | None, float]]:
+        """`match` for every answer, with the fuzzy ones scored in one
+        vectorised call."""
+        results: list[tuple[str | None, float]] = [(None, 0.0)] * len(predictions)
+        pending: dict[str, list[int]] = {}
+        for i, prediction in enumerate(predictions):
+            if not prediction or not self.categories:
+                continue
+            text = prediction.strip()
+            hit = self._lookup(text)
+            if hit is not None:
+                results[i] = hit
+            else:
+                pending.setdefault(text, []).append(i)
+        if not pending:
+            return results
+        if self._index is not None or len(pending) < PARALLEL_MIN_QUERIES:
+            # Shortlists differ per answer, and small batches (one reply
+            # at a time in the engine) aren't worth a parallel call
+            for text, positions in pending.items():
+                result = self._score(text)
+                self._remember(text, result)
+                for i in positions:
+                    results[i] = result
+            return results
+
+        queries = list(pending)
+        scores = process.cdist(
+            queries, self.categories, scorer=fuzz.ratio,
+            score_cutoff=self.threshold, workers=self.workers, dtype=np.float64,
+        )
+        # argmax takes the first best category, as extractOne does
+        for text, row, best in zip(queries, scores, scores.argmax(axis=1)):
+            score = float(row[best])
+            if score > 0 and score >= self.threshold:
+                result = (self.categories[best], score)
+            else:
+                result = (None, 0.0)
+            self._remember(text, result)
+            for i in pending[text]:
+                results[i] = result
+        return results
+
+    def match_multi(
+        self, prediction: str, delimiter: str = "|"
+    ) -> tuple[list[str], float]:
+        """Matched labels of a delimited answer and the weakest part's score.
+
+        Parts that match nothing count, so one unrecognised label lowers the
+        score to 0 even if the others matched.
+        """
+        return self.match_multi_many([prediction], delimiter)[0]
+
+    def match_multi_many(
+        self, predictions: list[str], delimiter: str = "|"
+    ) -> list[tuple[list[str], float]]:
+        """`match_multi` for every answer, matching all parts in one batch."""
+        split = [
+            [p.strip() for p in prediction.split(delimiter) if p.strip()]
+            if prediction else []
+            for prediction in predictions
+        ]
+        part_results = iter(self.match_many([p for parts in split for p in parts]))
+        results = []
+        for parts in split:
+            matched, score = [], 100.0 if parts else 0.0
+            for _ in parts:
+                match, part_score = next(part_results)
+                score = min(score, part_score)
+                if match and match not in matched:
+                    matched.append(match)
+            results.append((matched, score))
+        return results
+
+
+@lru_cache(maxsize=32)
+def _shared_matcher(categories: tuple[str, ...], threshold: int) -> CategoryMatcher:
+    return CategoryMatcher(list(categories), threshold)
+
+
+def get_matcher(
+    categories: list[str], threshold: int = DEFAULT_THRESHOLD
+) -> CategoryMatcher:
+    """The shared matcher for a category list, built on first use."""
+    return _shared_matcher(tuple(categories), threshold)
+
+
+def fuzzy_match_label_with_score(
+    prediction: str,
+    categories: list[str],
+    threshold: int = DEFAULT_THRESHOLD,
+) -> tuple[str | None, float]:
+    """Like fuzzy_match_label, but also return the match score (0-100).
+
+    Exact (case-insensitive) matches score 100; no match scores 0.
+    """
+    if not prediction or not categories:
+        return None, 0.0
+    return get_matcher(categories, threshold).match(prediction)
+
+
 def fuzzy_match_label(
     prediction: str,
     categories: list[str],
-    threshold: int = 60,
+    threshold: int = DEFAULT_THRESHOLD,
 ) -> str | None:
     """Match a prediction to the closest category using fuzzy matching.
 
     Returns the matched category or None if no match above threshold.
     """
-    if not prediction or not categories:
-        return None
+    return fuzzy_match_label_with_score(prediction, categories, threshold)[0]
 
-    prediction = prediction.strip()
 
-    # Exact match first (case-insensitive)
-    for cat in categories:
-        if prediction.lower() == cat.lower():
-            return cat
+def fuzzy_match_multi_label_with_score(
+    prediction: str,
+    categories: list[str],
+    delimiter: str = "|",
+    threshold: int = DEFAULT_THRESHOLD,
+) -> tuple[list[str], float]:
+    """Like fuzzy_match_multi_label, but also return the weakest part's score.
 
-    # Fuzzy match
-    result = process.extractOne(
-        prediction, categories, scorer=fuzz.ratio, score_cutoff=threshold
-    )
-    if result:
-        return result[0]
-    return None
+    Parts that match nothing count, so one unrecognised label lowers the
+    score to 0 even if the others matched.
+    """
+    if not prediction:
+        return [], 0.0
+    return get_matcher(categories, threshold).match_multi(prediction, delimiter)
 
 
 def fuzzy_match_multi_label(
     prediction: str,
     categories: list[str],
     delimiter: str = "|",
-    threshold: int = 60,
+    threshold: int = DEFAULT_THRESHOLD,
 ) -> list[str]:
     """Match multi-label predictions to categories.
 
     Splits prediction by delimiter and fuzzy-matches each part.
     """
-    if not prediction:
-        return []
-
-    parts = [p.strip() for p in prediction.split(delimiter) if p.strip()]
-    matched = []
-    for part in parts:
-        match = fuzzy_match_label(part, categories, threshold)
-        if match and match not in matched:
-            matched.append(match)
-    return matched
+    return fuzzy_match_multi_label_with_score(
+        prediction, categories, delimiter, threshold
+    )[0]
 
 
 def find_safe_delimiter(categories: list[str]) -> str:
     """Find a delimiter that doesn't appear in any category label."""
-    candidates = ["|", "||", ";;", "###", "^^^"]
-    for delim in candidates:
-        if not any(delim in cat for cat in categories):
+    # One pass collects the runs of delimiter characters in the labels; a
+    # candidate appears in a label only if it appears in one of those runs
+    runs = set(_DELIMITER_RUN_RE.findall("\n".join(categories)))
+    for delim in DELIMITER_CANDIDATES:
+        if not any(delim in run for run in runs):
             return delim
     return "|||"
@@ -0,0 +1,167 @@
+"""Two-stage classification over a category tree.
+
+Categories written as "Parent > Child" lines form a two-level tree.  Rows
+are first classified into the top-level groups, then, one group at a time,
+among that group's children only, so neither prompt carries the full
+list.  Running each group's rows together keeps their prompt prefix (the
+child list) identical, so provider prompt caches apply within a group.
+Top-level lines without children are leaves of their own.
+
+`classify_hierarchical` runs the stages one after the other over an
+in-memory frame and reports each stage's usage.  For streamed and resumable
+runs, pass the tree to classify_rows / iter_classify as `category_tree`:
+the engine refines each row among its group's children as soon as its
+group answer arrives.
+"""
+
+from dataclasses import dataclass, field, replace
+
+import pandas as pd
+
+from backend.classifier import ClassificationResult, classify_rows, summarize_results
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+
+TREE_SEPARATOR = ">"
+PATH_JOINER = " > "
+
+
+@dataclass
+class CategoryTree:
+    """Top-level groups and their children, in the order first listed."""
+    groups: dict[str, list[str]] = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, categories: list[str]) -> "CategoryTree":
+        """Build a tree from "Parent > Child" lines.  Anything after the
+        first separator is the child, so deeper paths stay whole."""
+        tree = cls()
+        for line in categories:
+            parent, _, child = (p.strip() for p in line.partition(TREE_SEPARATOR))
+            if not parent:
+                continue
+            children = tree.groups.setdefault(parent, [])
+            if child and child not in children:
+                children.append(child)
+        return tree
+
+    def leaves(self) -> list[str]:
+        """Every leaf category as a full "Parent > Child" path."""
+        return [
+            path
+            for parent, children in self.groups.items()
+            for path in ([self.path(parent, c) for c in children] or [parent])
+        ]
+
+    @staticmethod
+    def path(parent: str, child: str) -> str:
+        return f"{parent}{PATH_JOINER}{child}"
+
+    def combine(
+        self, first: ClassificationResult, second: ClassificationResult, parent: str
+    ) -> ClassificationResult:
+        """One result for a row from its group and child answers."""
+        child = second.matched_label
+        matched = self.path(parent, child) if child in self.groups[parent] else child
+        scores = [s for s in (first.match_score, second.match_score) if s is not None]
+        confidence = (
+            first.confidence * second.confidence
+            if first.confidence is not None and second.confidence is not None
+            else None
+        )
+        return replace(
+            second,
+            raw_response=self.path(first.raw_response, second.raw_response),
+            matched_label=matched,
+            input_tokens=first.input_tokens + second.input_tokens,
+            output_tokens=first.output_tokens + second.output_tokens,
+            cached_input_tokens=first.cached_input_tokens + second.cached_input_tokens,
+            match_score=min(scores) if scores else None,
+            latency_s=first.latency_s + second.latency_s,
+            confidence=confidence,
+        )
+
+
+def is_category_tree(categories: list[str]) -> bool:
+    """True if any category line is written as a "Parent > Child" path."""
+    return any(TREE_SEPARATOR in c for c in categories)
+
+
+def classify_hierarchical(
+    df: pd.DataFrame,
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    tree: CategoryTree,
+    max_rows: int | None = None,
+    progress_callback=None,
+    **classify_kwargs,
+) -> dict:
+    """Classify rows into `tree`: groups first, then children per group.
+
+    Single-label only.  `classify_kwargs` (concurrency, use_cache,
+    structured, ...) apply to every stage.  `progress_callback(stage,
+    current, total)` reports progress within each stage, where `stage` is
+    "groups" or the group being refined.
+
+    Returns a dict with:
+        results: final results in row order; labels are "Parent > Child"
+            paths, with tokens summed over both stages
+        row_groups: the group each row was assigned (None if unmatched)
+        stage_stats: summarize_results for the group stage ("groups") and
+            the child stage ("children"), plus per-group rows and summaries
+            ("per_group")
+    """
+    if classify_kwargs.get("multi_label"):
+        raise ValueError("Hierarchical classification is single-label only")
+    if classify_kwargs.get("journal") is not None:
+        # Each stage numbers its subset of rows from 0
+        raise ValueError("Checkpoint journals aren't supported in hierarchical mode")
+    rows = df.head(max_rows) if max_rows else df
+
+    def stage_progress(stage):
+        def report(current, total):
+            if progress_callback:
+                progress_callback(stage, current, total)
+        return report
+
+    first_stage = classify_rows(
+        rows.reset_index(drop=True), model_config, prompt_template,
+        list(tree.groups), progress_callback=stage_progress("groups"),
+        **classify_kwargs,
+    )
+    results: list[ClassificationResult] = list(first_stage)
+    row_groups: list[str | None] = [None] * len(rows)
+    by_group: dict[str, list[int]] = {}
+    for idx, result in enumerate(first_stage):
+        group = result.matched_label
+        if group in tree.groups:
+            row_groups[idx] = group
+            if tree.groups[group]:
+                by_group.setdefault(group, []).append(idx)
+
+    second_stage: list[ClassificationResult] = []
+    per_group = {}
+    for group, idxs in by_group.items():
+        children = tree.groups[group]
+        group_results = classify_rows(
+            rows.iloc[idxs].reset_index(drop=True), model_config,
+            prompt_template, children, progress_callback=stage_progress(group),
+            **classify_kwargs,
+        )
+        for idx, result in zip(idxs, group_results):
+            results[idx] = replace(
+                tree.combine(first_stage[idx], result, group), row_index=idx
+            )
+        second_stage.extend(group_results)
+        per_group[group] = {"rows": len(idxs), "summary": summarize_results(group_results)}
+
+    return {
+        "results": results,
+        "row_groups": row_groups,
+        "stage_stats": {
+            "groups": summarize_results(first_stage),
+            "children": summarize_results(second_stage),
+            "per_group": per_group,
+        },
+    }
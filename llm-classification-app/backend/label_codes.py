@@ -0,0 +1,93 @@
+"""Compact label codes to cut output tokens.
+
+Category names can run to 5-15 tokens, and every answer repeats one.  With
+codes, `{label_options}` lists categories as "A1: <name>", the template's
+`{answer_format}` asks for codes instead of names, and the model answers
+"A1"; the code is mapped back to the canonical category before the result
+is built.  Only an answer that is nothing but known codes is decoded.
+"""
+
+import re
+from functools import lru_cache
+
+from backend.llm import count_tokens_for_prompt
+from backend.structured import extract_json_labels
+
+
+CODE_PREFIX = "A"
+CODE_INSTRUCTION = (
+    "- Answer with the category code only (e.g. {example}), not the category name.\n"
+    "- Return ONLY the code. No markdown fences, no commentary."
+)
+MULTI_CODE_INSTRUCTION = (
+    "- Answer with category codes only (e.g. {example}), not category names, "
+    "including wherever a format below asks for a category name."
+)
+
+_CODE_RE = re.compile(rf"{CODE_PREFIX}\d+")
+# Stripped from the ends of an answer before it is read as a code
+_EDGE_CHARS = " \t\r\n.,;:\"'`*"
+
+
+def make_label_codes(categories: list[str]) -> dict[str, str]:
+    """Map codes A1, A2, ... to categories, in category order."""
+    return {f"{CODE_PREFIX}{i}": cat for i, cat in enumerate(categories, start=1)}
+
+
+def render_coded_options(codes: dict[str, str]) -> str:
+    """The `{label_options}` block: one "code: category" line per category."""
+    return "\n".join(f"{code}: {cat}" for code, cat in codes.items())
+
+
+def coded_answer_format(
+    codes: dict[str, str], multi_label: bool = False, delimiter: str = "|"
+) -> str:
+    """The `{answer_format}` instruction asking for codes."""
+    example = list(codes)[:2] or [f"{CODE_PREFIX}1"]
+    if multi_label:
+        return MULTI_CODE_INSTRUCTION.format(example=delimiter.join(example))
+    return CODE_INSTRUCTION.format(example=example[0])
+
+
+def decode_label_codes(
+    raw: str, codes: dict[str, str], multi_label: bool = False, delimiter: str = "|"
+) -> str | list[str] | None:
+    """Map an answer made of codes back to categories.
+
+    The answer (or each label of a JSON or `delimiter`-separated
+    multi-label answer) must be a whole code from `codes`, ignoring case
+    and surrounding punctuation.  Returns None otherwise, so the caller
+    can fall back to matching category names.
+    """
+    labels = extract_json_labels(raw)
+    if labels is None:
+        labels = raw.split(delimiter) if multi_label else [raw]
+    found = []
+    for label in labels:
+        code = label.strip(_EDGE_CHARS).upper()
+        if not _CODE_RE.fullmatch(code) or code not in codes:
+            return None
+        found.append(codes[code])
+    if not found:
+        return None
+    if multi_label:
+        return list(dict.fromkeys(found))
+    return found[0]
+
+
+@lru_cache(maxsize=4096)
+def _tokens(text: str, model: str) -> int:
+    return count_tokens_for_prompt(text, model)
+
+
+def saved_output_tokens(
+    matched: str | list[str], codes: dict[str, str], model: str
+) -> int:
+    """Output tokens saved by answering with codes instead of names."""
+    by_label = {cat: code for code, cat in codes.items()}
+    labels = matched if isinstance(matched, list) else [matched]
+    return sum(
+        max(0, _tokens(label, model) - _tokens(by_label[label], model))
+        for label in labels
+        if label in by_label
+    )
@@ -0,0 +1,185 @@
+"""Single entry point for LLM completions.
+
+Every litellm completion in the backend goes through `complete` /
+`acomplete`, which consult the on-disk response cache and meter cache
+misses through the shared quota limiter.  Embeddings go through `embed` /
+`aembed`, metered the same way.
+"""
+
+import math
+import time
+from dataclasses import dataclass
+
+import litellm
+
+from backend.cache import get_response_cache, make_cache_key
+from backend.models import ModelConfig
+from backend.ratelimit import get_embedding_limiter, get_limiter
+from backend.tokens import count_tokens, estimate_text_tokens, record_usage
+
+
+@dataclass
+class LLMReply:
+    content: str
+    input_tokens: int
+    output_tokens: int
+    from_cache: bool = False
+    cached_tokens: int = 0  # input tokens served from the provider's prompt cache
+    # Sum of the answer's token logprobs, if they were requested and returned
+    logprob: float | None = None
+    # Seconds the provider took, excluding rate-limiter waits; 0 for cache hits
+    latency_s: float = 0.0
+
+    @property
+    def probability(self) -> float | None:
+        """The model's probability for its whole answer."""
+        return None if self.logprob is None else math.exp(self.logprob)
+
+
+def count_tokens_for_prompt(prompt_text: str, model_id: str) -> int:
+    """Count tokens for a prompt using litellm.
+
+    Falls back to the model's calibrated chars-per-token estimate if its
+    tokenizer isn't available (e.g. unsupported model, no download access).
+    See backend/tokens.py.
+    """
+    return count_tokens(prompt_text, model_id)
+
+
+def _message_text(messages: list[dict]) -> str:
+    return "\n".join(str(m.get("content", "")) for m in messages)
+
+
+def _cached_prompt_tokens(usage) -> int:
+    """Prompt-cache reads from a usage object (normalised by litellm)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def _answer_logprob(choice) -> float | None:
+    """Sum of the token logprobs in a choice, or None if there are none."""
+    logprobs = getattr(choice, "logprobs", None)
+    content = (
+        logprobs.get("content") if isinstance(logprobs, dict)
+        else getattr(logprobs, "content", None)
+    )
+    if not content:
+        return None
+    return sum(
+        token["logprob"] if isinstance(token, dict) else token.logprob
+        for token in content
+    )
+
+
+def _reply_from_response(response) -> LLMReply:
+    usage = response.usage
+    choice = response.choices[0]
+    return LLMReply(
+        content=(choice.message.content or "").strip(),
+        input_tokens=usage.prompt_tokens if usage else 0,
+        output_tokens=usage.completion_tokens if usage else 0,
+        cached_tokens=_cached_prompt_tokens(usage) if usage else 0,
+        logprob=_answer_logprob(choice),
+    )
+
+
+def _cached_reply(key: str) -> LLMReply | None:
+    hit = get_response_cache().get(key)
+    if hit is None:
+        return None
+    usage = hit["usage"]
+    return LLMReply(
+        content=hit["content"],
+        input_tokens=usage.get("input_tokens", 0),
+        output_tokens=usage.get("output_tokens", 0),
+        from_cache=True,
+        cached_tokens=usage.get("cached_tokens", 0),
+        logprob=usage.get("logprob"),
+    )
+
+
+def _store_reply(key: str, reply: LLMReply):
+    get_response_cache().put(
+        key,
+        reply.content,
+        {
+            "input_tokens": reply.input_tokens,
+            "output_tokens": reply.output_tokens,
+            "cached_tokens": reply.cached_tokens,
+            "logprob": reply.logprob,
+        },
+    )
+
+
+def complete(
+    model_config: ModelConfig,
+    messages: list[dict],
+    use_cache: bool = True,
+    **overrides,
+) -> LLMReply:
+    """Rate-limited, cached litellm.completion; `overrides` replace config kwargs."""
+    kwargs = model_config.to_litellm_kwargs()
+    kwargs.update(overrides)
+
+    key = make_cache_key(kwargs, messages) if use_cache else None
+    if key and (cached := _cached_reply(key)):
+        return cached
+
+    limiter = get_limiter(model_config)
+    text = _message_text(messages)
+    estimated = estimate_text_tokens(text, kwargs["model"])
+    limiter.acquire(estimated)
+
+    start = time.perf_counter()
+    response = litellm.completion(messages=messages, **kwargs)
+    reply = _reply_from_response(response)
+    reply.latency_s = time.perf_counter() - start
+    limiter.settle(estimated, reply.input_tokens)
+    record_usage(kwargs["model"], len(text), reply.input_tokens)
+    if key:
+        _store_reply(key, reply)
+    return reply
+
+
+async def acomplete(
+    model_config: ModelConfig,
+    messages: list[dict],
+    use_cache: bool = True,
+    **overrides,
+) -> LLMReply:
+    """Async variant of complete() using litellm.acompletion."""
+    kwargs = model_config.to_litellm_kwargs()
+    kwargs.update(overrides)
+
+    key = make_cache_key(kwargs, messages) if use_cache else None
+    if key and (cached := _cached_reply(key)):
+        return cached
+
+    limiter = get_limiter(model_config)
+    text = _message_text(messages)
+    estimated = estimate_text_tokens(text, kwargs["model"])
+    await limiter.aacquire(estimated)
+
+    start = time.perf_counter()
+    response = await litellm.acompletion(messages=messages, **kwargs)
+    reply = _reply_from_response(response)
+    reply.latency_s = time.perf_counter() - start
+    limiter.settle(estimated, reply.input_tokens)
+    record_usage(kwargs["model"], len(text), reply.input_tokens)
+    if key:
+        _store_reply(key, reply)
+    return reply
+
+
+def embed(model: str, texts: list[str]) -> list[list[float]]:
+    """Rate-limited litellm.embedding of one batch of texts."""
+    get_embedding_limiter(model).acquire()
+    response = litellm.embedding(model=model, input=texts)
+    return [item["embedding"] for item in response.data]
+
+
+async def aembed(model: str, texts: list[str]) -> list[list[float]]:
+    """Async variant of embed() using litellm.aembedding."""
+    await get_embedding_limiter(model).aacquire()
+    response = await litellm.aembedding(model=model, input=texts)
+    return [item["embedding"] for item in response.data]
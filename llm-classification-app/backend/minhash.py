@@ -0,0 +1,170 @@
+"""MinHash signatures and an LSH index for near-duplicate texts.
+
+Texts are normalised (lowercased, digits folded to "0", whitespace
+collapsed) so templated rows that differ only in IDs or amounts look
+alike, then split into character shingles.  A signature is the minimum of
+`num_perm` multiply-shift hashes over the shingles; the fraction of equal
+positions in two signatures estimates the Jaccard similarity of their
+shingle sets.  Shingles are hashed with crc32, not `hash()`, so signatures
+are the same in every process.
+
+`LSHIndex` splits signatures into bands; texts sharing any band are
+candidates, and candidates are then compared on their full signatures.
+Band sizes are chosen for the similarity threshold.  Bands are keyed by a
+64-bit hash computed for a whole block of signatures at once; a hash
+collision only adds a candidate, which the full comparison rejects.
+"""
+
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+
+DEFAULT_NUM_PERM = 128
+SHINGLE_SIZE = 5
+_MAX_HASH = np.uint32((1 << 32) - 1)
+_SHIFT = np.uint64(32)
+
+# Candidates are checked on their full signatures, so a missed pair costs
+# more than an extra candidate when choosing band sizes
+FALSE_NEGATIVE_WEIGHT = 0.8
+
+_DIGITS_RE = re.compile(r"\d")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _SPACE_RE.sub(" ", _DIGITS_RE.sub("0", text.lower())).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[str]:
+    """Character shingles of the normalised text (the whole text if shorter)."""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """Computes MinHash signatures with a fixed set of hash functions."""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # h(x) = (a * x + b) >> 32 with odd a: a universal family for
+        # 32-bit keys that needs no modulo
+        self._a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * 2 + 1
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """uint32 signature of `text`; all-max for empty text."""
+        grams = shingles(text)
+        if not grams:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        hashes = np.fromiter(
+            (zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams)
+        )
+        # uint64 overflow wraps, which the scheme relies on
+        permuted = (hashes[:, None] * self._a + self._b) >> _SHIFT
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def signatures(self, texts: list[str]) -> np.ndarray:
+        """One signature per text, stacked into a (len(texts), num_perm) array."""
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            out[i] = self.signature(text)
+        return out
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def _candidate_probability(s: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    return 1 - (1 - s ** rows) ** bands
+
+
+def choose_bands(
+    threshold: float, num_perm: int = DEFAULT_NUM_PERM
+) -> tuple[int, int]:
+    """(bands, rows per band) minimising the weighted false-positive area
+    below `threshold` and false-negative area above it, as in datasketch."""
+    below = np.linspace(0, threshold, 101)
+    above = np.linspace(threshold, 1, 101)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            # Areas on an even grid: mean height times width
+            fp = _candidate_probability(below, bands, rows).mean() * threshold
+            fn = (1 - _candidate_probability(above, bands, rows)).mean() * (1 - threshold)
+            error = (1 - FALSE_NEGATIVE_WEIGHT) * fp + FALSE_NEGATIVE_WEIGHT * fn
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+@lru_cache(maxsize=32)
+def _bands_for(threshold: float, num_perm: int) -> tuple[int, int]:
+    return choose_bands(threshold, num_perm)
+
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures, keyed by caller-chosen ids."""
+
+    def __init__(self, threshold: float, num_perm: int = DEFAULT_NUM_PERM):
+        self.threshold = threshold
+        self.bands, self.rows = _bands_for(threshold, num_perm)
+        self._buckets: list[dict[int, list]] = [{} for _ in range(self.bands)]
+        self._signatures: dict = {}
+        self._mix = np.random.default_rng(0).integers(
+            0, 1 << 63, size=self.rows, dtype=np.uint64
+        ) * 2 + 1
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(len(signatures), bands) band hashes of a block of signatures."""
+        bands = signatures[:, :self.bands * self.rows].reshape(
+            len(signatures), self.bands, self.rows
+        )
+        # uint64 overflow wraps, as in MinHasher
+        return (bands.astype(np.uint64) * self._mix).sum(axis=2, dtype=np.uint64)
+
+    def _keys_of(self, signature: np.ndarray, keys) -> list[int]:
+        if keys is None:
+            keys = self.band_keys(signature[None])[0]
+        return keys.tolist()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, key, signature: np.ndarray, band_keys: np.ndarray | None = None):
+        """Index `signature` under `key`; `band_keys` is its row of
+        band_keys() when already computed for a block."""
+        if key in self._signatures:
+            return
+        self._signatures[key] = signature
+        for bucket, band in zip(self._buckets, self._keys_of(signature, band_keys)):
+            bucket.setdefault(band, []).append(key)
+
+    def candidates(
+        self, signature: np.ndarray, band_keys: np.ndarray | None = None
+    ) -> set:
+        """Keys sharing at least one band with `signature`."""
+        found = set()
+        for bucket, band in zip(self._buckets, self._keys_of(signature, band_keys)):
+            found.update(bucket.get(band, ()))
+        return found
+
+    def query(
+        self, signature: np.ndarray, band_keys: np.ndarray | None = None
+    ) -> tuple[object, float] | None:
+        """The most similar indexed key at or above the threshold, with its
+        estimated similarity, or None."""
+        best = None
+        for key in self.candidates(signature, band_keys):
+            score = similarity(signature, self._signatures[key])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
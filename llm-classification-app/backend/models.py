@@ -15,6 +15,8 @@ class ModelConfig:
     temperature: float | None = None
     max_tokens: int = 40000
     thinking_level: str | None = None  # "low", "medium", "high" for supported models
+    prompt_caching: bool = True  # cache the system-message prompt prefix
+    logprobs: bool = True  # request answer logprobs where supported
     extra_params: dict = field(default_factory=dict)
 
     def to_litellm_kwargs(self) -> dict:
@@ -29,30 +31,62 @@ class ModelConfig:
         # Thinking / reasoning for models that support it.
         # "auto" = adaptive thinking (model chooses budget; Claude 4.5+ and Gemini 2.5+)
         # "low/medium/high" = extended thinking with explicit token budget
-        if self.thinking_level:
-            if "gemini" in self.model_id.lower():
-                if self.thinking_level == "auto":
-                    # Adaptive: let the model decide the budget
-                    kwargs["thinking"] = {"type": "enabled"}
-                else:
-                    budget_map = {"low": 1024, "medium": 8192, "high": 32768}
-                    kwargs["thinking"] = {
-                        "type": "enabled",
-                        "budget_tokens": budget_map.get(self.thinking_level, 8192),
-                    }
-            elif "claude" in self.model_id.lower():
-                if self.thinking_level == "auto":
-                    # Adaptive thinking (Claude 4.5+): model manages its own budget
-                    kwargs["thinking"] = {"type": "enabled"}
-                else:
-                    budget_map = {"low": 2048, "medium": 10000, "high": 32000}
-                    kwargs["thinking"] = {
-                        "type": "enabled",
-                        "budget_tokens": budget_map.get(self.thinking_level, 10000),
-                    }
+        if self.thinking_level and _thinking_budgets(self.model_id) is not None:
+            if self.thinking_level == "auto":
+                # Adaptive: let the model decide the budget
+                kwargs["thinking"] = {"type": "enabled"}
+            elif (budget := self.thinking_budget()) is not None:
+                kwargs["thinking"] = {"type": "enabled", "budget_tokens": budget}
+        # Explicit prefix caching: litellm marks the system message (the
+        # static prompt prefix) with cache_control. Anthropic caches it
+        # directly; for Gemini litellm creates a Vertex context cache, and
+        # skips it when the prefix is below the model's minimum size.
+        if self.prompt_caching and any(
+            name in self.model_id.lower() for name in ("claude", "gemini")
+        ):
+            kwargs["cache_control_injection_points"] = [
+                {"location": "message", "role": "system"}
+            ]
         kwargs.update(self.extra_params)
         return kwargs
 
+    def thinking_budget(self, planning: bool = False) -> int | None:
+        """Thinking-token budget for the configured level, or None.
+
+        "auto" has no fixed budget; with `planning` (for cost projections)
+        it is counted as the vendor's medium budget.
+        """
+        budgets = _thinking_budgets(self.model_id)
+        if not self.thinking_level or budgets is None:
+            return None
+        level = self.thinking_level
+        if level == "auto":
+            if not planning:
+                return None
+            level = "medium"
+        return budgets.get(level, budgets["medium"])
+
+    def supports_logprobs(self) -> bool:
+        """Whether to request token logprobs for classification answers.
+
+        Gemini returns them on Vertex; Claude and Llama don't support them.
+        """
+        return self.logprobs and "gemini" in self.model_id.lower()
+
+
+# Extended-thinking token budgets per level, by model family
+THINKING_BUDGETS = {
+    "gemini": {"low": 1024, "medium": 8192, "high": 32768},
+    "claude": {"low": 2048, "medium": 10000, "high": 32000},
+}
+
+
+def _thinking_budgets(model_id: str) -> dict[str, int] | None:
+    return next(
+        (b for family, b in THINKING_BUDGETS.items() if family in model_id.lower()),
+        None,
+    )
+
 
 # Thinking level options per vendor.
 # "auto" = adaptive thinking (model decides budget; Claude 4.5+ / Gemini 2.5+)
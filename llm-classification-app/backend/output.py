@@ -0,0 +1,163 @@
+"""Incremental output for streamed classification runs.
+
+`ResultSink` takes results in any order (as iter_classify yields them),
+re-orders them, and appends finished rows to a CSV or Parquet file in
+chunks.  Only the out-of-order results and the chunk being written are
+held in memory, so a run's footprint doesn't grow with the dataset.
+"""
+
+from collections.abc import Iterable
+from pathlib import Path
+
+import pandas as pd
+
+from backend.classifier import ClassificationResult, format_label
+
+
+OUTPUT_DIR = Path(__file__).parent.parent / "outputs"
+DEFAULT_CHUNK_SIZE = 1000
+SUPPORTED_FORMATS = ("csv", "parquet")
+
+
+class ResultSink:
+    """Writes source rows plus their classification to disk, in row order.
+
+    Results are buffered until the next `chunk_size` rows are contiguous,
+    then those rows of `source` are written with `column_name`,
+    `raw_response`, `match_score` and `confidence` columns added.
+    `source` is a DataFrame or an iterable of chunks (e.g. a second
+    `CsvDataset.chunks()` pass), consumed in step with the output so it's
+    never fully in memory.
+
+    CSV output is readable mid-run (each chunk is appended and flushed);
+    Parquet writes one row group per chunk and is only a valid file once
+    the sink is closed.
+
+    A result whose predecessors never arrive (e.g. the run crashed) stays
+    buffered and is not written; re-run with a checkpoint journal to fill
+    the gap.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        source: pd.DataFrame | Iterable[pd.DataFrame],
+        column_name: str = "classification",
+        multi_label: bool = False,
+        delimiter: str = "|",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        fmt: str | None = None,
+    ):
+        self.path = Path(path)
+        self.fmt = fmt or self.path.suffix.lstrip(".").lower()
+        if self.fmt not in SUPPORTED_FORMATS:
+            raise ValueError(
+                f"Unsupported output format '{self.fmt}', "
+                f"expected one of {SUPPORTED_FORMATS}"
+            )
+        self.source = source
+        self._source_chunks = (
+            None if isinstance(source, pd.DataFrame) else iter(source)
+        )
+        self._leftover: pd.DataFrame | None = None
+        self.column_name = column_name
+        self.multi_label = multi_label
+        self.delimiter = delimiter
+        self.chunk_size = max(1, chunk_size)
+        self.rows_written = 0
+
+        self._pending: dict[int, ClassificationResult] = {}
+        self._parquet_writer = None
+        self._parquet_schema = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def add(self, result: ClassificationResult):
+        self._pending[result.row_index] = result
+        while self._contiguous() >= self.chunk_size:
+            self._flush(self.chunk_size)
+
+    def _contiguous(self) -> int:
+        """Number of buffered results that directly follow what's written."""
+        count = 0
+        while self.rows_written + count in self._pending:
+            count += 1
+        return count
+
+    def _flush(self, count: int):
+        start = self.rows_written
+        results = [self._pending.pop(i) for i in range(start, start + count)]
+        chunk = self._source_rows(start, count)
+        chunk[self.column_name] = [
+            format_label(r, self.multi_label, self.delimiter) for r in results
+        ]
+        chunk["raw_response"] = [r.raw_response for r in results]
+        chunk["match_score"] = [r.match_score for r in results]
+        chunk["confidence"] = [r.confidence for r in results]
+        if self.fmt == "csv":
+            self._write_csv(chunk)
+        else:
+            self._write_parquet(chunk)
+        self.rows_written += count
+
+    def _source_rows(self, start: int, count: int) -> pd.DataFrame:
+        if self._source_chunks is None:
+            return self.source.iloc[start:start + count].copy()
+        # Rows are always taken in order, so just keep reading forward
+        parts, needed = [], count
+        while needed > 0:
+            if self._leftover is None or self._leftover.empty:
+                self._leftover = next(self._source_chunks, None)
+                if self._leftover is None:
+                    raise ValueError(
+                        f"Source ran out of rows before row {start + count - needed}"
+                    )
+            parts.append(self._leftover.iloc[:needed])
+            self._leftover = self._leftover.iloc[needed:]
+            needed -= len(parts[-1])
+        return pd.concat(parts).copy()
+
+    def _write_csv(self, chunk: pd.DataFrame):
+        first = self.rows_written == 0
+        chunk.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+
+    def _write_parquet(self, chunk: pd.DataFrame):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(
+                "Parquet output requires pyarrow: pip install pyarrow"
+            ) from e
+
+        if self._parquet_writer is None:
+            # Fix the schema from the first chunk; label columns are always
+            # strings even if every label in that chunk happened to be None.
+            schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+            for col in (self.column_name, "raw_response"):
+                schema = schema.set(
+                    schema.get_field_index(col), pa.field(col, pa.string())
+                )
+            for col in ("match_score", "confidence"):
+                schema = schema.set(
+                    schema.get_field_index(col), pa.field(col, pa.float64())
+                )
+            self._parquet_schema = schema
+            self._parquet_writer = pq.ParquetWriter(self.path, schema)
+        table = pa.Table.from_pandas(
+            chunk, schema=self._parquet_schema, preserve_index=False
+        )
+        self._parquet_writer.write_table(table)
+
+    def close(self):
+        """Write every remaining contiguous result and finalise the file."""
+        if count := self._contiguous():
+            self._flush(count)
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
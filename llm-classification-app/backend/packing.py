@@ -0,0 +1,210 @@
+"""Multi-row packed requests: classify K rows per LLM call.
+
+For short texts the fixed part of the prompt (instructions plus the full
+category list) dominates.  Packing sends it once for K rows, each tagged
+with an id, and asks for a JSON array of labels back.
+"""
+
+import json
+import re
+
+import litellm
+import pandas as pd
+
+from backend.dataset import row_texts
+from backend.fuzzy_match import get_matcher
+from backend.llm import count_tokens_for_prompt
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+from backend.sampling import sample_index
+
+
+# Hard cap on rows per request; beyond this answer quality drops off.
+MAX_PACK_SIZE = 50
+# Used when litellm doesn't know the model's context window.
+DEFAULT_CONTEXT_WINDOW = 128_000
+# Only plan to fill this fraction of the context window.
+CONTEXT_BUDGET_FRACTION = 0.5
+# Output tokens budgeted per item: id, label and JSON punctuation.
+ANSWER_TOKENS_PER_ITEM = 24
+
+# Kept ahead of the items so the whole prefix is identical across packs
+PACKED_OUTPUT_INSTRUCTIONS = """
+## Output format (overrides any format instructions above)
+- Classify EVERY item independently.
+- Return a JSON array with one object per item: {schema}
+- Use the category name EXACTLY as listed.
+- Return ONLY the JSON array. No markdown fences, no commentary.
+
+## Items
+Each item below is a separate document. In the task above, a placeholder \
+such as <{example}> refers to that field of each item.
+
+"""
+
+_SINGLE_SCHEMA = '[{"id": "<item id>", "label": "<category>"}, ...]'
+_MULTI_SCHEMA = '[{"id": "<item id>", "labels": ["<category>", ...]}, ...]'
+
+
+def _item_block(item_id: str, row: dict, columns: list[str]) -> str:
+    lines = [f"### Item {item_id}"]
+    for col in columns:
+        lines.append(f"<{col}>: {row.get(col, f'[missing:{col}]')}")
+    return "\n".join(lines)
+
+
+def render_packed_parts(
+    prompt_template: PromptTemplate,
+    items: list[tuple[str, dict]],
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+) -> tuple[str, str]:
+    """Render one prompt covering several rows, as (static prefix, items).
+
+    The user's template supplies the task and category list, with each
+    column placeholder standing in for "this field of every item".
+    `items` is a list of (item_id, row) pairs.
+    """
+    columns = prompt_template.columns_used
+    placeholder_row = {col: f"<{col}>" for col in columns}
+    task = prompt_template.render(placeholder_row, categories, multi_label, delimiter)
+    schema = _MULTI_SCHEMA if multi_label else _SINGLE_SCHEMA
+    prefix = task.rstrip() + "\n" + PACKED_OUTPUT_INSTRUCTIONS.format(
+        example=columns[0] if columns else "text",
+        schema=schema,
+    )
+    return prefix, "\n\n".join(_item_block(i, row, columns) for i, row in items)
+
+
+def render_packed_prompt(
+    prompt_template: PromptTemplate,
+    items: list[tuple[str, dict]],
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+) -> str:
+    """render_packed_parts joined into a single prompt."""
+    return "".join(render_packed_parts(
+        prompt_template, items, categories, multi_label, delimiter
+    ))
+
+
+def _extract_json_array(raw: str):
+    """Pull the first JSON array out of a response, tolerating fences/prose."""
+    text = re.sub(r"^```(?:json)?|```$", "", raw.strip(), flags=re.MULTILINE)
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_packed_response(
+    raw: str,
+    item_ids: list[str],
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+) -> dict[str, tuple[str, str | list[str], float]]:
+    """Map item ids to (raw label text, matched label, match score).
+
+    The score is the fuzzy match score (0-100; the weakest label's for
+    multi-label), as for single-row results.  Items the model skipped,
+    repeated, or answered with something that doesn't match a category are
+    left out so the caller can retry them individually.
+    """
+    parsed = _extract_json_array(raw)
+    if not isinstance(parsed, list):
+        return {}
+
+    matcher = get_matcher(categories)
+    expected = set(item_ids)
+    answers: dict[str, tuple[str, str | list[str], float]] = {}
+    for entry in parsed:
+        if not isinstance(entry, dict):
+            continue
+        item_id = str(entry.get("id", "")).strip()
+        if item_id not in expected or item_id in answers:
+            continue
+        if multi_label:
+            labels = entry.get("labels", entry.get("label"))
+            if isinstance(labels, str):
+                labels = [labels]
+            if not isinstance(labels, list):
+                continue
+            raw_label = delimiter.join(str(l) for l in labels)
+            matched, score = matcher.match_multi(raw_label, delimiter)
+            if not matched:
+                continue
+        else:
+            raw_label = str(entry.get("label", "")).strip()
+            matched, score = matcher.match(raw_label)
+            if matched is None:
+                continue
+        answers[item_id] = (raw_label, matched, score)
+    return answers
+
+
+def context_window(model_config: ModelConfig) -> int:
+    """Max input tokens for a model, from litellm's model map if known."""
+    try:
+        info = litellm.get_model_info("vertex_ai/" + model_config.model_id)
+        return info.get("max_input_tokens") or DEFAULT_CONTEXT_WINDOW
+    except Exception:
+        return DEFAULT_CONTEXT_WINDOW
+
+
+def choose_pack_size(
+    model_config: ModelConfig,
+    prefix_tokens: int,
+    row_tokens: float,
+    answer_tokens: int = ANSWER_TOKENS_PER_ITEM,
+) -> int:
+    """Pick K so K rows plus the shared prefix fit the context budget and
+    K answers fit in max_tokens."""
+    budget = context_window(model_config) * CONTEXT_BUDGET_FRACTION
+    by_input = (budget - prefix_tokens) / max(row_tokens, 1)
+    by_output = model_config.max_tokens / answer_tokens
+    return int(max(1, min(by_input, by_output, MAX_PACK_SIZE)))
+
+
+def estimate_pack_size(
+    df: pd.DataFrame,
+    model_config: ModelConfig,
+    prompt_template: PromptTemplate,
+    categories: list[str],
+    multi_label: bool = False,
+    delimiter: str = "|",
+    sample_size: int = 20,
+    method: str = "stratified",
+    seed: int = 0,
+) -> int:
+    """Choose a pack size from measured token counts on a sample of rows.
+
+    The sample is drawn by `method` (see sampling.sample_index), by default
+    stratified on the prompt columns' text length, so a sorted export's
+    long rows are represented.  Uses the largest sampled item rather than
+    the mean, so a pack of long rows still fits.
+    """
+    if df.empty:
+        return 1
+    model = "vertex_ai/" + model_config.model_id
+    columns = prompt_template.columns_used
+    lengths = pd.Series([len(text) for text in row_texts(df, columns)])
+    sample = df.iloc[sample_index(lengths, sample_size, method, seed=seed)]
+    prefix = render_packed_prompt(prompt_template, [], categories, multi_label, delimiter)
+    prefix_tokens = count_tokens_for_prompt(prefix, model)
+    item_tokens = [
+        count_tokens_for_prompt(_item_block(str(idx), row, columns), model)
+        for idx, row in enumerate(sample.to_dict("records"))
+    ]
+    return choose_pack_size(model_config, prefix_tokens, max(item_tokens))
+
+
+def split_usage(total: int, parts: int) -> list[int]:
+    """Split a token count into `parts` integer shares that sum to `total`."""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
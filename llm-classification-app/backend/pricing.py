@@ -13,6 +13,8 @@ class ModelPrice:
     input_per_mtok: float  # $ per million tokens
     output_per_mtok: float
     input_cached_per_mtok: float | None = None
+    rpm: int | None = None  # Vertex quota: requests per minute
+    tpm: int | None = None  # Vertex quota: input tokens per minute
 
     @property
     def input_per_token(self) -> float:
@@ -38,9 +40,12 @@ _PRICES_FILE = Path(__file__).parent / "llm_prices.json"
 def load_all_prices() -> dict[str, ModelPrice]:
     """Load pricing for all models, keyed by model id."""
     data = json.loads(_PRICES_FILE.read_text())
+    default_quotas = data.get("default_quotas", {})
     prices: dict[str, ModelPrice] = {}
     for entry in data.get("prices", []):
         model_id = entry["id"]
+        # Per-model quotas override the vendor-wide defaults
+        quotas = default_quotas.get(entry.get("vendor", ""), {})
         prices[model_id] = ModelPrice(
             model_id=model_id,
             name=entry.get("name", model_id),
@@ -48,6 +53,8 @@ def load_all_prices() -> dict[str, ModelPrice]:
             input_per_mtok=entry.get("input", 0),
             output_per_mtok=entry.get("output", 0),
             input_cached_per_mtok=entry.get("input_cached"),
+            rpm=entry.get("rpm", quotas.get("rpm")),
+            tpm=entry.get("tpm", quotas.get("tpm")),
         )
     return prices
 
@@ -79,6 +86,43 @@ def estimate_dataset_cost(
     return per_row * num_rows
 
 
+def estimate_dataset_cost_range(
+    price: ModelPrice,
+    token_info: dict,
+    avg_output_tokens: float,
+    num_rows: int,
+    thinking_tokens: int | None = None,
+    cached_input_tokens: int = 0,
+) -> dict:
+    """Low / expected / high cost for a dataset from estimate_tokens_from_sample.
+
+    The input side spans the estimate's confidence interval.  Thinking
+    tokens are billed as output; a thinking budget is a cap, so the low
+    end assumes none is used and the others assume all of it is.
+    """
+    low_in, high_in = token_info.get("input_tokens_ci") or (
+        token_info["avg_input_tokens"],
+    ) * 2
+    thinking = thinking_tokens or 0
+    return {
+        "low": estimate_dataset_cost(
+            price, low_in, avg_output_tokens, num_rows, cached_input_tokens
+        ),
+        "expected": estimate_dataset_cost(
+            price, token_info["avg_input_tokens"], avg_output_tokens + thinking,
+            num_rows, cached_input_tokens,
+        ),
+        "high": estimate_dataset_cost(
+            price, high_in, avg_output_tokens + thinking, num_rows,
+            cached_input_tokens,
+        ),
+    }
+
+
+def format_cost_range(costs: dict) -> str:
+    return f"{format_cost(costs['low'])} – {format_cost(costs['high'])}"
+
+
 def format_cost(cost: float) -> str:
     if cost < 0.01:
         return f"${cost:.4f}"
@@ -1,7 +1,38 @@
-"""Prompt template handling with {col} placeholders and {label_options}."""
+"""Prompt template handling with {col} placeholders and {label_options}.
 
+Everything before the first column placeholder is the same for every row.
+`render_parts` splits a prompt there so the static prefix (instructions and
+categories) can be sent as its own message and cached by the provider.
+
+`PromptTemplate.compile` parses the template once per category list into a
+`CompiledPrompt`, which renders single rows or whole DataFrames (column by
+column, without building a dict per row).
+
+`{answer_format}` is filled with the instruction on how to write the
+answer: use the category names exactly, or, with label codes, answer with
+the codes instead.
+"""
+
+import hashlib
 import re
 from dataclasses import dataclass, field
+from string import Formatter
+
+import pandas as pd
+
+from backend.label_codes import coded_answer_format, render_coded_options
+
+
+# Placeholders filled by the app rather than from a column
+SPECIAL_PLACEHOLDERS = ("label_options", "answer_format")
+
+NAME_ANSWER_FORMAT = (
+    "- Use the category name EXACTLY as listed — do not paraphrase or abbreviate.\n"
+    "- Return ONLY the category. No markdown fences, no commentary."
+)
+MULTI_NAME_ANSWER_FORMAT = (
+    "- Use the category name EXACTLY as listed — do not paraphrase or abbreviate."
+)
 
 
 DEFAULT_CLASSIFICATION_PROMPT = """
@@ -11,13 +42,12 @@ exactly ONE of the provided categories.
 ## Categories
 {label_options}
 
-## Document
-{text}
-
 ## Instructions
 - Return the single best-matching category from the list above.
-- Use the category name EXACTLY as listed — do not paraphrase or abbreviate.
-- Return ONLY the category. No markdown fences, no commentary.
+{answer_format}
+
+## Document
+{text}
 """
 
 DEFAULT_MULTI_LABEL_PROMPT = """
@@ -27,33 +57,142 @@ ALL categories that apply from the provided list.
 ## Categories
 {label_options}
 
-## Document
-{text}
-
 ## Instructions
 - For the document, return ALL categories that are relevant, separated by '|'.
 - A document may match one, or several.
 - Only include categories with meaningful relevance — do not force matches.
-- Use the category name EXACTLY as listed — do not paraphrase or abbreviate.
+{answer_format}
 - If no categories apply, return "Other". Do not return "Other" AND other categories.
 - Return your answer as valid JSON matching this schema:
 {{"categories": [{{"category": "<name>"}}, ...]}}
 - Return ONLY the JSON object.  No markdown fences, no commentary.
+
+## Document
+{text}
 """
 
 
+# Compiled variants kept per template (one per category list / options)
+_MAX_COMPILED = 16
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _column_strings(df: pd.DataFrame, col: str) -> list[str]:
+    """A column's values as the strings `str(value)` gives for each row."""
+    if col not in df.columns:
+        return [f"[missing:{col}]"] * len(df)
+    series = df[col]
+    # astype(str) drops the time from midnight timestamps; str() doesn't
+    if series.dtype.kind in "mM":
+        return series.map(str).tolist()
+    return series.astype(str).tolist()
+
+
+@dataclass
+class CompiledPrompt:
+    """A template parsed for one category list, ready to render rows.
+
+    `prefix` is the rendered static text before the first column placeholder
+    ("" if the template has none); the rest is kept as a positional format
+    string over `fields`, the column placeholders in order.  `error` is set
+    if the template has placeholders that can't be filled.
+    """
+    prefix: str
+    fields: list[str]
+    suffix_format: str
+    error: str | None = None
+
+    @classmethod
+    def build(
+        cls, template: str, columns: list[str], label_str: str,
+        answer_str: str = NAME_ANSWER_FORMAT,
+    ) -> "CompiledPrompt":
+        try:
+            parsed = list(Formatter().parse(template))
+        except ValueError as e:
+            return cls("", [], "", f"Error rendering prompt: {e}")
+        head, tail, fields = "", "", []
+        for literal, name, spec, conversion in parsed:
+            if fields:
+                tail += _escape(literal)
+            else:
+                head += literal
+            if name is None:
+                continue
+            plain = not spec and conversion is None
+            if plain and name in SPECIAL_PLACEHOLDERS:
+                text = label_str if name == "label_options" else answer_str
+                if fields:
+                    tail += _escape(text)
+                else:
+                    head += text
+            elif plain and name in columns:
+                tail += "{%d}" % len(fields)
+                fields.append(name)
+            else:
+                return cls("", [], "", f"Error rendering prompt: missing key '{name}'")
+        if not fields:
+            # No per-row part: the whole prompt is returned as the suffix
+            return cls("", [], _escape(head))
+        return cls(head, fields, tail)
+
+    def render_parts(self, row: dict) -> tuple[str, str]:
+        """(static prefix, per-row suffix) for one row."""
+        if self.error:
+            return "", self.error
+        values = [str(row.get(col, f"[missing:{col}]")) for col in self.fields]
+        return self.prefix, self.suffix_format.format(*values)
+
+    def render(self, row: dict) -> str:
+        return "".join(self.render_parts(row))
+
+    def render_frame_parts(self, df: pd.DataFrame) -> tuple[str, list[str]]:
+        """The static prefix and every row's suffix, rendered column-wise."""
+        if self.error:
+            return "", [self.error] * len(df)
+        fmt = self.suffix_format.format
+        if not self.fields:
+            return self.prefix, [fmt()] * len(df)
+        columns = [_column_strings(df, col) for col in self.fields]
+        return self.prefix, [fmt(*values) for values in zip(*columns)]
+
+    def render_frame(self, df: pd.DataFrame, as_arrow: bool = False):
+        """Full prompts for every row of `df`, in row order.
+
+        Returns a list of strings, or a pyarrow string array with `as_arrow`.
+        """
+        prefix, suffixes = self.render_frame_parts(df)
+        prompts = [prefix + suffix for suffix in suffixes] if prefix else suffixes
+        if not as_arrow:
+            return prompts
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError(
+                "Arrow output requires pyarrow: pip install pyarrow"
+            ) from e
+        return pa.array(prompts, type=pa.string())
+
+
 @dataclass
 class PromptTemplate:
     template: str
     columns_used: list[str] = field(default_factory=list)
+    _compiled: dict = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     def __post_init__(self):
         self.columns_used = self.extract_columns()
 
     def extract_columns(self) -> list[str]:
-        """Extract column placeholders from template, excluding label_options."""
+        """Extract column placeholders from template, excluding the
+        special placeholders."""
         placeholders = re.findall(r"\{(\w+)\}", self.template)
-        return [p for p in placeholders if p != "label_options"]
+        return [p for p in placeholders if p not in SPECIAL_PLACEHOLDERS]
 
     def validate(self, available_columns: list[str]) -> list[str]:
         """Validate template against available columns. Returns list of errors."""
@@ -74,28 +213,94 @@ class PromptTemplate:
                 "The placeholder {label_options} will be replaced with categories, "
                 "not the column value."
             )
+        if "answer_format" in available_columns:
+            warnings.append(
+                "⚠️ 'answer_format' is both a column name and a special placeholder. "
+                "The placeholder {answer_format} will be replaced with the answer "
+                "instruction, not the column value."
+            )
         return warnings
 
+    def split_point(self) -> int:
+        """Offset of the first column placeholder (len(template) if none)."""
+        for match in re.finditer(r"\{(\w+)\}", self.template):
+            if match.group(1) not in SPECIAL_PLACEHOLDERS:
+                return match.start()
+        return len(self.template)
+
+    def compile(
+        self, categories: list[str], multi_label: bool = False,
+        delimiter: str = "|", label_codes: dict[str, str] | None = None,
+    ) -> CompiledPrompt:
+        """Parse the template and render the label block, once per options.
+
+        With `label_codes` (see make_label_codes), categories are listed as
+        "A1: <name>" and `{answer_format}` asks the model to answer with
+        codes; a template without that placeholder carries no answer
+        instruction of its own.
+        """
+        key = (
+            self.template, tuple(categories), multi_label, delimiter,
+            tuple(label_codes.items()) if label_codes else None,
+        )
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            if label_codes:
+                label_str = render_coded_options(label_codes)
+                answer_str = coded_answer_format(label_codes, multi_label, delimiter)
+            else:
+                label_str = "\n".join(categories)
+                answer_str = MULTI_NAME_ANSWER_FORMAT if multi_label else NAME_ANSWER_FORMAT
+            if len(self._compiled) >= _MAX_COMPILED:
+                self._compiled.clear()
+            compiled = CompiledPrompt.build(
+                self.template, self.columns_used, label_str, answer_str
+            )
+            self._compiled[key] = compiled
+        return compiled
+
+    def render_parts(
+        self, row: dict, categories: list[str], multi_label: bool = False,
+        delimiter: str = "|", label_codes: dict[str, str] | None = None,
+    ) -> tuple[str, str]:
+        """Render the prompt as (static prefix, per-row suffix).
+
+        The prefix is identical for every row; the two parts concatenate to
+        `render()`.  A template without column placeholders has no per-row
+        part, so it is returned entirely as the suffix.
+        """
+        return self.compile(
+            categories, multi_label, delimiter, label_codes
+        ).render_parts(row)
+
     def render(
         self, row: dict, categories: list[str], multi_label: bool = False,
-        delimiter: str = "|",
+        delimiter: str = "|", label_codes: dict[str, str] | None = None,
     ) -> str:
         """Render the prompt for a specific row."""
-        label_str = "\n".join(categories)
-        values = {"label_options": label_str}
-        for col in self.columns_used:
-            values[col] = str(row.get(col, f"[missing:{col}]"))
-        try:
-            return self.template.format(**values)
-        except KeyError as e:
-            return f"Error rendering prompt: missing key {e}"
+        return "".join(self.render_parts(
+            row, categories, multi_label, delimiter, label_codes
+        ))
 
     def preview(
         self, first_row: dict, categories: list[str], multi_label: bool = False,
-        delimiter: str = "|",
+        delimiter: str = "|", label_codes: dict[str, str] | None = None,
     ) -> str:
         """Preview the prompt using the first row of data."""
-        return self.render(first_row, categories, multi_label, delimiter)
+        return self.render(first_row, categories, multi_label, delimiter, label_codes)
+
+
+def prompt_hash(prompt_text: str) -> str:
+    """Hash of a rendered prompt, used to spot identical requests."""
+    return hashlib.sha256(prompt_text.encode()).hexdigest()
+
+
+def build_messages(prompt_text: str, prefix: str = "") -> list[dict]:
+    """Chat messages for a prompt, with a static `prefix` as the system
+    message so providers can cache it across rows."""
+    messages = [{"role": "system", "content": prefix}] if prefix else []
+    messages.append({"role": "user", "content": prompt_text})
+    return messages
 
 
 FEEDBACK_PROMPT = """You are an expert in prompt engineering and text classification. 
@@ -115,6 +320,6 @@ Please evaluate and provide feedback on:
 3. **Missing Categories**: Is an "Other" or catch-all category needed?
 4. **Prompt Quality**: Any suggestions to improve classification accuracy?
 5. **Category Count**: Are there too many or too few categories?
-6. **RAG Recommendation**: If the prompt and categories are very long (combined >2000 tokens), recommend using RAG-based classification instead.
+6. **RAG Recommendation**: If the prompt and categories are very long (combined >2000 tokens), recommend shortlisting categories by embedding (RAG-based classification) so each row's prompt lists only the closest categories.
 
 Provide specific, actionable suggestions."""
@@ -0,0 +1,143 @@
+"""Process-wide, quota-aware rate limiting for LLM calls.
+
+Limiters live at module level, so every Streamlit session and every run in
+the same server process shares one budget per (model, region) and stays
+inside the Vertex project's RPM/TPM quotas together.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+from backend.models import ModelConfig
+
+
+# Used when the model registry has no quota for a model.
+DEFAULT_RPM = 60
+DEFAULT_TPM = 100_000
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` / 60s.
+
+    `reserve()` always debits the bucket (it may go negative) and returns how
+    long the caller must wait, so concurrent callers queue up fairly without
+    holding the lock while they sleep.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._level = min(
+            self.capacity, self._level + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Debit `amount` and return the number of seconds to wait before using it."""
+        # A single request larger than the bucket could never be satisfied
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+            if self._level >= 0:
+                return 0.0
+            return -self._level / self.rate
+
+    def credit(self, amount: float):
+        """Return `amount` to the bucket (negative amounts debit it)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._level
+
+
+class QuotaLimiter:
+    """Meters requests and estimated input tokens against RPM/TPM quotas."""
+
+    def __init__(self, rpm: int, tpm: int | None = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        delay = self.requests.reserve(1)
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        return delay
+
+    def acquire(self, estimated_tokens: int = 0):
+        """Block until a request of `estimated_tokens` fits within the quotas."""
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, estimated_tokens: int = 0):
+        """Async variant of acquire(); yields to the event loop while waiting."""
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real usage is known."""
+        if self.tokens is not None and actual_tokens:
+            self.tokens.credit(estimated_tokens - actual_tokens)
+
+    def snapshot(self) -> dict:
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "requests_available": self.requests.available,
+            "tokens_available": self.tokens.available if self.tokens else None,
+        }
+
+
+_limiters: dict[tuple[str, str], QuotaLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _shared_limiter(model_id: str, rpm: int, tpm: int | None) -> QuotaLimiter:
+    region = os.getenv("VERTEX_REGION") or ""
+    key = (model_id, region)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = QuotaLimiter(rpm, tpm)
+            _limiters[key] = limiter
+        return limiter
+
+
+def get_limiter(model_config: ModelConfig) -> QuotaLimiter:
+    """Return the shared limiter for a model in the configured Vertex region."""
+    price = model_config.price
+    return _shared_limiter(
+        model_config.model_id,
+        (price.rpm if price else None) or DEFAULT_RPM,
+        (price.tpm if price else None) or DEFAULT_TPM,
+    )
+
+
+def get_embedding_limiter(model: str) -> QuotaLimiter:
+    """Return the shared limiter for an embedding model.
+
+    Embedding quotas are per request, so only requests are metered.
+    """
+    return _shared_limiter(model, DEFAULT_RPM, None)
+
+
+def reset_limiters():
+    """Drop all shared limiters (e.g. after quotas change)."""
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,150 @@
+"""Embedding retrieval of candidate categories (RAG classification).
+
+With thousands of categories, the `{label_options}` block dominates every
+prompt.  A `CategoryIndex` embeds the categories once into a normalised
+NumPy matrix; each row's text is embedded (a block of rows per request)
+and only the `top_k` most similar categories are rendered into its
+prompt.  Answers are still matched against the full category list.
+
+The template is compiled with `LABEL_SLOT` standing in for the category
+block, and `fill_label_slot` swaps in each row's shortlist, keeping it out
+of the static prefix so the provider's prompt cache isn't written anew
+for every row.  During a run
+rows are embedded with `CategoryIndex.ashortlist`, through the embedding
+model's shared quota limiter and the engine's retry path.
+"""
+
+from collections.abc import Iterator
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+from backend.concurrency import DEFAULT_MAX_RETRIES, call_with_retries
+from backend.llm import aembed, embed
+
+
+DEFAULT_EMBEDDING_MODEL = "vertex_ai/text-embedding-004"
+DEFAULT_TOP_K = 20
+# Texts per embedding request (Vertex accepts up to 250)
+EMBED_BATCH_SIZE = 100
+# Category lists at least this long are worth shortlisting
+RECOMMENDED_MIN_CATEGORIES = 200
+
+# Stands in for the category block in a compiled template
+LABEL_SLOT = "\x00label_options\x00"
+
+
+def _normalised(vectors: list[list[float]], rows: int) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(rows, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _batches(texts: list[str], batch_size: int) -> Iterator[list[str]]:
+    for start in range(0, len(texts), batch_size):
+        yield [t or " " for t in texts[start:start + batch_size]]
+
+
+def embed_texts(
+    texts: list[str],
+    model: str = DEFAULT_EMBEDDING_MODEL,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> np.ndarray:
+    """Unit-length embeddings of `texts`, one row each (float32)."""
+    vectors = []
+    for batch in _batches(texts, batch_size):
+        vectors.extend(embed(model, batch))
+    return _normalised(vectors, len(texts))
+
+
+async def aembed_texts(
+    texts: list[str],
+    controller,
+    model: str = DEFAULT_EMBEDDING_MODEL,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> np.ndarray:
+    """Async embed_texts(); each batch takes a `controller` slot and is
+    retried on overloads like a completion."""
+    vectors = []
+    for batch in _batches(texts, batch_size):
+        vectors.extend(await call_with_retries(
+            lambda: aembed(model, batch), controller, max_retries,
+            # Embedding latency says nothing about completion latency
+            latency_of=lambda _: None,
+        ))
+    return _normalised(vectors, len(texts))
+
+
+@dataclass
+class CategoryIndex:
+    """Category embeddings for retrieving per-row shortlists."""
+    categories: list[str]
+    vectors: np.ndarray
+    model: str = DEFAULT_EMBEDDING_MODEL
+    top_k: int = DEFAULT_TOP_K
+
+    @classmethod
+    def build(
+        cls, categories: list[str], model: str = DEFAULT_EMBEDDING_MODEL,
+        top_k: int = DEFAULT_TOP_K,
+    ) -> "CategoryIndex":
+        return cls(list(categories), embed_texts(categories, model), model, top_k)
+
+    def shortlist_vectors(self, queries: np.ndarray) -> list[list[str]]:
+        """The `top_k` most similar categories for each query embedding,
+        listed in category order."""
+        k = min(self.top_k, len(self.categories))
+        if k == len(self.categories):
+            return [list(self.categories) for _ in range(len(queries))]
+        scores = queries @ self.vectors.T
+        top = np.sort(np.argpartition(-scores, k - 1, axis=1)[:, :k], axis=1)
+        return [[self.categories[i] for i in row] for row in top]
+
+    def shortlist(self, texts: list[str]) -> list[list[str]]:
+        """The `top_k` categories for each text, embedding the texts."""
+        if not texts:
+            return []
+        return self.shortlist_vectors(embed_texts(texts, self.model))
+
+    async def ashortlist(
+        self, texts: list[str], controller, max_retries: int = DEFAULT_MAX_RETRIES
+    ) -> list[list[str]]:
+        """Async shortlist(); see aembed_texts."""
+        if not texts:
+            return []
+        queries = await aembed_texts(texts, controller, self.model, max_retries=max_retries)
+        return self.shortlist_vectors(queries)
+
+
+@lru_cache(maxsize=8)
+def _cached_index(categories: tuple[str, ...], model: str) -> CategoryIndex:
+    return CategoryIndex.build(list(categories), model)
+
+
+def get_category_index(
+    categories: list[str], model: str = DEFAULT_EMBEDDING_MODEL,
+    top_k: int = DEFAULT_TOP_K,
+) -> CategoryIndex:
+    """A shared index for a category list, embedded on first use."""
+    index = _cached_index(tuple(categories), model)
+    return CategoryIndex(index.categories, index.vectors, model, top_k)
+
+
+def fill_label_slot(
+    prefix: str, suffixes: list[str], shortlists: list[list[str]]
+) -> list[tuple[str, str]]:
+    """(prefix, suffix) prompt parts for a block of rows rendered with
+    LABEL_SLOT, with each row's shortlist in place of the slot.
+
+    The prefix is sent as the provider-cached system message, so it must
+    be the same for every row: if the slot is in it, the prefix is cut
+    at the slot and the rest moves to the per-row suffix.
+    """
+    head, slot, tail = prefix.partition(LABEL_SLOT)
+    parts = []
+    for suffix, shortlist in zip(suffixes, shortlists):
+        options = "\n".join(shortlist)
+        parts.append((head, (slot + tail + suffix).replace(LABEL_SLOT, options)))
+    return parts
@@ -0,0 +1,70 @@
+"""Row sampling and interval estimates for token and cost projections.
+
+The first rows of an export are a poor sample when it's sorted (long
+documents clustered at the end), so estimates draw a random sample, or a
+length-stratified one that covers short and long rows in proportion.
+"""
+
+import math
+from statistics import NormalDist
+
+import pandas as pd
+
+
+SAMPLE_METHODS = ("stratified", "random", "head")
+DEFAULT_STRATA = 5
+
+
+def sample_index(
+    lengths: pd.Series,
+    n: int,
+    method: str = "stratified",
+    strata: int = DEFAULT_STRATA,
+    seed: int = 0,
+) -> pd.Index:
+    """Index labels of `n` rows, chosen by `method`.
+
+    "stratified" splits rows into `strata` equal-sized bands of `lengths`
+    and samples each band in proportion; "random" is a simple random
+    sample; "head" takes the first rows.
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f"Unknown sample method '{method}', expected one of {SAMPLE_METHODS}")
+    n = min(n, len(lengths))
+    if method == "head" or n == len(lengths):
+        return lengths.index[:n]
+    if method == "random" or n < strata:
+        return lengths.sample(n=n, random_state=seed).index
+
+    bands = pd.qcut(lengths.rank(method="first"), strata, labels=False)
+    chosen = []
+    for band, size in bands.value_counts().sort_index().items():
+        # Round per band, then top up or trim so the total is exactly n
+        take = max(1, round(n * size / len(lengths)))
+        chosen.append(lengths[bands == band].sample(n=min(take, size), random_state=seed))
+    picked = pd.concat(chosen)
+    if len(picked) > n:
+        picked = picked.sample(n=n, random_state=seed)
+    elif len(picked) < n:
+        rest = lengths.drop(picked.index)
+        picked = pd.concat([picked, rest.sample(n=n - len(picked), random_state=seed)])
+    return picked.index
+
+
+def mean_standard_error(values: pd.Series, population: int | None = None) -> float:
+    """Standard error of the mean of `values`, with the finite population
+    correction when they're a sample of `population` rows."""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    se = float(values.std(ddof=1)) / math.sqrt(n)
+    if population and population > n:
+        se *= math.sqrt((population - n) / (population - 1))
+    elif population:
+        se = 0.0
+    return se
+
+
+def z_score(confidence: float) -> float:
+    """Two-sided normal critical value, e.g. 1.96 for 0.95."""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
@@ -0,0 +1,69 @@
+"""Near-duplicate cache: reuse labels for rows similar to ones already sent.
+
+Exact duplicates are handled by dedup (same rendered prompt).  Templated
+rows that differ only in names or IDs render differently, so this cache
+keys rows on a MinHash signature of their prompt column values instead:
+a row whose estimated Jaccard similarity to a labelled row reaches
+`threshold` takes that row's result, with source "semantic", and no
+request is made.  Only results that matched a category are stored.
+
+A cache lives for one run; `stats()` reports its hit rate.
+"""
+
+import threading
+
+from backend.minhash import DEFAULT_NUM_PERM, LSHIndex, MinHasher
+
+
+DEFAULT_SEMANTIC_THRESHOLD = 0.85
+
+
+class SemanticCache:
+    """In-memory MinHash LSH index of labelled row texts."""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_SEMANTIC_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+    ):
+        self.threshold = threshold
+        self._hasher = MinHasher(num_perm)
+        self._index = LSHIndex(threshold, num_perm)
+        self._results: dict[int, object] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def lookup(self, text: str):
+        """(stored result, similarity) for the closest labelled text at or
+        above the threshold, or None.  Blank texts never match."""
+        if not text.strip():
+            return None
+        signature = self._hasher.signature(text)
+        with self._lock:
+            self.lookups += 1
+            found = self._index.query(signature)
+            if found is None:
+                return None
+            self.hits += 1
+            key, score = found
+            return self._results[key], score
+
+    def add(self, text: str, result):
+        """Store a labelled row's result for later near-duplicates."""
+        if not text.strip():
+            return
+        signature = self._hasher.signature(text)
+        with self._lock:
+            key = len(self._results)
+            self._results[key] = result
+            self._index.add(key, signature)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "entries": len(self._results),
+            }
@@ -0,0 +1,93 @@
+"""Schema-constrained classification output.
+
+`response_format` builds a JSON schema whose labels are an enum of the
+categories.  litellm translates it per provider (Gemini `response_schema`,
+a forced tool call for Claude), so the model can only answer with a valid
+category and `decode_structured` reads the label straight from the JSON.
+Fuzzy matching is only needed when decoding fails.
+"""
+
+import json
+import re
+
+
+def response_format(categories: list[str], multi_label: bool = False) -> dict:
+    """OpenAI-style `response_format` constraining the answer to `categories`."""
+    label = {"type": "string", "enum": list(categories)}
+    if multi_label:
+        properties = {"labels": {"type": "array", "items": label}}
+        required = ["labels"]
+    else:
+        properties = {"label": label}
+        required = ["label"]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "classification",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": required,
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def _load_json(raw: str):
+    text = re.sub(r"^```(?:json)?|```$", "", raw.strip(), flags=re.MULTILINE).strip()
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, ValueError):
+        return None
+
+
+def decode_structured(
+    raw: str, categories: list[str], multi_label: bool = False
+) -> str | list[str] | None:
+    """Read the label(s) from a schema-constrained reply.
+
+    Returns None unless the reply is valid JSON whose labels are all exact
+    categories, so the caller can fall back to fuzzy matching.
+    """
+    parsed = _load_json(raw)
+    if not isinstance(parsed, dict):
+        return None
+    allowed = set(categories)
+    if multi_label:
+        labels = parsed.get("labels")
+        if not isinstance(labels, list) or not all(l in allowed for l in labels):
+            return None
+        return list(dict.fromkeys(labels))
+    label = parsed.get("label")
+    return label if label in allowed else None
+
+
+def extract_json_labels(raw: str) -> list[str] | None:
+    """Pull label strings out of a JSON answer of any common shape.
+
+    Handles `["a", "b"]`, `{"label": "a"}`, `{"labels": [...]}` and the
+    default multi-label prompt's `{"categories": [{"category": "a"}]}`.
+    Returns None if the reply isn't JSON, so free text is left to the
+    delimiter splitter.
+    """
+    parsed = _load_json(raw)
+    if isinstance(parsed, dict):
+        for key in ("labels", "categories", "label", "category"):
+            if key in parsed:
+                parsed = parsed[key]
+                break
+        else:
+            return None
+    if isinstance(parsed, str):
+        parsed = [parsed]
+    if not isinstance(parsed, list):
+        return None
+    labels = []
+    for item in parsed:
+        if isinstance(item, dict):
+            item = item.get("category", item.get("label"))
+        if isinstance(item, str) and item.strip():
+            labels.append(item.strip())
+    return labels
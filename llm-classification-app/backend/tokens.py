@@ -0,0 +1,144 @@
+"""Fast, calibrated token estimates.
+
+`litellm.token_counter` is exact but slow, and some tokenizers need a
+download we can't do offline.  Here the static part of a prompt is counted
+once with the tokenizer (cached per model family, and skipped for good if
+it can't be loaded), while row text is estimated from its character count
+over a chars-per-token ratio.  Ratios start from per-family defaults and
+are calibrated per model from the prompt tokens providers actually bill
+(`record_usage`, called by backend/llm.py after every completion).
+"""
+
+import threading
+from collections.abc import Callable
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import litellm
+import pandas as pd
+
+if TYPE_CHECKING:
+    # backend.prompt imports backend.llm, which imports this module
+    from backend.prompt import PromptTemplate
+
+
+# Starting chars-per-token ratios, used until a model has been calibrated
+DEFAULT_CHARS_PER_TOKEN = {"gemini": 4.0, "claude": 3.5, "llama": 3.8}
+FALLBACK_CHARS_PER_TOKEN = 4.0
+# Billed prompt tokens needed before a model's measured ratio is trusted
+MIN_CALIBRATION_TOKENS = 2000
+
+
+def model_family(model: str) -> str:
+    """Tokenizer family of a model id ("gemini", "claude", "llama" or "other")."""
+    name = model.lower().rsplit("/", 1)[-1]
+    return next((f for f in DEFAULT_CHARS_PER_TOKEN if f in name), "other")
+
+
+# family -> exact counter, or None if its tokenizer couldn't be loaded
+_tokenizers: dict[str, Callable[[str], int] | None] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def _tokenizer(model: str) -> Callable[[str], int] | None:
+    family = model_family(model)
+    with _tokenizers_lock:
+        if family not in _tokenizers:
+            try:
+                litellm.token_counter(model=model, text="probe")
+            except Exception:
+                _tokenizers[family] = None
+            else:
+                _tokenizers[family] = lambda text: litellm.token_counter(
+                    model=model, text=text
+                )
+        return _tokenizers[family]
+
+
+# model -> [chars sent, prompt tokens billed]
+_usage: dict[str, list[int]] = {}
+_usage_lock = threading.Lock()
+
+
+def record_usage(model: str, chars: int, prompt_tokens: int):
+    """Calibrate `model`'s ratio with a request's size and billed tokens."""
+    if chars <= 0 or prompt_tokens <= 0:
+        return
+    with _usage_lock:
+        totals = _usage.setdefault(model, [0, 0])
+        totals[0] += chars
+        totals[1] += prompt_tokens
+
+
+def chars_per_token(model: str) -> float:
+    """Calibrated ratio for `model`, or its family default."""
+    with _usage_lock:
+        chars, tokens = _usage.get(model, (0, 0))
+    if tokens >= MIN_CALIBRATION_TOKENS:
+        return chars / tokens
+    return DEFAULT_CHARS_PER_TOKEN.get(model_family(model), FALLBACK_CHARS_PER_TOKEN)
+
+
+def reset_calibration():
+    """Forget measured ratios and cached tokenizers."""
+    with _usage_lock:
+        _usage.clear()
+    with _tokenizers_lock:
+        _tokenizers.clear()
+    _exact_count.cache_clear()
+
+
+def estimate_text_tokens(text: str, model: str) -> int:
+    """Ratio-based estimate; no tokenizer call."""
+    return round(len(text) / chars_per_token(model))
+
+
+@lru_cache(maxsize=1024)
+def _exact_count(text: str, model: str) -> int | None:
+    counter = _tokenizer(model)
+    if counter is None:
+        return None
+    try:
+        return counter(text)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokenizer count where the family's tokenizer is available, else an
+    estimate.  Exact counts are cached, so static prompt text is only
+    tokenized once."""
+    exact = _exact_count(text, model)
+    return exact if exact is not None else estimate_text_tokens(text, model)
+
+
+def estimate_row_tokens(
+    df: pd.DataFrame,
+    prompt_template: "PromptTemplate",
+    categories: list[str],
+    model: str,
+    multi_label: bool = False,
+    delimiter: str = "|",
+) -> tuple[pd.Series, int]:
+    """Estimated input tokens for every row, vectorised.
+
+    Returns (per-row estimates, tokens in the static prefix).  The prompt
+    with its columns left empty is counted once; each row adds the length
+    of its column values over the model's chars-per-token ratio.
+    """
+    empty_row = {col: "" for col in prompt_template.columns_used}
+    prefix, suffix = prompt_template.render_parts(
+        empty_row, categories, multi_label, delimiter
+    )
+    static_tokens = count_tokens(prefix + suffix, model)
+    prefix_tokens = count_tokens(prefix, model) if prefix else 0
+
+    chars = pd.Series(0, index=df.index)
+    # A column used twice in the template is sent twice
+    for col in prompt_template.columns_used:
+        if col in df.columns:
+            chars += df[col].astype(str).str.len()
+        else:
+            chars += len(f"[missing:{col}]")
+    row_tokens = (chars / chars_per_token(model)).round().astype(int)
+    return static_tokens + row_tokens, prefix_tokens
@@ -0,0 +1,117 @@
+"""Benchmark the greedy cluster assignment of MinHash signatures.
+
+Run from llm-classification-app/:
+
+    python benchmarks/cluster_rows.py [rows]
+
+Signatures are computed once up front (in production they come from
+worker processes), so only the sequential assignment in the main process
+is timed.  "before" is the original path: an LSH query per row with band
+keys built from bytes slices.  "after" is clustering's block assignment:
+repeated signatures collapsed per block and band keys hashed in one numpy
+pass.  Rows are templated messages and random word lists, a share
+`duplicates` of them repeating an earlier row exactly.  "agree" is the
+share of rows given the same representative by both; a repeat takes its
+block's first occurrence's assignment, where the per-row path could pick
+a closer representative added in between.
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.clustering import (  # noqa: E402
+    DEFAULT_CLUSTER_THRESHOLD,
+    SIGNATURE_BLOCK_ROWS,
+    _assign_clusters,
+)
+from backend.minhash import LSHIndex, MinHasher, similarity  # noqa: E402
+
+TEMPLATES = [
+    "Dear {name}, your refund for order {order} has been approved and will "
+    "reach your account within five working days.",
+    "Hi {name}, order {order} has shipped and should arrive by {day}.",
+    "{name} wrote: my laptop from order {order} arrived with a cracked screen.",
+    "Where is order {order}? Tracking has not updated since {day}. - {name}",
+]
+NAMES = "John Maria Li Aisha Tom Sven Priya Kofi Elena Omar".split()
+DAYS = "Monday Tuesday Wednesday Thursday Friday".split()
+WORDS = "account billing card delivery fraud invoice loan payment refund travel".split()
+
+
+def make_texts(n: int, duplicates: float, rng: random.Random) -> list[str]:
+    texts = []
+    for _ in range(n):
+        if texts and rng.random() < duplicates:
+            texts.append(rng.choice(texts))
+        elif rng.random() < 0.5:
+            texts.append(rng.choice(TEMPLATES).format(
+                name=rng.choice(NAMES), order=rng.randint(1, 10**6), day=rng.choice(DAYS),
+            ))
+        else:
+            texts.append(" ".join(rng.choices(WORDS, k=12)))
+    return texts
+
+
+def assign_per_row(signatures: np.ndarray, threshold: float) -> list[int]:
+    index = LSHIndex(threshold)
+    buckets = [{} for _ in range(index.bands)]
+    kept = {}
+    ids = []
+    for row, signature in enumerate(signatures):
+        keys = [
+            signature[i * index.rows:(i + 1) * index.rows].tobytes()
+            for i in range(index.bands)
+        ]
+        candidates = set()
+        for bucket, key in zip(buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        best = None
+        for key in candidates:
+            score = similarity(signature, kept[key])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (key, score)
+        if best is None:
+            kept[row] = signature
+            for bucket, key in zip(buckets, keys):
+                bucket.setdefault(key, []).append(row)
+            ids.append(row)
+        else:
+            ids.append(best[0])
+    return ids
+
+
+def assign_blocks(signatures: np.ndarray, threshold: float) -> list[int]:
+    blocks = (
+        signatures[i:i + SIGNATURE_BLOCK_ROWS]
+        for i in range(0, len(signatures), SIGNATURE_BLOCK_ROWS)
+    )
+    return _assign_clusters(blocks, threshold).tolist()
+
+
+def rows_per_second(fn, signatures) -> tuple[float, list[int]]:
+    start = time.perf_counter()
+    ids = fn(signatures, DEFAULT_CLUSTER_THRESHOLD)
+    return len(signatures) / (time.perf_counter() - start), ids
+
+
+def main(num_rows: int = 50_000):
+    rng = random.Random(0)
+    print(f"rows: {num_rows}")
+    print(f"{'duplicates':>10}  {'before/s':>12}  {'after/s':>12}  {'speed-up':>8}  {'agree':>6}")
+    for duplicates in (0.0, 0.5, 0.9):
+        signatures = MinHasher().signatures(make_texts(num_rows, duplicates, rng))
+        before, expected = rows_per_second(assign_per_row, signatures)
+        after, got = rows_per_second(assign_blocks, signatures)
+        agree = sum(a == b for a, b in zip(expected, got)) / num_rows
+        print(f"{duplicates:>10.0%}  {before:>12,.0f}  {after:>12,.0f}  "
+              f"{after / before:>7.1f}x  {agree:>6.1%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,92 @@
+"""Benchmark fuzzy matching against 10, 1k and 10k categories.
+
+Run from llm-classification-app/:
+
+    python benchmarks/match_categories.py [answers]
+
+"before" is the original path: a case-insensitive scan for an exact hit,
+then `process.extractOne` over the full list, for every answer.
+"after" is `CategoryMatcher.match_many` on a fresh matcher (so its answer
+cache starts empty): cdist over all categories for small lists, the
+trigram index for large ones.  Answers are a mix of exact labels, case
+changes and one-character typos.
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+from rapidfuzz import fuzz, process
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.fuzzy_match import CategoryMatcher  # noqa: E402
+
+WORDS = (
+    "account billing card claim delivery engine fraud garden hardware invoice "
+    "journey kitchen loan mortgage network order payment quality refund "
+    "security shipping software travel upgrade vehicle warranty"
+).split()
+
+
+def make_categories(n: int, rng: random.Random) -> list[str]:
+    categories = set()
+    while len(categories) < n:
+        categories.add(" ".join(rng.sample(WORDS, 3)).title() + f" {rng.randint(1, 999)}")
+    return sorted(categories)
+
+
+def make_answers(categories: list[str], n: int, rng: random.Random) -> list[str]:
+    answers = []
+    for _ in range(n):
+        label = rng.choice(categories)
+        kind = rng.random()
+        if kind < 0.4:
+            answers.append(label)
+        elif kind < 0.6:
+            answers.append(label.lower())
+        else:
+            i = rng.randrange(len(label))
+            answers.append(label[:i] + label[i + 1:])
+    return answers
+
+
+def match_per_answer(categories: list[str], answers: list[str]) -> list:
+    results = []
+    for answer in answers:
+        text = answer.strip()
+        exact = next((c for c in categories if c.lower() == text.lower()), None)
+        if exact:
+            results.append(exact)
+            continue
+        found = process.extractOne(text, categories, scorer=fuzz.ratio, score_cutoff=60)
+        results.append(found[0] if found else None)
+    return results
+
+
+def match_with_matcher(categories: list[str], answers: list[str]) -> list:
+    return [m for m, _ in CategoryMatcher(categories).match_many(answers)]
+
+
+def answers_per_second(fn, categories, answers) -> tuple[float, list]:
+    start = time.perf_counter()
+    results = fn(categories, answers)
+    return len(answers) / (time.perf_counter() - start), results
+
+
+def main(num_answers: int = 2000):
+    rng = random.Random(0)
+    print(f"answers: {num_answers}")
+    print(f"{'categories':>10}  {'before/s':>12}  {'after/s':>12}  {'speed-up':>8}  {'agree':>6}")
+    for n in (10, 1_000, 10_000):
+        categories = make_categories(n, rng)
+        answers = make_answers(categories, num_answers, rng)
+        before, expected = answers_per_second(match_per_answer, categories, answers)
+        after, got = answers_per_second(match_with_matcher, categories, answers)
+        agree = sum(a == b for a, b in zip(expected, got)) / len(answers)
+        print(f"{n:>10,}  {before:>12,.0f}  {after:>12,.0f}  {after / before:>7.1f}x  {agree:>6.1%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,63 @@
+"""Benchmark prompt rendering: per-row str.format vs the compiled template.
+
+Run from llm-classification-app/:
+
+    python benchmarks/render_prompts.py [rows]
+
+"before" is the original path: `df.iterrows()` + `row.to_dict()` and a
+`str.format` call with the category list re-joined for every row.
+"after" is `PromptTemplate.compile(...).render_frame(df)`.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.prompt import DEFAULT_CLASSIFICATION_PROMPT, PromptTemplate  # noqa: E402
+
+CATEGORIES = [f"Category number {i}" for i in range(40)]
+
+
+def render_per_row(template: PromptTemplate, df: pd.DataFrame) -> list[str]:
+    prompts = []
+    for _, row in df.iterrows():
+        row = row.to_dict()
+        values = {"label_options": "\n".join(CATEGORIES)}
+        for col in template.columns_used:
+            values[col] = str(row.get(col, f"[missing:{col}]"))
+        prompts.append(template.template.format(**values))
+    return prompts
+
+
+def render_compiled(template: PromptTemplate, df: pd.DataFrame) -> list[str]:
+    return template.compile(CATEGORIES).render_frame(df)
+
+
+def rows_per_second(fn, template: PromptTemplate, df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    fn(template, df)
+    return len(df) / (time.perf_counter() - start)
+
+
+def main(rows: int = 200_000):
+    df = pd.DataFrame({
+        "text": [f"Document {i}: " + "lorem ipsum dolor sit amet " * 8 for i in range(rows)],
+        "source": ["web", "email", "chat", "phone"] * (rows // 4) + ["web"] * (rows % 4),
+    })
+    template = PromptTemplate(DEFAULT_CLASSIFICATION_PROMPT)
+    assert render_per_row(template, df.head(100)) == render_compiled(template, df.head(100))
+
+    before = rows_per_second(render_per_row, template, df)
+    after = rows_per_second(render_compiled, template, df)
+    print(f"rows: {rows}")
+    print(f"before (iterrows + str.format): {before:>12,.0f} rows/s")
+    print(f"after  (compiled, column-wise): {after:>12,.0f} rows/s")
+    print(f"speed-up: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,31 @@
+"""Shared test fixtures and helpers."""
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from backend.ratelimit import reset_limiters
+from backend.tokens import reset_calibration
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path):
+    """Per-test response cache, quota limiters and token calibration, so no
+    test's requests throttle or skew estimates in the next."""
+    reset_limiters()
+    reset_calibration()
+    with patch("backend.cache.CACHE_DIR", tmp_path / "cache"):
+        yield tmp_path
+    reset_limiters()
+    reset_calibration()
+
+
+def make_response(content: str, prompt_tokens: int = 10, completion_tokens: int = 2):
+    """A litellm-style completion response."""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        ),
+    )
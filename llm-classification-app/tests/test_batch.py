@@ -3,6 +3,7 @@
 import json
 import tempfile
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import patch
 
 import pytest
@@ -12,7 +13,11 @@ from backend.batch import (
     update_batch_status,
     load_tracked_batches,
     cleanup_batch,
+    iter_batch_requests,
+    iter_duplicate_rows,
     prepare_batch_requests,
+    retrieve_batch_results,
+    write_batch_requests,
     BATCH_STATE_DIR,
 )
 from backend.models import ModelConfig
@@ -73,3 +78,88 @@ class TestPrepareRequests:
         assert requests[0]["custom_id"] == "row-0"
         assert requests[1]["custom_id"] == "row-1"
         assert "Hello" in requests[0]["body"]["messages"][0]["content"]
+
+    def test_prepare_dedups_identical_prompts(self):
+        df = pd.DataFrame({"text": ["Hello", "World", "Hello"]})
+        config = ModelConfig(
+            model_id="gemini-2.0-flash",
+            display_name="Gemini 2.0 Flash",
+            vendor="Google",
+        )
+        template = PromptTemplate("Classify: {text}. Categories: {label_options}")
+        requests = prepare_batch_requests(df, config, template, ["A", "B"])
+        assert [r["custom_id"] for r in requests] == ["row-0", "row-1"]
+
+    def test_prepare_from_chunks(self):
+        df = pd.DataFrame({"text": ["Hello", "World", "Hello"]})
+        config = ModelConfig(
+            model_id="gemini-2.0-flash",
+            display_name="Gemini 2.0 Flash",
+            vendor="Google",
+        )
+        template = PromptTemplate("Classify: {text}. Categories: {label_options}")
+        requests = list(iter_batch_requests(
+            [df.iloc[:2], df.iloc[2:]], config, template, ["A", "B"]
+        ))
+        assert requests[2] == {"custom_id": "row-0", "duplicate_row": 2}
+        duplicates = iter_duplicate_rows(
+            [df.iloc[:1], df.iloc[1:]], template, ["A", "B"]
+        )
+        assert list(duplicates) == [(2, "row-0")]
+
+    def test_prepare_without_dedup(self):
+        df = pd.DataFrame({"text": ["Hello", "Hello"]})
+        config = ModelConfig(
+            model_id="gemini-2.0-flash",
+            display_name="Gemini 2.0 Flash",
+            vendor="Google",
+        )
+        template = PromptTemplate("Classify: {text}. Categories: {label_options}")
+        requests = prepare_batch_requests(
+            df, config, template, ["A"], dedup=False
+        )
+        assert len(requests) == 2
+
+    def test_write_streams_requests(self, tmp_path):
+        df = pd.DataFrame({"text": ["Hello", "World", "Hello"]})
+        config = ModelConfig(
+            model_id="gemini-2.0-flash",
+            display_name="Gemini 2.0 Flash",
+            vendor="Google",
+        )
+        template = PromptTemplate("Classify: {text}. Categories: {label_options}")
+        requests = iter_batch_requests(
+            [df.iloc[:2], df.iloc[2:]], config, template, ["A", "B"]
+        )
+        path = tmp_path / "requests.jsonl"
+        counts = write_batch_requests(requests, path)
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["custom_id"] for line in lines] == ["row-0", "row-1"]
+        assert all("duplicate_row" not in line for line in lines)
+        assert counts == {"num_requests": 2, "num_rows": 3}
+
+
+class TestRetrieveResults:
+    def test_copies_answers_to_rebuilt_duplicates(self, temp_batch_dir):
+        df = pd.DataFrame({"text": ["Hello", "World", "Hello"]})
+        template = PromptTemplate("Classify: {text}. Categories: {label_options}")
+        save_batch_id("dedup-batch", {"num_requests": 2, "num_rows": 3,
+                                      "dedup_saved_requests": 1})
+        lines = [
+            {"custom_id": f"row-{idx}", "response": {"body": {
+                "choices": [{"message": {"content": label}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 1},
+            }}}
+            for idx, label in [(0, "A"), (1, "B")]
+        ]
+        batch = SimpleNamespace(status="completed", output_file_id="out")
+        content = SimpleNamespace(text="\n".join(json.dumps(line) for line in lines))
+        with patch("backend.batch.litellm.retrieve_batch", return_value=batch), \
+                patch("backend.batch.litellm.file_content", return_value=content):
+            results = retrieve_batch_results(
+                "dedup-batch", ["A", "B"],
+                data=[df.iloc[:2], df.iloc[2:]], prompt_template=template,
+            )
+        assert [r["row_index"] for r in results] == [0, 1, 2]
+        assert [r["matched_label"] for r in results] == ["A", "B", "A"]
+        assert [r["source"] for r in results] == ["llm", "llm", "dedup"]
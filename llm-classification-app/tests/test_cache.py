@@ -0,0 +1,76 @@
+"""Tests for the on-disk response cache."""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from backend.cache import ResponseCache, make_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = ResponseCache(tmp_path / "responses.sqlite")
+    yield c
+    c.close()
+
+
+class TestCacheKey:
+    def test_stable_regardless_of_key_order(self):
+        a = make_cache_key({"model": "m", "temperature": 0}, [{"role": "user", "content": "x"}])
+        b = make_cache_key({"temperature": 0, "model": "m"}, [{"role": "user", "content": "x"}])
+        assert a == b
+
+    def test_depends_on_kwargs_and_prompt(self):
+        base = make_cache_key({"model": "m"}, [{"role": "user", "content": "x"}])
+        assert base != make_cache_key({"model": "n"}, [{"role": "user", "content": "x"}])
+        assert base != make_cache_key({"model": "m"}, [{"role": "user", "content": "y"}])
+
+
+class TestResponseCache:
+    def test_put_and_get(self, cache):
+        cache.put("k", "Sports", {"input_tokens": 10, "output_tokens": 1})
+        hit = cache.get("k")
+        assert hit == {"content": "Sports", "usage": {"input_tokens": 10, "output_tokens": 1}}
+
+    def test_miss(self, cache):
+        assert cache.get("missing") is None
+
+    def test_uses_wal(self, cache):
+        mode = cache._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+    def test_persists_across_instances(self, tmp_path):
+        first = ResponseCache(tmp_path / "r.sqlite")
+        first.put("k", "v", {})
+        first.close()
+        second = ResponseCache(tmp_path / "r.sqlite")
+        assert second.get("k")["content"] == "v"
+        second.close()
+
+    def test_evict_by_age(self, cache):
+        cache.put("old", "v", {})
+        with patch("backend.cache.time.time", return_value=time.time() + 3600):
+            cache.put("new", "v", {})
+            removed = cache.evict(max_age_seconds=60, max_bytes=None)
+        assert removed == 1
+        assert cache.get("old") is None
+        assert cache.get("new") is not None
+
+    def test_evict_by_size_drops_least_recently_used(self, cache):
+        now = time.time()
+        for i, key in enumerate(["a", "b", "c"]):
+            with patch("backend.cache.time.time", return_value=now + i):
+                cache.put(key, "x" * 100, {})
+        with patch("backend.cache.time.time", return_value=now + 10):
+            cache.get("a")  # touch "a" so "b" is now least recently used
+        size = cache.stats()["bytes"]
+        removed = cache.evict(max_age_seconds=None, max_bytes=size - 1)
+        assert removed == 1
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+    def test_clear(self, cache):
+        cache.put("k", "v", {})
+        cache.clear()
+        assert cache.stats()["entries"] == 0
@@ -0,0 +1,115 @@
+"""Tests for cascade mode."""
+
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from backend.cascade import needs_escalation, run_cascade
+from backend.classifier import ClassificationResult, estimate_tokens_from_sample
+from backend.models import ModelConfig
+from backend.pricing import ModelPrice
+from backend.prompt import PromptTemplate
+
+from conftest import make_response
+
+CATEGORIES = ["Sports", "Politics", "Technology"]
+
+
+def make_config(model_id: str, input_per_mtok: float) -> ModelConfig:
+    price = ModelPrice(model_id, model_id, "google", input_per_mtok, input_per_mtok)
+    return ModelConfig(model_id=model_id, display_name=model_id, vendor="Google", price=price)
+
+
+def result(label, score=100.0) -> ClassificationResult:
+    return ClassificationResult(0, str(label), label, 1, 1, match_score=score)
+
+
+class TestNeedsEscalation:
+    def test_exact_match_kept(self):
+        assert not needs_escalation(result("Sports"), CATEGORIES)
+
+    def test_unmatched_escalated(self):
+        assert needs_escalation(result("no idea", 0.0), CATEGORIES)
+
+    def test_weak_fuzzy_match_escalated(self):
+        assert needs_escalation(result("Sports", 70.0), CATEGORIES)
+        assert not needs_escalation(result("Sports", 70.0), CATEGORIES, min_match_score=60)
+
+    def test_low_confidence_escalated(self):
+        confident = result("Sports")
+        confident.confidence = 0.95
+        shaky = result("Sports")
+        shaky.confidence = 0.4
+        assert not needs_escalation(confident, CATEGORIES)
+        assert needs_escalation(shaky, CATEGORIES)
+        assert not needs_escalation(shaky, CATEGORIES, min_confidence=0.3)
+
+    def test_multi_label(self):
+        assert not needs_escalation(result(["Sports", "Politics"]), CATEGORIES)
+        assert needs_escalation(result([]), CATEGORIES)
+
+
+class TestRunCascade:
+    def test_escalates_only_uncertain_rows(self):
+        df = pd.DataFrame({"text": ["Sports", "Sprt", "gibberish", "Politics"]})
+        seen = {"cheap": [], "strong": []}
+
+        async def fake(messages, **kwargs):
+            text = "".join(m["content"] for m in messages).split("Doc: ")[-1]
+            if "cheap" in kwargs["model"]:
+                seen["cheap"].append(text)
+                return make_response(text, prompt_tokens=100)
+            seen["strong"].append(text)
+            return make_response("Technology", prompt_tokens=100)
+
+        tiers = [make_config("cheap", 0.1), make_config("strong", 10.0)]
+        with patch("backend.llm.litellm.acompletion", fake):
+            run = run_cascade(
+                df, tiers, PromptTemplate("{label_options}\nDoc: {text}"),
+                CATEGORIES, use_cache=False, dedup=False,
+            )
+
+        labels = [r.matched_label for r in run["results"]]
+        assert labels == ["Sports", "Technology", "Technology", "Politics"]
+        assert [r.row_index for r in run["results"]] == [0, 1, 2, 3]
+        assert run["row_tiers"] == [0, 1, 1, 0]
+        assert sorted(seen["strong"]) == ["Sprt", "gibberish"]
+
+        cheap, strong = run["tier_stats"]
+        assert (cheap["rows"], cheap["escalated"]) == (4, 2)
+        assert (strong["rows"], strong["escalated"]) == (2, 0)
+        assert run["total_cost"] == pytest.approx(cheap["cost"] + strong["cost"])
+        # Projected from every row's estimated input tokens, not by scaling
+        # up the two escalated rows
+        tokens = estimate_tokens_from_sample(
+            df, PromptTemplate("{label_options}\nDoc: {text}"), CATEGORIES, "strong"
+        )
+        assert run["single_model_cost"] == pytest.approx(
+            tiers[-1].price.estimate_cost(tokens["estimated_total_input_tokens"], 4 * 2)
+        )
+        assert run["single_model_seconds"] is not None
+
+    def test_no_escalation_skips_later_tiers(self):
+        df = pd.DataFrame({"text": ["Sports"]})
+
+        async def fake(messages, **kwargs):
+            return make_response("Sports", prompt_tokens=100)
+
+        tiers = [make_config("cheap", 0.1), make_config("strong", 10.0)]
+        with patch("backend.llm.litellm.acompletion", fake):
+            run = run_cascade(
+                df, tiers, PromptTemplate("{label_options}\n{text}"),
+                CATEGORIES, use_cache=False,
+            )
+        assert len(run["tier_stats"]) == 1
+        # The cost projection doesn't need any row to reach the last tier
+        assert run["single_model_cost"] > 0
+        assert run["single_model_seconds"] is None
+
+    def test_rejects_journal(self):
+        with pytest.raises(ValueError):
+            run_cascade(
+                pd.DataFrame({"text": ["x"]}), [make_config("cheap", 0.1)],
+                PromptTemplate("{text}"), CATEGORIES, journal=object(),
+            )
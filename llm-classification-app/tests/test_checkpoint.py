@@ -0,0 +1,137 @@
+"""Tests for the checkpoint journal."""
+
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from backend.checkpoint import RunJournal, dataset_fingerprint, job_key
+from backend.classifier import classify_rows
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+from conftest import make_response
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path):
+    with patch("backend.checkpoint.CHECKPOINT_DIR", tmp_path / "checkpoints"):
+        yield tmp_path / "checkpoints"
+
+
+@pytest.fixture
+def config():
+    return ModelConfig(model_id="gemini-2.0-flash", display_name="G", vendor="Google")
+
+
+@pytest.fixture
+def template():
+    return PromptTemplate("Classify: {text}\nCategories: {label_options}")
+
+
+class TestFingerprint:
+    def test_same_data_same_fingerprint(self):
+        a = pd.DataFrame({"text": ["x", "y"], "other": [1, 2]})
+        b = pd.DataFrame({"text": ["x", "y"], "other": [3, 4]})
+        assert dataset_fingerprint(a, ["text"]) == dataset_fingerprint(b, ["text"])
+
+    def test_changed_data_changes_fingerprint(self):
+        a = pd.DataFrame({"text": ["x", "y"]})
+        b = pd.DataFrame({"text": ["x", "z"]})
+        assert dataset_fingerprint(a, ["text"]) != dataset_fingerprint(b, ["text"])
+
+    def test_chunking_does_not_change_fingerprint(self):
+        df = pd.DataFrame({"text": ["x", "y", "z"]})
+        chunks = [df.iloc[:2], df.iloc[2:]]
+        assert dataset_fingerprint(chunks, ["text"]) == dataset_fingerprint(df, ["text"])
+
+    def test_job_key_covers_categories_and_model(self, config, template):
+        df = pd.DataFrame({"text": ["x"]})
+        base = job_key(df, config, template, ["A", "B"])
+        assert base == job_key(df, config, template, ["A", "B"])
+        assert base != job_key(df, config, template, ["A", "C"])
+        other = ModelConfig(model_id="gemini-2.5-pro", display_name="P", vendor="Google")
+        assert base != job_key(df, other, template, ["A", "B"])
+
+
+class TestRunJournal:
+    def test_append_and_reload(self):
+        journal = RunJournal("job")
+        journal.append({"row_index": 3, "matched_label": "A"})
+        journal.close()
+        assert RunJournal("job").completed == {3: {"row_index": 3, "matched_label": "A"}}
+
+    def test_ignores_torn_last_line(self):
+        journal = RunJournal("job")
+        journal.append({"row_index": 0, "matched_label": "A"})
+        journal.close()
+        with journal.path.open("a") as f:
+            f.write('{"row_index": 1, "matched')
+        assert list(RunJournal("job").completed) == [0]
+
+    def test_append_after_torn_last_line(self):
+        journal = RunJournal("job")
+        journal.append({"row_index": 0, "matched_label": "A"})
+        journal.close()
+        with journal.path.open("a") as f:
+            f.write('{"row_index": 1, "matched')
+        resumed = RunJournal("job")
+        resumed.append({"row_index": 1, "matched_label": "B"})
+        resumed.close()
+        assert RunJournal("job").completed == {
+            0: {"row_index": 0, "matched_label": "A"},
+            1: {"row_index": 1, "matched_label": "B"},
+        }
+
+    def test_torn_only_line_truncated(self, monkeypatch):
+        monkeypatch.setattr("backend.checkpoint._TAIL_BLOCK", 4)
+        journal = RunJournal("job")
+        journal.path.write_text('{"row_index": 0, "matched')
+        journal.append({"row_index": 1})
+        journal.close()
+        assert journal.path.read_text() == '{"row_index": 1}\n'
+
+    def test_discard(self):
+        journal = RunJournal("job")
+        journal.append({"row_index": 0})
+        journal.discard()
+        assert RunJournal("job").completed == {}
+
+
+class TestResume:
+    def test_rerun_skips_completed_rows(self, config, template):
+        df = pd.DataFrame({"text": ["a", "b", "c", "d"]})
+        calls = []
+
+        async def crashing(messages, **kwargs):
+            text = "".join(m["content"] for m in messages).split("Classify: ")[1].split("\n")[0]
+            calls.append(text)
+            if text == "c":
+                raise RuntimeError("connection lost")
+            return make_response(text, prompt_tokens=5, completion_tokens=1)
+
+        journal = RunJournal.for_job(df, config, template, ["a", "b", "c", "d"])
+        with patch("backend.llm.litellm.acompletion", crashing):
+            with pytest.raises(RuntimeError):
+                classify_rows(
+                    df, config, template, ["a", "b", "c", "d"],
+                    concurrency=1, journal=journal, use_cache=False,
+                )
+        assert sorted(RunJournal(journal.key).completed) == [0, 1]
+
+        calls.clear()
+
+        async def healthy(messages, **kwargs):
+            text = "".join(m["content"] for m in messages).split("Classify: ")[1].split("\n")[0]
+            calls.append(text)
+            return make_response(text, prompt_tokens=5, completion_tokens=1)
+
+        resumed = RunJournal.for_job(df, config, template, ["a", "b", "c", "d"])
+        with patch("backend.llm.litellm.acompletion", healthy):
+            results = classify_rows(
+                df, config, template, ["a", "b", "c", "d"],
+                concurrency=1, journal=resumed, use_cache=False,
+            )
+        assert calls == ["c", "d"]
+        assert [r.matched_label for r in results] == ["a", "b", "c", "d"]
+        assert [r.row_index for r in results] == [0, 1, 2, 3]
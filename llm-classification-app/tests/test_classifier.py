@@ -0,0 +1,530 @@
+"""Tests for the classification engine."""
+
+import asyncio
+import math
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from backend.classifier import (
+    classify_rows,
+    aclassify_rows,
+    apply_results_to_dataframe,
+    estimate_tokens_from_sample,
+    iter_classify,
+    results_table,
+    ClassificationResult,
+)
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+from conftest import make_response
+
+
+@pytest.fixture
+def config():
+    return ModelConfig(
+        model_id="gemini-2.0-flash",
+        display_name="Gemini 2.0 Flash",
+        vendor="Google",
+    )
+
+
+@pytest.fixture
+def template():
+    return PromptTemplate("Classify: {text}\nCategories: {label_options}")
+
+
+class FakeAcompletion:
+    """Echoes the row text back as the label, tracking peak concurrency."""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def __call__(self, messages, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        content = "".join(m["content"] for m in messages)
+        text = content.split("Classify: ")[1].split("\n")[0]
+        # Finish later rows first so ordering has to be restored.
+        await asyncio.sleep(self.delay / (1 + len(text)))
+        self.in_flight -= 1
+        return make_response(text)
+
+
+class TestClassifyRows:
+    def test_results_in_row_order(self, config, template):
+        df = pd.DataFrame({"text": ["A", "BB", "CCC", "DDDD", "EEEEE"]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, ["A", "BB", "CCC", "DDDD", "EEEEE"],
+                concurrency=5,
+            )
+        assert [r.row_index for r in results] == [0, 1, 2, 3, 4]
+        assert [r.matched_label for r in results] == list(df["text"])
+
+    def test_concurrency_is_bounded(self, config, template):
+        df = pd.DataFrame({"text": [f"row {i}" for i in range(20)]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            classify_rows(df, config, template, ["x"], concurrency=3)
+        assert fake.calls == 20
+        assert fake.peak <= 3
+
+    def test_progress_callback(self, config, template):
+        df = pd.DataFrame({"text": ["a", "b", "c"]})
+        calls = []
+        with patch("backend.llm.litellm.acompletion", FakeAcompletion()):
+            classify_rows(
+                df, config, template, ["a"],
+                progress_callback=lambda cur, tot: calls.append((cur, tot)),
+            )
+        assert calls == [(1, 3), (2, 3), (3, 3)]
+
+    def test_max_rows(self, config, template):
+        df = pd.DataFrame({"text": ["a", "b", "c", "d"]})
+        with patch("backend.llm.litellm.acompletion", FakeAcompletion()):
+            results = classify_rows(df, config, template, ["a"], max_rows=2)
+        assert len(results) == 2
+
+    def test_runs_inside_event_loop(self, config, template):
+        df = pd.DataFrame({"text": ["a", "b"]})
+
+        async def main():
+            # e.g. a notebook: classify_rows must not call asyncio.run on
+            # the already-running loop.
+            return classify_rows(df, config, template, ["a", "b"])
+
+        with patch("backend.llm.litellm.acompletion", FakeAcompletion()):
+            results = asyncio.run(main())
+        assert [r.matched_label for r in results] == ["a", "b"]
+
+    def test_async_engine(self, config, template):
+        df = pd.DataFrame({"text": ["a", "b"]})
+        with patch("backend.llm.litellm.acompletion", FakeAcompletion()):
+            results = asyncio.run(
+                aclassify_rows(df, config, template, ["a", "b"], concurrency=2)
+            )
+        assert [r.input_tokens for r in results] == [10, 10]
+
+    def test_adaptive_controller_retries_overloads(self, config, template):
+        from backend.concurrency import AdaptiveConcurrency
+
+        class RateLimited(Exception):
+            status_code = 429
+
+        df = pd.DataFrame({"text": ["a", "b", "c"]})
+        fake = FakeAcompletion()
+        failures = {"b": 1}
+
+        async def flaky(messages, **kwargs):
+            text = "".join(m["content"] for m in messages).split("Classify: ")[1].split("\n")[0]
+            if failures.get(text):
+                failures[text] -= 1
+                raise RateLimited()
+            return await fake(messages, **kwargs)
+
+        controller = AdaptiveConcurrency(initial=4, max_limit=4)
+        with patch("backend.llm.litellm.acompletion", flaky), \
+                patch("backend.concurrency.backoff_delay", lambda attempt: 0):
+            results = classify_rows(
+                df, config, template, ["a", "b", "c"], controller=controller
+            )
+        assert [r.matched_label for r in results] == ["a", "b", "c"]
+        assert controller.overloads == 1
+        assert controller.decreases == 1
+
+    def test_cached_rows_skip_the_network(self, config, template):
+        df = pd.DataFrame({"text": ["a", "b"]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            first = classify_rows(df, config, template, ["a", "b"])
+            second = classify_rows(df, config, template, ["a", "b"])
+        assert fake.calls == 2
+        assert [r.source for r in first] == ["llm", "llm"]
+        assert [r.source for r in second] == ["cache", "cache"]
+        assert [r.matched_label for r in second] == ["a", "b"]
+        assert second[0].input_tokens == first[0].input_tokens
+
+    def test_cache_can_be_bypassed(self, config, template):
+        df = pd.DataFrame({"text": ["a"]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            classify_rows(df, config, template, ["a"], use_cache=False)
+            classify_rows(df, config, template, ["a"], use_cache=False)
+        assert fake.calls == 2
+
+    def test_identical_prompts_sent_once(self, config, template):
+        df = pd.DataFrame({"text": ["a", "b", "a", "a", "b", "c"]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, ["a", "b", "c"], use_cache=False,
+            )
+        assert fake.calls == 3
+        assert [r.matched_label for r in results] == list(df["text"])
+        assert [r.row_index for r in results] == list(range(6))
+        assert [r.source for r in results] == ["llm", "llm", "dedup", "dedup", "dedup", "llm"]
+
+    def test_dedup_disabled(self, config, template):
+        df = pd.DataFrame({"text": ["a", "a"]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            classify_rows(
+                df, config, template, ["a"], use_cache=False, dedup=False,
+            )
+        assert fake.calls == 2
+
+
+class TestPromptCaching:
+    def test_prefix_sent_as_system_message(self, config):
+        template = PromptTemplate("Categories:\n{label_options}\n\nText: {text}")
+        seen = []
+
+        async def fake(messages, **kwargs):
+            seen.append(messages)
+            return make_response("a")
+
+        df = pd.DataFrame({"text": ["one", "two"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            classify_rows(df, config, template, ["a"], use_cache=False)
+        assert {m[0]["content"] for m in seen} == {"Categories:\na\n\nText: "}
+        assert sorted(m[1]["content"] for m in seen) == ["one", "two"]
+        assert all(m[0]["role"] == "system" for m in seen)
+
+    def test_cached_tokens_recorded(self, config, template):
+        async def fake(messages, **kwargs):
+            response = make_response("a", prompt_tokens=100)
+            response.usage.prompt_tokens_details = SimpleNamespace(cached_tokens=80)
+            return response
+
+        from backend.classifier import summarize_results
+
+        df = pd.DataFrame({"text": ["one", "two"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(df, config, template, ["a"], use_cache=False)
+        assert [r.cached_input_tokens for r in results] == [80, 80]
+        assert summarize_results(results)["billed_cached_input_tokens"] == 160
+
+
+class TestStructuredOutput:
+    def test_schema_sent_and_decoded(self, config, template):
+        seen = []
+
+        async def fake(messages, **kwargs):
+            seen.append(kwargs.get("response_format"))
+            return make_response('{"label": "b"}')
+
+        df = pd.DataFrame({"text": ["x"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, ["a", "b"], use_cache=False, structured=True,
+            )
+        assert seen[0]["json_schema"]["schema"]["properties"]["label"]["enum"] == ["a", "b"]
+        assert results[0].matched_label == "b"
+        assert results[0].schema_decoded
+
+    def test_falls_back_to_fuzzy_matching(self, config, template):
+        async def fake(messages, **kwargs):
+            return make_response("Sportz")
+
+        df = pd.DataFrame({"text": ["x"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, ["Sports", "Tech"], use_cache=False,
+                structured=True,
+            )
+        assert results[0].matched_label == "Sports"
+        assert not results[0].schema_decoded
+
+    def test_json_multi_label_answer_not_mangled(self, config, template):
+        async def fake(messages, **kwargs):
+            return make_response('{"categories": [{"category": "Tech"}, {"category": "Sports"}]}')
+
+        df = pd.DataFrame({"text": ["x"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, ["Sports", "Tech"], multi_label=True,
+                use_cache=False,
+            )
+        assert results[0].matched_label == ["Tech", "Sports"]
+
+
+class TestLabelCodes:
+    def test_codes_decoded_to_categories(self, config):
+        template = PromptTemplate("{label_options}\n\n{text}")
+        categories = ["Long category name one", "Long category name two"]
+        prompts = []
+
+        async def fake(messages, **kwargs):
+            prompts.append("".join(m["content"] for m in messages))
+            return make_response("A2")
+
+        df = pd.DataFrame({"text": ["x"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, categories, use_cache=False,
+                use_label_codes=True,
+            )
+        assert "A1: Long category name one" in prompts[0]
+        assert results[0].matched_label == "Long category name two"
+        assert results[0].code_saved_output_tokens > 0
+
+    def test_names_still_matched(self, config, template):
+        async def fake(messages, **kwargs):
+            return make_response("Sports")
+
+        df = pd.DataFrame({"text": ["x"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, ["Sports", "Tech"], use_cache=False,
+                use_label_codes=True,
+            )
+        assert results[0].matched_label == "Sports"
+        assert results[0].code_saved_output_tokens == 0
+
+    def test_structured_codes(self, config, template):
+        seen = []
+
+        async def fake(messages, **kwargs):
+            seen.append(kwargs["response_format"])
+            return make_response('{"label": "A1"}')
+
+        df = pd.DataFrame({"text": ["x"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, ["Sports", "Tech"], use_cache=False,
+                structured=True, use_label_codes=True,
+            )
+        assert seen[0]["json_schema"]["schema"]["properties"]["label"]["enum"] == ["A1", "A2"]
+        assert results[0].matched_label == "Sports"
+        assert results[0].schema_decoded
+
+
+class TestConfidence:
+    @staticmethod
+    def with_logprobs(content: str, logprobs: list[float]):
+        response = make_response(content)
+        response.choices[0].logprobs = SimpleNamespace(
+            content=[SimpleNamespace(logprob=lp) for lp in logprobs]
+        )
+        return response
+
+    def test_confidence_from_logprobs(self, config, template):
+        seen = []
+
+        async def fake(messages, **kwargs):
+            seen.append(kwargs.get("logprobs"))
+            return self.with_logprobs("Sports", [-0.1, -0.2])
+
+        df = pd.DataFrame({"text": ["x"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            first = classify_rows(df, config, template, ["Sports", "Tech"])
+            cached = classify_rows(df, config, template, ["Sports", "Tech"])
+        assert seen == [True]
+        assert first[0].confidence == pytest.approx(math.exp(-0.3))
+        assert first[0].match_score == 100.0
+        assert cached[0].source == "cache"
+        assert cached[0].confidence == pytest.approx(math.exp(-0.3))
+
+    def test_no_logprobs_for_unsupported_models(self, template):
+        claude = ModelConfig(
+            model_id="claude-sonnet-4", display_name="Claude", vendor="Anthropic"
+        )
+        seen = []
+
+        async def fake(messages, **kwargs):
+            seen.append("logprobs" in kwargs)
+            return make_response("Sprts")
+
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                pd.DataFrame({"text": ["x"]}), claude, template,
+                ["Sports", "Tech"], use_cache=False,
+            )
+        assert seen == [False]
+        assert results[0].confidence is None
+        assert 60 <= results[0].match_score < 100
+
+    def test_exported_columns(self, config, template):
+        async def fake(messages, **kwargs):
+            return self.with_logprobs("Sports", [-0.5])
+
+        df = pd.DataFrame({"text": ["x", "y"]})
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(df, config, template, ["Sports"], use_cache=False)
+        out = apply_results_to_dataframe(df, results)
+        assert list(out["match_score"]) == [100.0, 100.0]
+        assert out["confidence"].tolist() == pytest.approx([math.exp(-0.5)] * 2)
+
+
+class TestEstimateTokens:
+    @pytest.fixture
+    def sorted_df(self):
+        return pd.DataFrame({"text": ["short"] * 90 + ["long text " * 200] * 10})
+
+    def test_mean_p95_and_interval(self, sorted_df):
+        info = estimate_tokens_from_sample(
+            sorted_df, PromptTemplate("{label_options}\n{text}"), ["A"],
+            "gemini-2.0-flash", sample_size=20,
+        )
+        low, high = info["input_tokens_ci"]
+        assert low <= info["avg_input_tokens"] <= high
+        assert info["p95_input_tokens"] > info["avg_input_tokens"]
+        assert len(info["sample_counts"]) == 20
+        # The long tail is found even though it sits at the end
+        assert max(info["sample_counts"]) > 100
+
+    def test_interval_widens_for_partial_data(self, sorted_df):
+        template = PromptTemplate("{text}")
+        whole = estimate_tokens_from_sample(sorted_df, template, ["A"], "gemini-2.0-flash")
+        partial = estimate_tokens_from_sample(
+            sorted_df, template, ["A"], "gemini-2.0-flash", total_rows=100_000
+        )
+        width = lambda info: info["input_tokens_ci"][1] - info["input_tokens_ci"][0]
+        assert width(partial) > width(whole)
+        assert partial["estimated_total_input_tokens"] == pytest.approx(
+            partial["avg_input_tokens"] * 100_000
+        )
+
+    def test_empty(self):
+        info = estimate_tokens_from_sample(
+            pd.DataFrame({"text": []}), PromptTemplate("{text}"), ["A"], "gemini-2.0-flash"
+        )
+        assert info["avg_input_tokens"] == 0
+
+
+class TestApplyResults:
+    @staticmethod
+    def result(idx, label):
+        return ClassificationResult(idx, f"raw {label}", label, 1, 1, match_score=90.0)
+
+    def test_positional_with_non_default_index(self):
+        df = pd.DataFrame({"text": ["a", "b", "c"]}, index=[10, 5, 7])
+        results = [self.result(2, "C"), self.result(0, "A"), self.result(1, "B")]
+        out = apply_results_to_dataframe(df, results)
+        assert list(out.index) == [10, 5, 7]
+        assert list(out["classification"]) == ["A", "B", "C"]
+        assert list(out["raw_response"]) == ["raw A", "raw B", "raw C"]
+        assert "classification" not in df.columns
+
+    def test_multi_label_and_gaps(self):
+        df = pd.DataFrame({"text": ["a", "b", "c"]})
+        out = apply_results_to_dataframe(
+            df, [self.result(0, ["X", "Y"]), None, self.result(9, "Z")],
+            multi_label=True, delimiter=";;",
+        )
+        assert out["classification"][0] == "X;;Y"
+        assert out["classification"].isna().tolist() == [False, True, True]
+        assert out["match_score"].isna().tolist() == [False, True, True]
+        assert out["confidence"].isna().all()
+
+    def test_results_table_leaves_source_alone(self):
+        df = pd.DataFrame({"text": ["a", "b"]}, index=["r1", "r2"])
+        table = results_table(
+            [self.result(1, "B"), self.result(0, "A")], len(df), index=df.index
+        )
+        assert list(df.columns) == ["text"]
+        assert list(table.index) == ["r1", "r2"]
+        joined = pd.concat([df, table], axis=1)
+        assert joined.loc["r2", "classification"] == "B"
+        assert list(results_table([], 2).index) == [0, 1]
+
+
+class TestIterClassify:
+    def test_yields_every_row(self, config, template):
+        df = pd.DataFrame({"text": ["A", "BB", "CCC", "DDDD", "EEEEE"]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = list(iter_classify(
+                df, config, template, list(df["text"]), concurrency=5,
+                use_cache=False,
+            ))
+        # Completion order: longer texts finish first in the fake
+        assert sorted(r.row_index for r in results) == list(range(5))
+        assert results[0].row_index != 0
+        assert {r.row_index: r.matched_label for r in results} == dict(enumerate(df["text"]))
+
+    def test_small_buffer_applies_backpressure(self, config, template):
+        df = pd.DataFrame({"text": [f"t{i}" for i in range(20)]})
+        fake = FakeAcompletion(delay=0)
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = list(iter_classify(
+                df, config, template, list(df["text"]), use_cache=False,
+                buffer_size=1,
+            ))
+        assert len(results) == 20
+
+    def test_stopping_early_starts_no_new_rows(self, config, template):
+        df = pd.DataFrame({"text": [f"t{i}" for i in range(50)]})
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            stream = iter_classify(
+                df, config, template, list(df["text"]), concurrency=2,
+                use_cache=False, buffer_size=1,
+            )
+            next(stream)
+            stream.close()
+        assert fake.calls < 50
+
+    def test_accepts_chunks(self, config, template):
+        df = pd.DataFrame({"text": [f"t{i}" for i in range(7)]})
+        chunks = (df.iloc[i:i + 3] for i in range(0, 7, 3))
+        fake = FakeAcompletion()
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = list(iter_classify(
+                chunks, config, template, list(df["text"]), use_cache=False,
+                total_rows=7,
+            ))
+        assert {r.row_index: r.matched_label for r in results} == dict(enumerate(df["text"]))
+
+    def test_errors_reach_the_consumer(self, config, template):
+        async def broken(messages, **kwargs):
+            raise ValueError("bad request")
+
+        df = pd.DataFrame({"text": ["a"]})
+        with patch("backend.llm.litellm.acompletion", broken):
+            with pytest.raises(ValueError, match="bad request"):
+                list(iter_classify(df, config, template, ["a"], use_cache=False))
+
+
+class TestSummarizeResults:
+    def test_counts_sources_and_savings(self):
+        from backend.classifier import ClassificationResult, summarize_results
+
+        results = [
+            ClassificationResult(0, "a", "a", 10, 2, source="llm"),
+            ClassificationResult(1, "a", "a", 10, 2, source="dedup"),
+            ClassificationResult(2, "a", "a", 10, 2, source="dedup"),
+            ClassificationResult(3, "b", "b", 12, 2, source="cache"),
+        ]
+        summary = summarize_results(results)
+        assert summary["rows"] == 4
+        assert summary["api_calls"] == 1
+        assert summary["cache_hits"] == 1
+        assert summary["dedup_saved_calls"] == 2
+        assert summary["dedup_saved_input_tokens"] == 20
+        assert summary["billed_input_tokens"] == 10
+
+    def test_tally_matches_summary(self):
+        from backend.classifier import (
+            ClassificationResult, ResultTally, summarize_results,
+        )
+
+        results = [
+            ClassificationResult(0, "a", "a", 10, 2, source="packed", pack_size=2),
+            ClassificationResult(1, "b", "b", 10, 2, source="packed", pack_size=2),
+            ClassificationResult(2, "a", "a", 10, 2, source="dedup"),
+        ]
+        tally = ResultTally()
+        for result in results:
+            tally.add(result)
+        assert tally.summary() == summarize_results(results)
+        assert tally.summary()["api_calls"] == 1
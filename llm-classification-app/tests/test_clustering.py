@@ -0,0 +1,137 @@
+"""Tests for MinHash LSH clustering of rows."""
+
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.classifier import summarize_results
+from backend.clustering import (
+    ClusterPlan,
+    classify_clusters,
+    cluster_rows,
+    propagate_results,
+    select_rows,
+)
+from backend.dataset import CsvDataset
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+from conftest import make_response
+
+REFUND = (
+    "Dear {name}, thank you for contacting support about order {order}. "
+    "Your refund has been approved and will reach your account within "
+    "five working days. Kind regards, the customer service team."
+)
+TEXTS = [
+    REFUND.format(name="John", order=12345),
+    "My laptop screen cracked on arrival and the keyboard is missing keys.",
+    REFUND.format(name="Maria", order=99812),
+    "Where is my parcel? Tracking has not updated since last Tuesday.",
+    REFUND.format(name="Li", order=7),
+    "My laptop screen cracked on arrival and the keyboard is missing keys!",
+]
+
+
+class TestClusterRows:
+    def test_clusters_near_duplicates(self):
+        plan = cluster_rows(pd.DataFrame({"text": TEXTS}), ["text"], processes=1)
+        assert plan.cluster_ids.tolist() == [0, 1, 0, 3, 0, 1]
+        assert plan.num_clusters == 3
+        # Representatives plus one spot check for each multi-row cluster
+        assert set(plan.sample_rows) >= {0, 1, 3}
+        assert len(plan.sample_rows) == 5
+
+    def test_members_within_threshold_of_representative(self):
+        a = np.arange(128, dtype=np.uint32)
+        b = a.copy()
+        b[:20] += 1000  # ~0.84 similar to a
+        c = b.copy()
+        c[20:40] += 1000  # ~0.84 similar to b, ~0.69 to a
+        signatures = {"a": a, "b": b, "c": c}
+        with patch(
+            "backend.clustering._signatures",
+            lambda texts, num_perm: np.stack([signatures[t] for t in texts]),
+        ):
+            plan = cluster_rows(pd.DataFrame({"text": ["a", "b", "c"]}), ["text"], processes=1)
+        # c doesn't chain into a's cluster through b
+        assert plan.cluster_ids.tolist() == [0, 0, 2]
+
+    def test_repeated_signatures_across_blocks(self):
+        texts = ["Where is my parcel?", TEXTS[1], "Where is my parcel?", TEXTS[1]]
+        with patch("backend.clustering.SIGNATURE_BLOCK_ROWS", 3):
+            plan = cluster_rows(pd.DataFrame({"text": texts * 2}), ["text"], processes=1)
+        assert plan.cluster_ids.tolist() == [0, 1, 0, 1, 0, 1, 0, 1]
+
+    def test_spot_checks_per_cluster(self):
+        df = pd.DataFrame({"text": TEXTS})
+        assert len(cluster_rows(df, ["text"], spot_checks=0, processes=1).sample_rows) == 3
+        assert len(cluster_rows(df, ["text"], spot_checks=5, processes=1).sample_rows) == 6
+
+    def test_worker_processes_match_in_process(self, tmp_path):
+        path = tmp_path / "rows.csv"
+        pd.DataFrame({"text": TEXTS * 3, "id": range(18)}).to_csv(path, index=False)
+        dataset = CsvDataset(str(path), chunk_rows=4)
+        with patch("backend.clustering.SIGNATURE_BLOCK_ROWS", 5):
+            pooled = cluster_rows(dataset, ["text"], processes=2)
+            local = cluster_rows(dataset, ["text"], processes=1)
+        assert np.array_equal(pooled.cluster_ids, local.cluster_ids)
+        assert pooled.num_clusters == 3
+
+    def test_select_rows_across_chunks(self, tmp_path):
+        path = tmp_path / "rows.csv"
+        pd.DataFrame({"text": [f"row {i}" for i in range(10)]}).to_csv(path, index=False)
+        picked = select_rows(CsvDataset(str(path), chunk_rows=3), np.array([1, 3, 4, 9]), ["text"])
+        assert picked["text"].tolist() == ["row 1", "row 3", "row 4", "row 9"]
+
+    def test_empty_input(self):
+        plan = cluster_rows(pd.DataFrame({"text": []}), ["text"], processes=1)
+        assert plan.num_rows == 0 and plan.num_clusters == 0
+
+
+class TestClassifyClusters:
+    def test_propagates_representative_labels(self):
+        df = pd.DataFrame({"text": TEXTS})
+        plan = ClusterPlan(np.array([0, 1, 0, 3, 0, 1]), np.array([0, 1, 2, 3, 5]))
+        sent = []
+
+        async def fake(messages, **kwargs):
+            text = messages[-1]["content"]
+            sent.append(text)
+            if "Maria" in text:
+                answer = "Delivery"  # disagrees with its representative
+            elif "refund" in text:
+                answer = "Refund"
+            else:
+                answer = "Delivery"
+            return make_response(answer, prompt_tokens=50, completion_tokens=1)
+
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with patch("backend.llm.litellm.acompletion", fake):
+            run = classify_clusters(
+                df, plan, config, PromptTemplate("{label_options}\n{text}"),
+                ["Refund", "Delivery"], use_cache=False, dedup=False,
+            )
+
+        assert len(sent) == 5
+        assert (run["clusters"], run["rows"], run["classified_rows"]) == (3, 6, 5)
+        assert run["spot_checks"] == 2
+        assert run["spot_check_agreement"] == 0.5
+        assert run["disagreeing_clusters"] == [0]
+
+        results = list(propagate_results(plan, run["classified"]))
+        assert [r.row_index for r in results] == list(range(6))
+        assert results[4].matched_label == "Refund" and results[4].source == "cluster"
+        assert results[2].matched_label == "Delivery" and results[2].source == "llm"
+        assert summarize_results(results)["cluster_rows"] == 1
+
+    def test_rejects_journal(self):
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        plan = ClusterPlan(np.array([0]), np.array([0]))
+        with pytest.raises(ValueError):
+            classify_clusters(
+                pd.DataFrame({"text": ["x"]}), plan, config,
+                PromptTemplate("{text}"), ["A"], journal=object(),
+            )
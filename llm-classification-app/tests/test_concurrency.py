@@ -0,0 +1,170 @@
+"""Tests for the AIMD concurrency controller and retry helper."""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from backend.concurrency import (
+    AdaptiveConcurrency,
+    FixedConcurrency,
+    Ticket,
+    backoff_delay,
+    call_with_retries,
+    is_overload_error,
+)
+
+
+class Overloaded(Exception):
+    status_code = 429
+
+
+class Broken(Exception):
+    status_code = 400
+
+
+def ticket(controller, started=0.0):
+    return Ticket(started=started, epoch=controller._epoch)
+
+
+@pytest.fixture
+def clock():
+    now = [100.0]
+    with patch("backend.concurrency.time.monotonic", lambda: now[0]):
+        yield now
+
+
+class TestAdaptiveConcurrency:
+    def test_additive_increase(self, clock):
+        ctrl = AdaptiveConcurrency(initial=4, max_limit=10)
+        for _ in range(4):
+            ctrl.on_success(ticket(ctrl), 1.0)
+        # +1/window per success: ~+1 after a window's worth of completions
+        assert ctrl.window == 4
+        assert ctrl.limit == pytest.approx(4.9, abs=0.1)
+
+    def test_capped_at_max(self, clock):
+        ctrl = AdaptiveConcurrency(initial=2, max_limit=3)
+        for _ in range(100):
+            ctrl.on_success(ticket(ctrl), 1.0)
+        assert ctrl.window == 3
+
+    def test_multiplicative_decrease_once_per_generation(self, clock):
+        ctrl = AdaptiveConcurrency(initial=16, max_limit=16)
+        stale = [ticket(ctrl) for _ in range(5)]
+        for t in stale:
+            ctrl.on_overload(t)
+        assert ctrl.window == 8
+        assert ctrl.decreases == 1
+        # A request started after the cut can trigger another one
+        ctrl.on_overload(ticket(ctrl))
+        assert ctrl.window == 4
+
+    def test_never_below_min(self, clock):
+        ctrl = AdaptiveConcurrency(initial=2, min_limit=1)
+        for _ in range(5):
+            ctrl.on_overload(ticket(ctrl))
+        assert ctrl.window == 1
+
+    def test_latency_spike_cuts(self, clock):
+        ctrl = AdaptiveConcurrency(initial=8, max_limit=8, sample_size=10)
+        for _ in range(10):
+            ctrl.on_success(ticket(ctrl), 1.0)
+        for _ in range(10):
+            ctrl.on_success(ticket(ctrl), 5.0)
+        assert ctrl.decreases >= 1
+        assert ctrl.window < 8
+
+    def test_unmetered_successes_add_no_latency_sample(self):
+        ctrl = AdaptiveConcurrency(initial=8, max_limit=8, sample_size=10)
+        for _ in range(10):
+            ctrl.on_success(ticket(ctrl), None)  # e.g. cache hits
+        for _ in range(10):
+            ctrl.on_success(ticket(ctrl), 1.0)
+        assert ctrl.decreases == 0
+        assert ctrl.p95_latency() == 1.0
+
+    def test_no_increase_while_erroring(self, clock):
+        ctrl = AdaptiveConcurrency(initial=4, max_limit=10, max_error_rate=0.1)
+        for _ in range(5):
+            ctrl.on_error(ticket(ctrl))
+        ctrl.on_success(ticket(ctrl), 1.0)
+        assert ctrl.limit == 4
+
+    def test_snapshot_exposes_window(self):
+        ctrl = AdaptiveConcurrency(initial=3)
+        assert ctrl.snapshot()["window"] == 3
+
+
+class TestRetries:
+    def test_overload_detection(self):
+        assert is_overload_error(Overloaded())
+        assert not is_overload_error(Broken())
+        assert not is_overload_error(ValueError())
+
+    def test_backoff_bounded(self):
+        for attempt in range(10):
+            assert 0 <= backoff_delay(attempt, base=1.0, cap=8.0) <= 8.0
+
+    def test_retries_overloads(self):
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise Overloaded()
+            return "ok"
+
+        ctrl = AdaptiveConcurrency(initial=4)
+        with patch("backend.concurrency.backoff_delay", lambda attempt: 0):
+            assert asyncio.run(call_with_retries(flaky, ctrl)) == "ok"
+        assert len(attempts) == 3
+        assert ctrl.overloads == 2
+
+    def test_latency_of_picks_sample(self):
+        ctrl = AdaptiveConcurrency(initial=4)
+
+        async def cached():
+            return "hit"
+
+        asyncio.run(call_with_retries(cached, ctrl, latency_of=lambda result: None))
+        asyncio.run(call_with_retries(cached, ctrl, latency_of=lambda result: 2.5))
+        assert ctrl.successes == 2
+        assert list(ctrl._latencies) == [2.5]
+
+    def test_gives_up_after_max_retries(self):
+        async def always_overloaded():
+            raise Overloaded()
+
+        with patch("backend.concurrency.backoff_delay", lambda attempt: 0):
+            with pytest.raises(Overloaded):
+                asyncio.run(
+                    call_with_retries(always_overloaded, FixedConcurrency(2), 2)
+                )
+
+    def test_other_errors_not_retried(self):
+        attempts = []
+
+        async def broken():
+            attempts.append(1)
+            raise Broken()
+
+        with pytest.raises(Broken):
+            asyncio.run(call_with_retries(broken, FixedConcurrency(2)))
+        assert len(attempts) == 1
+
+    def test_slot_limits_in_flight(self):
+        ctrl = AdaptiveConcurrency(initial=2, max_limit=2)
+        peak = 0
+
+        async def task():
+            nonlocal peak
+            async with ctrl.slot():
+                peak = max(peak, ctrl._gate.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*(task() for _ in range(8)))
+
+        asyncio.run(main())
+        assert peak == 2
@@ -0,0 +1,74 @@
+"""Tests for chunked CSV input."""
+
+import pandas as pd
+import pytest
+
+from backend.dataset import CsvDataset, iter_blocks, iter_rows
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({
+        "id": range(10),
+        "text": [f"text {i}" for i in range(10)],
+        "notes": ["x"] * 10,
+    }).to_csv(path, index=False)
+    return path
+
+
+class TestCsvDataset:
+    def test_chunks_only_requested_columns(self, csv_path):
+        chunks = list(CsvDataset(csv_path, chunk_rows=4).chunks(["text"]))
+        assert [len(c) for c in chunks] == [4, 4, 2]
+        assert all(list(c.columns) == ["text"] for c in chunks)
+        # Index continues across chunks
+        assert list(chunks[1].index) == [4, 5, 6, 7]
+
+    def test_sample_and_count(self, csv_path):
+        dataset = CsvDataset(csv_path, chunk_rows=3)
+        assert len(dataset.sample(nrows=5)) == 5
+        assert dataset.columns() == ["id", "text", "notes"]
+        assert dataset.count_rows() == 10
+
+    def test_random_sample_covers_whole_file(self, csv_path):
+        dataset = CsvDataset(csv_path, chunk_rows=3)
+        sample = dataset.sample(nrows=4, method="random", seed=1)
+        assert len(sample) == 4
+        assert list(sample.index) == [0, 1, 2, 3]
+        assert list(sample.columns) == ["id", "text", "notes"]
+        assert sample["id"].is_monotonic_increasing
+        # Other seeds reach beyond the first rows
+        ids = set()
+        for seed in range(5):
+            ids |= set(dataset.sample(nrows=4, method="random", seed=seed)["id"])
+        assert max(ids) >= 4
+        assert len(dataset.sample(nrows=50, method="random")) == 10
+
+    def test_rejects_unknown_engine(self, csv_path):
+        with pytest.raises(ValueError):
+            CsvDataset(csv_path, engine="polars")
+
+    def test_pyarrow_engine(self, csv_path):
+        pytest.importorskip("pyarrow")
+        chunks = list(CsvDataset(csv_path, engine="pyarrow").chunks(["text"]))
+        rows = pd.concat(chunks)
+        assert list(rows.columns) == ["text"]
+        assert list(rows.index) == list(range(10))
+
+
+class TestIterRows:
+    def test_numbers_rows_across_chunks(self):
+        chunks = [pd.DataFrame({"t": ["a", "b"]}), pd.DataFrame({"t": ["c"]})]
+        assert list(iter_rows(chunks)) == [(0, {"t": "a"}), (1, {"t": "b"}), (2, {"t": "c"})]
+
+    def test_max_rows(self):
+        df = pd.DataFrame({"t": list("abcde")})
+        assert [idx for idx, _ in iter_rows(df, max_rows=3)] == [0, 1, 2]
+
+    def test_blocks_across_chunks(self):
+        chunks = [pd.DataFrame({"t": list("abc")}), pd.DataFrame({"t": list("de")})]
+        blocks = list(iter_blocks(chunks, max_rows=4, block_rows=2))
+        assert [(start, list(b["t"])) for start, b in blocks] == [
+            (0, ["a", "b"]), (2, ["c"]), (3, ["d"]),
+        ]
@@ -0,0 +1,158 @@
+"""Tests for distilling LLM labels into a local classifier."""
+
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.checkpoint import RunJournal
+from backend.classifier import summarize_results
+from backend.distill import LocalClassifier, calibrate_threshold, classify_with_distillation
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+from conftest import make_response
+
+CATEGORIES = ["Billing", "Shipping"]
+WORDS = {
+    "Billing": ["invoice", "refund", "charged", "payment", "card"],
+    "Shipping": ["parcel", "courier", "delivery", "tracking", "late"],
+}
+
+
+def _texts(n, seed=0, words=3, vocab=5):
+    rng = np.random.default_rng(seed)
+    labels, texts = [], []
+    for i in range(n):
+        label = CATEGORIES[i % 2]
+        labels.append(label)
+        texts.append("ticket: " + " ".join(rng.choice(WORDS[label][:vocab], size=words)))
+    return texts, labels
+
+
+class TestLocalClassifier:
+    def test_learns_separable_labels(self):
+        texts, labels = _texts(200)
+        model = LocalClassifier(n_features=1 << 12)
+        model.partial_fit(texts, labels, epochs=3)
+        test_texts, test_labels = _texts(50, seed=1)
+        predicted, probs = model.predict(test_texts)
+        assert predicted == test_labels
+        assert probs.min() > 0.5
+
+    def test_untrained_predicts_nothing(self):
+        predicted, probs = LocalClassifier().predict(["anything"])
+        assert predicted == [None]
+        assert probs.tolist() == [0.0]
+
+    def test_calibrate_threshold(self):
+        probs = np.array([0.99, 0.95, 0.9, 0.8, 0.6])
+        predicted = ["a", "a", "a", "a", "a"]
+        truth = ["a", "a", "a", "b", "b"]
+        assert calibrate_threshold(predicted, probs, truth, 1.0, min_rows=2) == 0.9
+        assert calibrate_threshold(predicted, probs, truth, 0.75, min_rows=2) == 0.8
+        assert calibrate_threshold(predicted, probs, truth, 1.0, min_rows=4) is None
+
+
+class TestClassifyWithDistillation:
+    def test_offloads_confident_rows(self):
+        # Warm-up rows repeat a few short prompts (deduplicated, so the rate
+        # limiter never waits); later rows are new prompts for the model
+        texts, labels = _texts(200, words=2, vocab=3)
+        later_texts, later_labels = _texts(400, seed=1, words=4, vocab=3)
+        texts, labels = texts + later_texts, labels + later_labels
+        answers = dict(zip(texts, labels))
+        calls = []
+
+        async def fake(messages, **kwargs):
+            text = messages[-1]["content"]
+            calls.append(text)
+            return make_response(answers[text], completion_tokens=1)
+
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with patch("backend.llm.litellm.acompletion", fake):
+            run = classify_with_distillation(
+                pd.DataFrame({"text": texts}), config,
+                PromptTemplate("Label it.\nDoc: {text}"), CATEGORIES,
+                warmup_rows=200, target_agreement=0.9, block_rows=100,
+            )
+
+        results = run["results"]
+        assert [r.row_index for r in results] == list(range(600))
+        assert [r.matched_label for r in results] == labels
+        assert run["threshold"] is not None
+        assert run["local_rows"] > 0
+        assert run["local_rows"] + run["llm_rows"] == 600
+        assert len(calls) <= 50
+        assert run["offload_ratio"] == run["local_rows"] / 600
+        # Warm-up rows all went to the LLM
+        assert all(r.source != "local" for r in results[:200])
+        # Held-out rows are split between calibration and evaluation
+        assert run["calibration_rows"] == 20
+        holdout = run["holdout"]
+        assert holdout["rows"] == 20
+        assert holdout["agreement"] >= 0.9
+        assert summarize_results(results)["local_rows"] == run["local_rows"]
+
+    def test_streams_results_to_callback(self):
+        texts, labels = _texts(300, words=2)
+        answers = dict(zip(texts, labels))
+
+        async def fake(messages, **kwargs):
+            return make_response(answers[messages[-1]["content"]], completion_tokens=1)
+
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        streamed = []
+        with patch("backend.llm.litellm.acompletion", fake):
+            run = classify_with_distillation(
+                pd.DataFrame({"text": texts}), config,
+                PromptTemplate("Label it.\nDoc: {text}"), CATEGORIES,
+                warmup_rows=200, target_agreement=0.9, block_rows=100,
+                on_result=streamed.append,
+            )
+
+        assert run["results"] is None
+        streamed.sort(key=lambda r: r.row_index)
+        assert [r.row_index for r in streamed] == list(range(300))
+        assert [r.matched_label for r in streamed] == labels
+        assert run["local_rows"] == sum(r.source == "local" for r in streamed)
+
+    def test_resumes_from_journal(self, tmp_path):
+        texts, labels = _texts(300, words=2, vocab=3)
+        answers = dict(zip(texts, labels))
+        calls = []
+
+        async def fake(messages, **kwargs):
+            calls.append(messages)
+            return make_response(answers[messages[-1]["content"]], completion_tokens=1)
+
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+
+        def run():
+            return classify_with_distillation(
+                pd.DataFrame({"text": texts}), config,
+                PromptTemplate("Label it.\nDoc: {text}"), CATEGORIES,
+                warmup_rows=200, target_agreement=0.9,
+                journal=RunJournal("distill"), use_cache=False,
+            )
+
+        with patch("backend.checkpoint.CHECKPOINT_DIR", tmp_path), \
+                patch("backend.llm.litellm.acompletion", fake):
+            first = run()
+            first_calls = len(calls)
+            resumed = run()
+
+        # Every row came from the journal, and still trained the model
+        assert len(calls) == first_calls
+        assert [r.matched_label for r in resumed["results"]] == labels
+        assert resumed["calibration_rows"] == first["calibration_rows"]
+        assert resumed["threshold"] is not None
+
+    def test_rejects_multi_label(self):
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with pytest.raises(ValueError):
+            classify_with_distillation(
+                pd.DataFrame({"text": ["x"]}), config, PromptTemplate("{text}"),
+                CATEGORIES, multi_label=True,
+            )
@@ -1,7 +1,16 @@
 """Tests for fuzzy matching."""
 
 import pytest
-from backend.fuzzy_match import fuzzy_match_label, fuzzy_match_multi_label, find_safe_delimiter
+from backend.fuzzy_match import (
+    CategoryMatcher,
+    TrigramIndex,
+    fuzzy_match_label,
+    fuzzy_match_label_with_score,
+    fuzzy_match_multi_label,
+    fuzzy_match_multi_label_with_score,
+    find_safe_delimiter,
+    get_matcher,
+)
 
 
 class TestFuzzyMatchLabel:
@@ -89,3 +98,104 @@ class TestFindSafeDelimiter:
         categories = ["a|b", "c||d", "e;;f", "g###h", "i^^^j"]
         result = find_safe_delimiter(categories)
         assert result == "|||"
+
+
+class TestMatchScores:
+    def test_exact_scores_100(self):
+        assert fuzzy_match_label_with_score("sports", ["Sports"]) == ("Sports", 100.0)
+
+    def test_fuzzy_score(self):
+        match, score = fuzzy_match_label_with_score("Sprts", ["Sports", "Politics"])
+        assert match == "Sports"
+        assert 60 <= score < 100
+
+    def test_no_match_scores_0(self):
+        assert fuzzy_match_label_with_score("xyz", ["Sports"]) == (None, 0.0)
+
+    def test_multi_label_weakest_part(self):
+        matched, score = fuzzy_match_multi_label_with_score(
+            "Sports|Politcs", ["Sports", "Politics"]
+        )
+        assert matched == ["Sports", "Politics"]
+        assert 60 <= score < 100
+        assert fuzzy_match_multi_label_with_score("Sports|xyz", ["Sports"])[1] == 0.0
+
+
+class TestCategoryMatcher:
+    CATEGORIES = ["Sports", "Politics", "Technology", "sports"]
+
+    def test_exact_hit_keeps_first_case(self):
+        matcher = CategoryMatcher(self.CATEGORIES)
+        assert matcher.match(" SPORTS ") == ("Sports", 100.0)
+
+    def test_match_many_agrees_with_match(self):
+        answers = ["Sprts", "Politcs", "Tech", "xyz", "", "technology", "Sprts"]
+        batched = CategoryMatcher(self.CATEGORIES).match_many(answers)
+        single = CategoryMatcher(self.CATEGORIES)
+        assert batched == [single.match(a) for a in answers]
+
+    def test_parallel_batch_agrees_with_match(self, monkeypatch):
+        monkeypatch.setattr("backend.fuzzy_match.PARALLEL_MIN_QUERIES", 1)
+        answers = ["Sprts", "Politcs", "Tech", "xyz", "", "technology", "Sprts"]
+        batched = CategoryMatcher(self.CATEGORIES).match_many(answers)
+        single = CategoryMatcher(self.CATEGORIES)
+        assert batched == [single.match(a) for a in answers]
+
+    def test_small_batches_skip_cdist(self, monkeypatch):
+        def cdist(*args, **kwargs):
+            raise AssertionError("cdist called for a single answer")
+
+        monkeypatch.setattr("backend.fuzzy_match.process.cdist", cdist)
+        assert CategoryMatcher(self.CATEGORIES).match_many(["Sprts"])[0][0] == "Sports"
+
+    def test_fuzzy_answers_cached(self):
+        matcher = CategoryMatcher(self.CATEGORIES, cache_size=2)
+        matcher.match_many(["Sprts", "Politcs", "Tecnology"])
+        # Oldest entry evicted; exact hits never enter the cache
+        assert list(matcher._cache) == ["Politcs", "Tecnology"]
+        matcher.match("Sports")
+        assert len(matcher._cache) == 2
+
+    def test_match_multi_many(self):
+        matcher = CategoryMatcher(["Sports", "Politics"])
+        results = matcher.match_multi_many(["Sports|Politcs", "", "Sports|xyz"])
+        assert results[0][0] == ["Sports", "Politics"]
+        assert 60 <= results[0][1] < 100
+        assert results[1] == ([], 0.0)
+        assert results[2] == (["Sports"], 0.0)
+
+    def test_shared_matcher_per_category_list(self):
+        assert get_matcher(["A", "B"]) is get_matcher(["A", "B"])
+        assert get_matcher(["A", "B"]) is not get_matcher(["A", "C"])
+
+
+class TestTrigramIndex:
+    CATEGORIES = [f"{a} {b} {i}" for i, (a, b) in enumerate(
+        (a, b) for a in ("Billing", "Shipping", "Refund", "Account", "Fraud")
+        for b in ("Question", "Dispute", "Delay", "Error")
+    )]
+
+    def test_shortlist_ranks_shared_trigrams(self):
+        index = TrigramIndex(self.CATEGORIES)
+        shortlist = index.shortlist("refund dispute 9", size=3)
+        assert len(shortlist) == 3
+        assert self.CATEGORIES.index("Refund Dispute 9") in shortlist
+        assert list(shortlist) == sorted(shortlist)
+
+    def test_no_shared_trigrams(self):
+        assert len(TrigramIndex(["abc"]).shortlist("xyz")) == 0
+
+    def test_indexed_matcher_agrees_with_full_scan(self):
+        answers = ["Refund Dispte 9", "billing error 3", "Fraud Delay", "zzz", "Acount Error 15"]
+        indexed = CategoryMatcher(self.CATEGORIES, use_index=True).match_many(answers)
+        full = CategoryMatcher(self.CATEGORIES, use_index=False).match_many(answers)
+        assert indexed == full
+
+    def test_large_lists_indexed_by_default(self):
+        assert CategoryMatcher(self.CATEGORIES)._index is None
+        assert CategoryMatcher([f"c{i}" for i in range(600)])._index is not None
+
+    def test_delimiter_runs(self):
+        assert find_safe_delimiter(["a;b", "c|d"]) == "||"
+        assert find_safe_delimiter(["a;;|b"]) == "||"
+        assert find_safe_delimiter(["a|||b", "c;;d"]) == "###"
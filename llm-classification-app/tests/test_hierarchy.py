@@ -0,0 +1,127 @@
+"""Tests for two-stage hierarchical classification."""
+
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from backend.classifier import iter_classify
+from backend.hierarchy import CategoryTree, classify_hierarchical, is_category_tree
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+
+from conftest import make_response
+
+CATEGORIES = [
+    "Sport > Football",
+    "Sport > Tennis",
+    "Politics > Elections",
+    "Politics>Tax",
+    "Other",
+]
+
+
+class TestCategoryTree:
+    def test_parse(self):
+        tree = CategoryTree.parse(CATEGORIES + ["Sport > Tennis", "A > B > C"])
+        assert tree.groups == {
+            "Sport": ["Football", "Tennis"],
+            "Politics": ["Elections", "Tax"],
+            "Other": [],
+            "A": ["B > C"],
+        }
+
+    def test_leaves(self):
+        assert CategoryTree.parse(CATEGORIES).leaves() == [
+            "Sport > Football", "Sport > Tennis",
+            "Politics > Elections", "Politics > Tax", "Other",
+        ]
+
+    def test_is_category_tree(self):
+        assert is_category_tree(CATEGORIES)
+        assert not is_category_tree(["Sport", "Politics"])
+
+
+class TestClassifyHierarchical:
+    def test_two_stages(self):
+        df = pd.DataFrame({"text": ["goal scored", "vote counted", "weather", "ace serve"]})
+        answers = {
+            "goal scored": ("Sport", "Football"),
+            "vote counted": ("Politics", "Elections"),
+            "weather": ("Other", None),
+            "ace serve": ("Sport", "Tennis"),
+        }
+        prompts = []
+
+        async def fake(messages, **kwargs):
+            prompt = "".join(m["content"] for m in messages)
+            prompts.append(prompt)
+            options, text = prompt.split("\nDoc: ")
+            group, child = answers[text]
+            answer = group if "Sport\n" in options or options.endswith("Other") else child
+            return make_response(answer, completion_tokens=1)
+
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with patch("backend.llm.litellm.acompletion", fake):
+            run = classify_hierarchical(
+                df, config, PromptTemplate("{label_options}\nDoc: {text}"),
+                CategoryTree.parse(CATEGORIES), use_cache=False,
+            )
+
+        assert [r.matched_label for r in run["results"]] == [
+            "Sport > Football", "Politics > Elections", "Other", "Sport > Tennis",
+        ]
+        assert [r.row_index for r in run["results"]] == [0, 1, 2, 3]
+        assert run["row_groups"] == ["Sport", "Politics", "Other", "Sport"]
+        # Leaves are refined: both stages' tokens land on the row
+        assert run["results"][0].input_tokens == 20
+        assert run["results"][2].input_tokens == 10
+
+        stats = run["stage_stats"]
+        assert stats["groups"]["rows"] == 4
+        assert stats["children"]["rows"] == 3
+        assert {g: s["rows"] for g, s in stats["per_group"].items()} == {
+            "Sport": 2, "Politics": 1,
+        }
+        # Child prompts list only their group's children
+        child_prompts = [p for p in prompts if "Football" in p]
+        assert child_prompts and all("Elections" not in p for p in child_prompts)
+
+    def test_streamed_run_refines_each_row(self):
+        df = pd.DataFrame({"text": ["goal scored", "weather", "vote counted"]})
+        answers = {
+            "goal scored": ("Sport", "Football"),
+            "vote counted": ("Politics", "Elections"),
+            "weather": ("Other", None),
+        }
+
+        async def fake(messages, **kwargs):
+            prompt = "".join(m["content"] for m in messages)
+            options, text = prompt.split("\nDoc: ")
+            group, child = answers[text]
+            answer = group if "Sport\n" in options or options.endswith("Other") else child
+            return make_response(answer, completion_tokens=1)
+
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = sorted(
+                iter_classify(
+                    [df.iloc[:2], df.iloc[2:]], config,
+                    PromptTemplate("{label_options}\nDoc: {text}"), CATEGORIES,
+                    use_cache=False, category_tree=CategoryTree.parse(CATEGORIES),
+                ),
+                key=lambda r: r.row_index,
+            )
+
+        assert [r.matched_label for r in results] == [
+            "Sport > Football", "Other", "Politics > Elections",
+        ]
+        assert [r.input_tokens for r in results] == [20, 10, 20]
+
+    def test_rejects_multi_label(self):
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with pytest.raises(ValueError):
+            classify_hierarchical(
+                pd.DataFrame({"text": ["x"]}), config, PromptTemplate("{text}"),
+                CategoryTree.parse(CATEGORIES), multi_label=True,
+            )
@@ -0,0 +1,76 @@
+"""Tests for compact label codes."""
+
+from unittest.mock import patch
+
+from backend.label_codes import (
+    coded_answer_format,
+    decode_label_codes,
+    make_label_codes,
+    render_coded_options,
+    saved_output_tokens,
+)
+from backend.prompt import DEFAULT_CLASSIFICATION_PROMPT, PromptTemplate
+
+CATEGORIES = ["Customer complaint about billing", "Feature request", "Other"]
+
+
+def test_make_label_codes():
+    assert make_label_codes(CATEGORIES) == {
+        "A1": "Customer complaint about billing",
+        "A2": "Feature request",
+        "A3": "Other",
+    }
+
+
+def test_render_lists_codes():
+    codes = make_label_codes(CATEGORIES)
+    text = render_coded_options(codes)
+    assert "A1: Customer complaint about billing" in text
+    assert "code only" in coded_answer_format(codes)
+
+
+def test_template_renders_codes():
+    template = PromptTemplate("{label_options}\n\n{text}")
+    prompt = template.render({"text": "hi"}, CATEGORIES, label_codes=make_label_codes(CATEGORIES))
+    assert "A2: Feature request" in prompt
+
+
+def test_answer_format_asks_for_codes_instead_of_names():
+    template = PromptTemplate(DEFAULT_CLASSIFICATION_PROMPT)
+    coded = template.render({"text": "hi"}, CATEGORIES, label_codes=make_label_codes(CATEGORIES))
+    named = template.render({"text": "hi"}, CATEGORIES)
+    assert "code only" in coded and "category name EXACTLY" not in coded
+    assert "category name EXACTLY" in named and "code only" not in named
+
+
+class TestDecode:
+    def test_single(self):
+        codes = make_label_codes(CATEGORIES)
+        assert decode_label_codes("A2", codes) == "Feature request"
+        assert decode_label_codes(" a1.", codes) == "Customer complaint about billing"
+
+    def test_multi(self):
+        codes = make_label_codes(CATEGORIES)
+        assert decode_label_codes("A3|A1|A3", codes, multi_label=True) == ["Other", CATEGORIES[0]]
+
+    def test_unknown_code(self):
+        codes = make_label_codes(CATEGORIES)
+        assert decode_label_codes("A9", codes) is None
+        assert decode_label_codes("Feature request", codes) is None
+
+    def test_stray_codes_in_free_text(self):
+        codes = make_label_codes(CATEGORIES)
+        assert decode_label_codes("Feature request for the A1 printer", codes) is None
+        assert decode_label_codes("A2|laptop a1", codes, multi_label=True) is None
+
+    def test_json_codes(self):
+        codes = make_label_codes(CATEGORIES)
+        raw = '{"categories": [{"category": "A2"}, {"category": "a3"}]}'
+        assert decode_label_codes(raw, codes, multi_label=True) == ["Feature request", "Other"]
+
+
+def test_saved_output_tokens():
+    codes = make_label_codes(CATEGORIES)
+    with patch("backend.label_codes.count_tokens_for_prompt", lambda text, model: len(text.split())):
+        assert saved_output_tokens(CATEGORIES[0], codes, "m") == 3
+        assert saved_output_tokens(["Other"], codes, "m") == 0
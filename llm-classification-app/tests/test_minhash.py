@@ -0,0 +1,60 @@
+"""Tests for MinHash signatures and the LSH index."""
+
+import numpy as np
+
+from backend.minhash import (
+    LSHIndex,
+    MinHasher,
+    choose_bands,
+    normalize_text,
+    shingles,
+    similarity,
+)
+
+EMAIL = (
+    "Dear {name}, thank you for contacting support about order {order}. "
+    "Your refund has been approved and will reach your account within "
+    "five working days. Kind regards, the customer service team."
+)
+
+
+class TestSignatures:
+    def test_normalize_folds_digits_and_space(self):
+        assert normalize_text("Order  #123\nSHIPPED") == "order #000 shipped"
+
+    def test_short_text_is_one_shingle(self):
+        assert shingles("Hi") == {"hi"}
+        assert shingles("   ") == set()
+
+    def test_similar_texts_have_similar_signatures(self):
+        hasher = MinHasher()
+        a = hasher.signature(EMAIL.format(name="John", order=12345))
+        b = hasher.signature(EMAIL.format(name="Maria", order=99812))
+        c = hasher.signature("My laptop screen cracked on arrival, please replace it.")
+        assert similarity(a, b) > 0.8
+        assert similarity(a, c) < 0.2
+
+    def test_signatures_are_deterministic(self):
+        text = EMAIL.format(name="Ann", order=1)
+        assert np.array_equal(MinHasher().signature(text), MinHasher().signature(text))
+        assert MinHasher().signatures([text, "other"]).shape == (2, 128)
+
+
+class TestLSHIndex:
+    def test_choose_bands(self):
+        bands, rows = choose_bands(0.9)
+        assert bands * rows <= 128
+        # Lower thresholds need more, shorter bands
+        low_bands, low_rows = choose_bands(0.5)
+        assert low_bands > bands and low_rows < rows
+
+    def test_query_returns_best_match_above_threshold(self):
+        hasher = MinHasher()
+        index = LSHIndex(0.8)
+        index.add("john", hasher.signature(EMAIL.format(name="John", order=1)))
+        index.add("laptop", hasher.signature("My laptop screen cracked on arrival."))
+        assert len(index) == 2
+
+        key, score = index.query(hasher.signature(EMAIL.format(name="Maria", order=2)))
+        assert key == "john" and score >= 0.8
+        assert index.query(hasher.signature("Where is my parcel?")) is None
@@ -0,0 +1,47 @@
+"""Tests for model configuration."""
+
+from backend.models import ModelConfig
+
+
+def _kwargs(model_id: str, **overrides) -> dict:
+    return ModelConfig(
+        model_id=model_id, display_name=model_id, vendor="", **overrides
+    ).to_litellm_kwargs()
+
+
+def test_prefix_caching_requested_for_supported_vendors():
+    for model_id in ("gemini-2.5-flash", "claude-sonnet-4@20250514"):
+        assert _kwargs(model_id)["cache_control_injection_points"] == [
+            {"location": "message", "role": "system"}
+        ]
+
+
+def test_prefix_caching_can_be_disabled():
+    assert "cache_control_injection_points" not in _kwargs(
+        "gemini-2.5-flash", prompt_caching=False
+    )
+
+
+def test_no_prefix_caching_for_other_models():
+    assert "cache_control_injection_points" not in _kwargs("llama-3.1-405b")
+
+
+def test_logprobs_only_for_gemini():
+    def config(model_id, **overrides):
+        return ModelConfig(model_id=model_id, display_name=model_id, vendor="", **overrides)
+
+    assert config("gemini-2.5-flash").supports_logprobs()
+    assert not config("gemini-2.5-flash", logprobs=False).supports_logprobs()
+    assert not config("claude-sonnet-4@20250514").supports_logprobs()
+
+
+def test_thinking_budget():
+    def config(model_id, level):
+        return ModelConfig(model_id=model_id, display_name=model_id, vendor="", thinking_level=level)
+
+    assert config("gemini-2.5-flash", "low").thinking_budget() == 1024
+    assert config("claude-sonnet-4", "high").thinking_budget() == 32000
+    assert config("gemini-2.5-flash", "auto").thinking_budget() is None
+    assert config("gemini-2.5-flash", "auto").thinking_budget(planning=True) == 8192
+    assert config("gemini-2.5-flash", None).thinking_budget(planning=True) is None
+    assert config("llama-3.1-405b", "high").thinking_budget() is None
@@ -0,0 +1,97 @@
+"""Tests for incremental result output."""
+
+import pandas as pd
+import pytest
+
+from backend.classifier import ClassificationResult
+from backend.output import ResultSink, format_label
+
+
+def result(idx: int, label) -> ClassificationResult:
+    return ClassificationResult(
+        row_index=idx, raw_response=str(label), matched_label=label,
+        input_tokens=1, output_tokens=1,
+    )
+
+
+@pytest.fixture
+def source_df():
+    return pd.DataFrame({"text": [f"row {i}" for i in range(7)]})
+
+
+class TestResultSink:
+    def test_writes_rows_in_order(self, tmp_path, source_df):
+        path = tmp_path / "out.csv"
+        with ResultSink(path, source_df, chunk_size=3) as sink:
+            for idx in [3, 1, 0, 6, 2, 5, 4]:
+                sink.add(result(idx, f"L{idx}"))
+        out = pd.read_csv(path)
+        assert list(out["text"]) == list(source_df["text"])
+        assert list(out["classification"]) == [f"L{i}" for i in range(7)]
+        assert list(out.columns) == [
+            "text", "classification", "raw_response", "match_score", "confidence"
+        ]
+
+    def test_flushes_contiguous_chunks_mid_run(self, tmp_path, source_df):
+        path = tmp_path / "out.csv"
+        sink = ResultSink(path, source_df, chunk_size=2)
+        sink.add(result(1, "b"))
+        assert not path.exists()
+        sink.add(result(0, "a"))
+        assert sink.rows_written == 2
+        assert len(pd.read_csv(path)) == 2
+        # Row 2 is missing, so 3 waits in the buffer
+        sink.add(result(3, "d"))
+        assert sink.rows_written == 2
+        sink.close()
+        assert len(pd.read_csv(path)) == 2
+
+    def test_close_writes_partial_chunk(self, tmp_path, source_df):
+        path = tmp_path / "out.csv"
+        with ResultSink(path, source_df, chunk_size=100) as sink:
+            sink.add(result(0, "a"))
+            sink.add(result(1, "b"))
+        assert list(pd.read_csv(path)["classification"]) == ["a", "b"]
+
+    def test_multi_label_joined(self, tmp_path, source_df):
+        path = tmp_path / "out.csv"
+        with ResultSink(path, source_df, multi_label=True, delimiter=";") as sink:
+            sink.add(result(0, ["a", "b"]))
+        assert pd.read_csv(path)["classification"][0] == "a;b"
+
+    def test_chunked_source(self, tmp_path, source_df):
+        path = tmp_path / "out.csv"
+        chunks = (source_df.iloc[i:i + 3] for i in range(0, 7, 3))
+        with ResultSink(path, chunks, chunk_size=2) as sink:
+            for idx in reversed(range(7)):
+                sink.add(result(idx, f"L{idx}"))
+        out = pd.read_csv(path)
+        assert list(out["text"]) == list(source_df["text"])
+        assert list(out["classification"]) == [f"L{i}" for i in range(7)]
+
+    def test_short_source_is_an_error(self, tmp_path, source_df):
+        sink = ResultSink(tmp_path / "out.csv", [source_df.head(1)], chunk_size=2)
+        with pytest.raises(ValueError):
+            sink.add(result(0, "a"))
+            sink.add(result(1, "b"))
+
+    def test_rejects_unknown_format(self, tmp_path, source_df):
+        with pytest.raises(ValueError):
+            ResultSink(tmp_path / "out.xlsx", source_df)
+
+
+def test_format_label():
+    assert format_label(result(0, "a")) == "a"
+    assert format_label(result(0, ["a", "b"]), multi_label=True) == "a|b"
+    assert format_label(result(0, None)) is None
+
+
+def test_parquet_output(tmp_path, source_df):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "out.parquet"
+    with ResultSink(path, source_df, chunk_size=2) as sink:
+        for idx in reversed(range(7)):
+            sink.add(result(idx, None if idx < 2 else f"L{idx}"))
+    out = pd.read_parquet(path)
+    assert list(out["text"]) == list(source_df["text"])
+    assert list(out["classification"])[2:] == [f"L{i}" for i in range(2, 7)]
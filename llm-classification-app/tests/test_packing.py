@@ -0,0 +1,162 @@
+"""Tests for multi-row packed requests."""
+
+import json
+import re
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from backend.classifier import classify_rows, summarize_results
+from backend.models import ModelConfig
+from backend.packing import (
+    MAX_PACK_SIZE,
+    choose_pack_size,
+    estimate_pack_size,
+    parse_packed_response,
+    render_packed_prompt,
+    split_usage,
+)
+from backend.prompt import PromptTemplate
+
+from conftest import make_response
+
+
+CATEGORIES = ["Sports", "Politics", "Tech"]
+
+
+@pytest.fixture
+def template():
+    return PromptTemplate("Classify: {text}\nCategories: {label_options}")
+
+
+@pytest.fixture
+def config():
+    return ModelConfig(model_id="gemini-2.0-flash", display_name="G", vendor="Google")
+
+
+class TestRenderPacked:
+    def test_contains_items_and_categories_once(self, template):
+        prompt = render_packed_prompt(
+            template, [("0", {"text": "football"}), ("1", {"text": "election"})],
+            CATEGORIES,
+        )
+        assert "### Item 0" in prompt and "<text>: football" in prompt
+        assert "### Item 1" in prompt and "<text>: election" in prompt
+        assert prompt.count("Politics") == 1
+        assert "Classify: <text>" in prompt
+
+
+class TestParsePacked:
+    def test_parses_array(self):
+        raw = '[{"id": "0", "label": "Sports"}, {"id": "1", "label": "politics"}]'
+        answers = parse_packed_response(raw, ["0", "1"], CATEGORIES)
+        assert answers == {
+            "0": ("Sports", "Sports", 100.0), "1": ("politics", "Politics", 100.0),
+        }
+
+    def test_fuzzy_answers_keep_their_score(self):
+        raw = '[{"id": "0", "label": "Sportz"}]'
+        label, matched, score = parse_packed_response(raw, ["0"], CATEGORIES)["0"]
+        assert matched == "Sports"
+        assert 60 <= score < 100
+
+    def test_tolerates_fences(self):
+        raw = '```json\n[{"id": "3", "label": "Tech"}]\n```'
+        assert parse_packed_response(raw, ["3"], CATEGORIES)["3"][1] == "Tech"
+
+    def test_drops_missing_unknown_and_mangled(self):
+        raw = json.dumps([
+            {"id": "0", "label": "Sports"},
+            {"id": "9", "label": "Tech"},       # not in the pack
+            {"id": "1", "label": "zzzzzzzz"},   # no category match
+            {"id": "0", "label": "Tech"},       # duplicate id
+        ])
+        answers = parse_packed_response(raw, ["0", "1", "2"], CATEGORIES)
+        assert answers == {"0": ("Sports", "Sports", 100.0)}
+
+    def test_invalid_json(self):
+        assert parse_packed_response("Sports", ["0"], CATEGORIES) == {}
+
+    def test_multi_label(self):
+        raw = '[{"id": "0", "labels": ["Sports", "Tech"]}]'
+        answers = parse_packed_response(raw, ["0"], CATEGORIES, multi_label=True)
+        assert answers["0"][1] == ["Sports", "Tech"]
+
+
+class TestPackSize:
+    def test_limited_by_context(self, config):
+        with patch("backend.packing.context_window", return_value=10_000):
+            # (10k * 0.5 - 1000) / 400 = 10
+            assert choose_pack_size(config, prefix_tokens=1000, row_tokens=400) == 10
+
+    def test_capped(self, config):
+        with patch("backend.packing.context_window", return_value=1_000_000):
+            assert choose_pack_size(config, 100, 5) == MAX_PACK_SIZE
+
+    def test_at_least_one(self, config):
+        with patch("backend.packing.context_window", return_value=1000):
+            assert choose_pack_size(config, 5000, 5000) == 1
+
+    def test_estimate_samples_past_the_head(self, config, template):
+        # Sorted export: the long rows are all at the end
+        df = pd.DataFrame({"text": ["short"] * 80 + ["word " * 2000] * 20})
+        with patch("backend.packing.context_window", return_value=100_000):
+            head = estimate_pack_size(df, config, template, CATEGORIES, method="head")
+            stratified = estimate_pack_size(df, config, template, CATEGORIES)
+        assert stratified < head
+
+    def test_split_usage(self):
+        assert split_usage(10, 3) == [4, 3, 3]
+        assert sum(split_usage(7, 4)) == 7
+
+
+class TestPackedEngine:
+    def test_packs_and_retries_skipped_rows(self, config, template):
+        df = pd.DataFrame({"text": ["Sports", "Politics", "Tech", "Sports news"]})
+        calls = []
+
+        async def fake(messages, **kwargs):
+            content = "".join(m["content"] for m in messages)
+            calls.append(content)
+            if "### Item" not in content:
+                text = content.split("Classify: ")[1].split("\n")[0]
+                return make_response(text.split()[0])
+            items = re.findall(r"### Item (\d+)\n<text>: (.*)", content)
+            # The model skips the last item of every pack
+            answer = [{"id": i, "label": t.split()[0]} for i, t in items[:-1]]
+            return make_response(json.dumps(answer), prompt_tokens=90, completion_tokens=30)
+
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, CATEGORIES, pack_size=4, concurrency=1,
+            )
+
+        assert [r.matched_label for r in results] == ["Sports", "Politics", "Tech", "Sports"]
+        assert [r.source for r in results] == ["packed", "packed", "packed", "llm"]
+        assert [r.match_score for r in results[:3]] == [100.0, 100.0, 100.0]
+        assert len(calls) == 2
+        summary = summarize_results(results)
+        assert summary["api_calls"] == 2
+        assert summary["billed_input_tokens"] == 100
+
+    def test_keeps_usage_of_pack_answering_nothing(self, config, template):
+        df = pd.DataFrame({"text": ["Sports", "Politics"]})
+
+        async def fake(messages, **kwargs):
+            content = "".join(m["content"] for m in messages)
+            if "### Item" in content:
+                return make_response("no idea", prompt_tokens=90, completion_tokens=30)
+            return make_response(content.split("Classify: ")[1].split("\n")[0])
+
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                df, config, template, CATEGORIES, pack_size=2, concurrency=1,
+            )
+
+        assert [r.source for r in results] == ["llm", "llm"]
+        assert [r.failed_pack_size for r in results] == [2, 2]
+        summary = summarize_results(results)
+        assert summary["api_calls"] == 3
+        assert summary["billed_input_tokens"] == 90 + 2 * 10
+        assert summary["billed_output_tokens"] == 30 + 2 * 2
@@ -1,7 +1,13 @@
 """Tests for pricing module."""
 
 import pytest
-from backend.pricing import ModelPrice, load_all_prices, estimate_dataset_cost, format_cost
+from backend.pricing import (
+    ModelPrice,
+    load_all_prices,
+    estimate_dataset_cost,
+    estimate_dataset_cost_range,
+    format_cost,
+)
 
 
 class TestModelPrice:
@@ -76,6 +82,23 @@ class TestEstimateDatasetCost:
         assert abs(cost - expected) < 0.001
 
 
+    def test_range_with_thinking_budget(self):
+        price = ModelPrice(
+            model_id="test", name="Test", vendor="test",
+            input_per_mtok=1.0, output_per_mtok=2.0,
+        )
+        token_info = {"avg_input_tokens": 100, "input_tokens_ci": (80, 120)}
+        costs = estimate_dataset_cost_range(
+            price, token_info, 20, 1000, thinking_tokens=1024
+        )
+        assert costs["low"] == pytest.approx(estimate_dataset_cost(price, 80, 20, 1000))
+        assert costs["expected"] == pytest.approx(
+            estimate_dataset_cost(price, 100, 1044, 1000)
+        )
+        assert costs["high"] == pytest.approx(estimate_dataset_cost(price, 120, 1044, 1000))
+        assert costs["low"] < costs["expected"] < costs["high"]
+
+
 class TestFormatCost:
     def test_small_cost(self):
         assert "$0.0012" == format_cost(0.0012)
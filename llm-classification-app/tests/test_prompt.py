@@ -1,5 +1,6 @@
 """Tests for prompt template handling."""
 
+import pandas as pd
 import pytest
 from backend.prompt import PromptTemplate, DEFAULT_CLASSIFICATION_PROMPT
 
@@ -73,3 +74,82 @@ def test_default_prompt_has_label_options():
     assert "{label_options}" in DEFAULT_CLASSIFICATION_PROMPT
     # The default uses {text} column
     assert "text" in template.columns_used
+
+
+def test_render_parts_split_at_first_column():
+    template = PromptTemplate("Categories:\n{label_options}\n\nDocument: {text}")
+    prefix, suffix = template.render_parts({"text": "Hello"}, ["A", "B"])
+    assert prefix == "Categories:\nA\nB\n\nDocument: "
+    assert suffix == "Hello"
+    assert prefix + suffix == template.render({"text": "Hello"}, ["A", "B"])
+
+
+def test_render_parts_prefix_is_static():
+    template = PromptTemplate(DEFAULT_CLASSIFICATION_PROMPT)
+    first, _ = template.render_parts({"text": "one"}, ["A"])
+    second, _ = template.render_parts({"text": "two"}, ["A"])
+    assert first == second
+    assert "A" in first
+
+
+def test_render_parts_without_columns():
+    template = PromptTemplate("Pick one of {label_options}")
+    assert template.render_parts({}, ["A"]) == ("", "Pick one of A")
+
+
+def test_build_messages():
+    from backend.prompt import build_messages
+
+    assert build_messages("row") == [{"role": "user", "content": "row"}]
+    assert build_messages("row", prefix="task") == [
+        {"role": "system", "content": "task"},
+        {"role": "user", "content": "row"},
+    ]
+
+
+class TestCompiledPrompt:
+    def test_compile_is_cached(self):
+        template = PromptTemplate("{label_options}\n{text}")
+        assert template.compile(["A", "B"]) is template.compile(["A", "B"])
+        assert template.compile(["A", "B"]) is not template.compile(["A", "C"])
+
+    def test_render_frame_matches_render(self):
+        template = PromptTemplate("{label_options}\n{title}: {text} ({title}) {missing}")
+        df = pd.DataFrame({
+            "title": ["a", None, "c"],
+            "text": [1.5, float("nan"), 3.0],
+        })
+        df["when"] = pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"])
+        compiled = template.compile(["X", "Y"])
+        expected = [template.render(row, ["X", "Y"]) for row in df.to_dict("records")]
+        assert compiled.render_frame(df) == expected
+
+    def test_datetime_matches_str(self):
+        template = PromptTemplate("{when}")
+        df = pd.DataFrame({"when": pd.to_datetime(["2024-01-01"])})
+        assert template.compile([]).render_frame(df) == [str(df["when"][0])]
+
+    def test_render_frame_parts(self):
+        template = PromptTemplate("Categories: {label_options}\nDoc: {text}")
+        prefix, suffixes = template.compile(["A"]).render_frame_parts(
+            pd.DataFrame({"text": ["one", "two"]})
+        )
+        assert prefix == "Categories: A\nDoc: "
+        assert suffixes == ["one", "two"]
+
+    def test_braces(self):
+        template = PromptTemplate("{{literal}} {label_options} {text}")
+        prompts = template.compile(["A"]).render_frame(pd.DataFrame({"text": ["{x}"]}))
+        assert prompts == ["{literal} A {x}"]
+
+    def test_unfillable_placeholder(self):
+        template = PromptTemplate("{label_options} {text!r}")
+        assert template.render({"text": "x"}, ["A"]).startswith("Error rendering prompt")
+
+    def test_arrow_output(self):
+        pa = pytest.importorskip("pyarrow")
+        prompts = PromptTemplate("{text}").compile([]).render_frame(
+            pd.DataFrame({"text": ["a", "b"]}), as_arrow=True
+        )
+        assert prompts.type == pa.string()
+        assert prompts.to_pylist() == ["a", "b"]
@@ -0,0 +1,105 @@
+"""Tests for the quota-aware rate limiter."""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from backend.models import ModelConfig
+from backend.pricing import load_all_prices
+from backend.ratelimit import (
+    TokenBucket,
+    QuotaLimiter,
+    get_limiter,
+    DEFAULT_RPM,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    fake = FakeClock()
+    with patch("backend.ratelimit.time.monotonic", fake):
+        yield fake
+
+
+class TestTokenBucket:
+    def test_burst_up_to_capacity(self, clock):
+        bucket = TokenBucket(per_minute=60)
+        for _ in range(60):
+            assert bucket.reserve(1) == 0.0
+        # 61st request waits for one refill (1 token/second)
+        assert bucket.reserve(1) == pytest.approx(1.0)
+
+    def test_waits_queue_up(self, clock):
+        bucket = TokenBucket(per_minute=60, capacity=1)
+        assert bucket.reserve(1) == 0.0
+        assert bucket.reserve(1) == pytest.approx(1.0)
+        assert bucket.reserve(1) == pytest.approx(2.0)
+
+    def test_refills_over_time(self, clock):
+        bucket = TokenBucket(per_minute=60, capacity=10)
+        bucket.reserve(10)
+        clock.now += 5
+        assert bucket.available == pytest.approx(5)
+
+    def test_oversized_request_capped(self, clock):
+        bucket = TokenBucket(per_minute=100)
+        assert bucket.reserve(1_000_000) == 0.0
+
+    def test_credit(self, clock):
+        bucket = TokenBucket(per_minute=100)
+        bucket.reserve(50)
+        bucket.credit(20)
+        assert bucket.available == pytest.approx(70)
+
+
+class TestQuotaLimiter:
+    def test_token_quota_limits(self, clock):
+        limiter = QuotaLimiter(rpm=1000, tpm=600)
+        assert limiter._reserve(600) == 0.0
+        # tokens refill at 10/s, so 100 more tokens needs 10s
+        assert limiter._reserve(100) == pytest.approx(10.0)
+
+    def test_settle_refunds_overestimate(self, clock):
+        limiter = QuotaLimiter(rpm=1000, tpm=1000)
+        limiter._reserve(800)
+        limiter.settle(estimated_tokens=800, actual_tokens=300)
+        assert limiter.tokens.available == pytest.approx(700)
+
+
+class TestRegistry:
+    def test_shared_per_model(self):
+        a = ModelConfig(model_id="m", display_name="M", vendor="Google")
+        b = ModelConfig(model_id="m", display_name="M", vendor="Google", temperature=1.0)
+        assert get_limiter(a) is get_limiter(b)
+
+    def test_region_keys_separate_limiters(self):
+        config = ModelConfig(model_id="m", display_name="M", vendor="Google")
+        with patch.dict(os.environ, {"VERTEX_REGION": "us-central1"}):
+            us = get_limiter(config)
+        with patch.dict(os.environ, {"VERTEX_REGION": "europe-west4"}):
+            eu = get_limiter(config)
+        assert us is not eu
+
+    def test_default_quota_without_price(self):
+        config = ModelConfig(model_id="m", display_name="M", vendor="Google")
+        assert get_limiter(config).rpm == DEFAULT_RPM
+
+    def test_quotas_from_registry(self):
+        price = load_all_prices()["gemini-2.5-flash"]
+        assert price.rpm and price.tpm
+        config = ModelConfig(
+            model_id=price.model_id, display_name=price.name,
+            vendor="Google", price=price,
+        )
+        limiter = get_limiter(config)
+        assert limiter.rpm == price.rpm
+        assert limiter.tpm == price.tpm
@@ -0,0 +1,177 @@
+"""Tests for embedding retrieval of candidate categories."""
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import litellm
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.classifier import classify_rows
+from backend.concurrency import FixedConcurrency
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+from backend.retrieval import (
+    LABEL_SLOT,
+    CategoryIndex,
+    embed_texts,
+    fill_label_slot,
+    get_category_index,
+)
+
+from conftest import make_response
+
+CATEGORIES = [
+    "Football scores", "Tennis results", "Election news",
+    "Tax policy", "Phone reviews", "Laptop deals",
+]
+VOCAB = ["football", "tennis", "election", "tax", "phone", "laptop", "sport", "politics", "tech"]
+TOPICS = {
+    "football": "sport", "tennis": "sport", "election": "politics",
+    "tax": "politics", "phone": "tech", "laptop": "tech",
+}
+
+
+def bag_of_words(text: str) -> list[float]:
+    words = text.lower().split()
+    vector = [float(w in words) for w in VOCAB]
+    for word, topic in TOPICS.items():
+        if word in words:
+            vector[VOCAB.index(topic)] += 1.0
+    return vector
+
+
+def fake_embedding(model, input):
+    return SimpleNamespace(data=[{"embedding": bag_of_words(t)} for t in input])
+
+
+async def fake_aembedding(model, input):
+    return fake_embedding(model, input)
+
+
+@pytest.fixture(autouse=True)
+def embeddings():
+    with patch("backend.llm.litellm.embedding", fake_embedding), \
+            patch("backend.llm.litellm.aembedding", fake_aembedding):
+        yield
+
+
+class TestCategoryIndex:
+    def test_embeddings_normalised(self):
+        vectors = embed_texts(["football scores", "nothing known"])
+        assert np.linalg.norm(vectors[0]) == pytest.approx(1.0)
+        # Zero vectors stay zero rather than dividing by zero
+        assert not vectors[1].any()
+
+    def test_embeds_in_batches(self):
+        calls = []
+
+        def counting(model, input):
+            calls.append(len(input))
+            return fake_embedding(model, input)
+
+        with patch("backend.llm.litellm.embedding", counting):
+            assert embed_texts(["tax"] * 5, batch_size=2).shape == (5, len(VOCAB))
+        assert calls == [2, 2, 1]
+
+    def test_shortlist_in_category_order(self):
+        index = CategoryIndex.build(CATEGORIES, top_k=2)
+        assert index.shortlist(["who won the tennis and football"]) == [
+            ["Football scores", "Tennis results"]
+        ]
+        assert index.shortlist(["new tax on laptop"])[0] == ["Tax policy", "Laptop deals"]
+
+    def test_top_k_covering_all_categories(self):
+        index = CategoryIndex.build(CATEGORIES, top_k=50)
+        assert index.shortlist(["tax"]) == [CATEGORIES]
+
+    def test_shared_index_embeds_once(self):
+        calls = []
+
+        def counting(model, input):
+            calls.append(input)
+            return fake_embedding(model, input)
+
+        with patch("backend.llm.litellm.embedding", counting):
+            first = get_category_index(["Tax x", "Phone y"], top_k=1)
+            second = get_category_index(["Tax x", "Phone y"], top_k=2)
+        assert len(calls) == 1
+        assert first.vectors is second.vectors
+        assert (first.top_k, second.top_k) == (1, 2)
+
+    def test_async_shortlist_retries_overloads(self):
+        index = CategoryIndex.build(CATEGORIES, top_k=1)
+        calls = []
+
+        async def flaky(model, input):
+            calls.append(input)
+            if len(calls) == 1:
+                raise litellm.RateLimitError("quota", "vertex_ai", model)
+            return fake_embedding(model, input)
+
+        with patch("backend.llm.litellm.aembedding", flaky), \
+                patch("backend.concurrency.backoff_delay", return_value=0):
+            shortlists = asyncio.run(
+                index.ashortlist(["phone battery", "election"], FixedConcurrency(1))
+            )
+        assert shortlists == [["Phone reviews"], ["Election news"]]
+        assert len(calls) == 2
+
+    def test_fill_label_slot(self):
+        parts = fill_label_slot(
+            f"Options:\n{LABEL_SLOT}\n", ["phone battery", f"election\n{LABEL_SLOT}"],
+            [["Phone reviews"], ["Election news"]],
+        )
+        # Shortlists vary per row, so they stay out of the cached prefix
+        assert parts[0] == ("Options:\n", "Phone reviews\nphone battery")
+        assert parts[1] == ("Options:\n", "Election news\nelection\nElection news")
+
+
+class TestClassifyWithRetrieval:
+    def test_prompts_list_only_the_shortlist(self):
+        df = pd.DataFrame({"text": ["football match report", "tax bill vote"]})
+        sent = []
+
+        systems = set()
+
+        async def fake(messages, **kwargs):
+            prompt = "".join(m["content"] for m in messages)
+            sent.append(prompt)
+            systems.update(m["content"] for m in messages if m["role"] == "system")
+            answer = "Football scores" if "football" in prompt.split("Doc:")[-1] else "Tax policy"
+            return make_response(answer)
+
+        embedded = []
+
+        async def recording(model, input):
+            embedded.extend(input)
+            return fake_embedding(model, input)
+
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        index = CategoryIndex.build(CATEGORIES, top_k=2)
+        template = PromptTemplate("Election tax politics.\n{label_options}\nDoc: {text}")
+        with patch("backend.llm.litellm.acompletion", fake), \
+                patch("backend.llm.litellm.aembedding", recording):
+            results = classify_rows(
+                df, config, template, CATEGORIES, use_cache=False, retrieval=index,
+            )
+
+        # Only the prompt column text is embedded, not the instructions
+        assert embedded == ["football match report", "tax bill vote"]
+        assert [r.matched_label for r in results] == ["Football scores", "Tax policy"]
+        football = next(p for p in sent if "football" in p.split("Doc:")[-1])
+        assert "Tennis results" in football
+        assert "Tax policy" not in football and LABEL_SLOT not in football
+        # Every row shares one cacheable system message
+        assert systems == {"Election tax politics.\n"}
+
+    def test_rejects_label_codes(self):
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with pytest.raises(ValueError):
+            classify_rows(
+                pd.DataFrame({"text": ["tax"]}), config,
+                PromptTemplate("{label_options}\n{text}"), CATEGORIES,
+                use_label_codes=True, retrieval=CategoryIndex.build(CATEGORIES),
+            )
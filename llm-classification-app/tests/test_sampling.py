@@ -0,0 +1,48 @@
+"""Tests for sampling and interval helpers."""
+
+import pandas as pd
+import pytest
+
+from backend.sampling import mean_standard_error, sample_index, z_score
+
+
+@pytest.fixture
+def sorted_lengths():
+    """A sorted export: long rows all at the end."""
+    return pd.Series([10] * 90 + [1000] * 10)
+
+
+class TestSampleIndex:
+    def test_head_is_biased(self, sorted_lengths):
+        idx = sample_index(sorted_lengths, 10, method="head")
+        assert sorted_lengths[idx].max() == 10
+
+    def test_stratified_covers_long_tail(self, sorted_lengths):
+        idx = sample_index(sorted_lengths, 10, method="stratified")
+        assert len(idx) == len(set(idx)) == 10
+        assert (sorted_lengths[idx] == 1000).sum() >= 1
+
+    def test_random(self, sorted_lengths):
+        idx = sample_index(sorted_lengths, 20, method="random", seed=3)
+        assert len(set(idx)) == 20
+
+    def test_small_population(self):
+        assert len(sample_index(pd.Series([1, 2, 3]), 10)) == 3
+
+    def test_unknown_method(self, sorted_lengths):
+        with pytest.raises(ValueError):
+            sample_index(sorted_lengths, 5, method="systematic")
+
+
+class TestIntervals:
+    def test_standard_error(self):
+        values = pd.Series([1.0, 2.0, 3.0, 4.0])
+        assert mean_standard_error(values) == pytest.approx(values.std() / 2)
+
+    def test_finite_population(self):
+        values = pd.Series([1.0, 2.0, 3.0, 4.0])
+        assert mean_standard_error(values, population=4) == 0.0
+        assert mean_standard_error(values, population=8) < mean_standard_error(values)
+
+    def test_z_score(self):
+        assert z_score(0.95) == pytest.approx(1.96, abs=0.01)
@@ -0,0 +1,77 @@
+"""Tests for the near-duplicate semantic cache."""
+
+from unittest.mock import patch
+
+import pandas as pd
+
+from backend.classifier import ClassificationResult, classify_rows, summarize_results
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+from backend.semantic_cache import SemanticCache
+
+from conftest import make_response
+
+EMAIL = (
+    "Dear {name}, thank you for contacting support about order {order}. "
+    "Your refund has been approved and will reach your account within "
+    "five working days. Kind regards, the customer service team."
+)
+
+
+class TestSemanticCache:
+    def test_lookup_and_stats(self):
+        cache = SemanticCache(threshold=0.8)
+        stored = ClassificationResult(0, "Refund", "Refund", 100, 2)
+        cache.add(EMAIL.format(name="John", order=1), stored)
+
+        result, score = cache.lookup(EMAIL.format(name="Maria", order=2))
+        assert result is stored and score >= 0.8
+        assert cache.lookup("Completely different complaint text") is None
+        assert cache.stats() == {"lookups": 2, "hits": 1, "hit_rate": 0.5, "entries": 1}
+
+    def test_blank_text_ignored(self):
+        cache = SemanticCache()
+        cache.add("  ", ClassificationResult(0, "x", "x", 1, 1))
+        assert cache.lookup("") is None
+        assert cache.stats()["entries"] == 0
+
+
+class TestClassifyWithSemanticCache:
+    def run(self, texts, answer="Refund"):
+        calls = []
+
+        async def fake(messages, **kwargs):
+            calls.append(messages)
+            return make_response(answer, prompt_tokens=100)
+
+        cache = SemanticCache(threshold=0.8)
+        config = ModelConfig(model_id="gemini-2.5-flash", display_name="Flash", vendor="Google")
+        with patch("backend.llm.litellm.acompletion", fake):
+            results = classify_rows(
+                pd.DataFrame({"text": texts}), config,
+                PromptTemplate("{label_options}\n{text}"), ["Refund", "Delivery"],
+                use_cache=False, concurrency=1, semantic_cache=cache,
+            )
+        return results, calls, cache
+
+    def test_near_duplicates_skip_requests(self):
+        texts = [
+            EMAIL.format(name="John", order=12345),
+            "Where is my parcel? It was due last week.",
+            EMAIL.format(name="Maria", order=99812),
+            EMAIL.format(name="Li", order=7),
+        ]
+        results, calls, cache = self.run(texts)
+
+        assert len(calls) == 2
+        assert [r.source for r in results] == ["llm", "llm", "semantic", "semantic"]
+        assert [r.row_index for r in results] == [0, 1, 2, 3]
+        assert all(r.matched_label == "Refund" for r in results)
+        assert summarize_results(results)["semantic_hits"] == 2
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_unmatched_answers_not_reused(self):
+        texts = [EMAIL.format(name="John", order=1), EMAIL.format(name="Maria", order=2)]
+        results, calls, _ = self.run(texts, answer="no idea")
+        assert len(calls) == 2
+        assert {r.source for r in results} == {"llm"}
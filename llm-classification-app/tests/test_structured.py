@@ -0,0 +1,39 @@
+"""Tests for schema-constrained output."""
+
+from backend.structured import decode_structured, extract_json_labels, response_format
+
+CATEGORIES = ["Sports", "Politics", "Tech"]
+
+
+def test_response_format_enumerates_categories():
+    schema = response_format(CATEGORIES)["json_schema"]["schema"]
+    assert schema["properties"]["label"]["enum"] == CATEGORIES
+    multi = response_format(CATEGORIES, multi_label=True)["json_schema"]["schema"]
+    assert multi["properties"]["labels"]["items"]["enum"] == CATEGORIES
+
+
+class TestDecodeStructured:
+    def test_single_label(self):
+        assert decode_structured('{"label": "Tech"}', CATEGORIES) == "Tech"
+
+    def test_multi_label_dedups(self):
+        raw = '{"labels": ["Tech", "Sports", "Tech"]}'
+        assert decode_structured(raw, CATEGORIES, multi_label=True) == ["Tech", "Sports"]
+
+    def test_unknown_label_fails(self):
+        assert decode_structured('{"label": "tech stuff"}', CATEGORIES) is None
+
+    def test_free_text_fails(self):
+        assert decode_structured("Tech", CATEGORIES) is None
+
+
+class TestExtractJsonLabels:
+    def test_default_multi_label_prompt_shape(self):
+        raw = '```json\n{"categories": [{"category": "Tech"}, {"category": "Sports"}]}\n```'
+        assert extract_json_labels(raw) == ["Tech", "Sports"]
+
+    def test_plain_list(self):
+        assert extract_json_labels('["a", "b"]') == ["a", "b"]
+
+    def test_free_text(self):
+        assert extract_json_labels("Tech | Sports") is None
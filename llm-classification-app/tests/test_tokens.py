@@ -0,0 +1,90 @@
+"""Tests for fast token estimates."""
+
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from backend.llm import complete
+from backend.models import ModelConfig
+from backend.prompt import PromptTemplate
+from backend.tokens import (
+    MIN_CALIBRATION_TOKENS,
+    chars_per_token,
+    count_tokens,
+    estimate_row_tokens,
+    model_family,
+    record_usage,
+)
+
+from conftest import make_response
+
+MODEL = "vertex_ai/gemini-2.0-flash"
+
+
+@pytest.fixture
+def no_tokenizer():
+    """Force the ratio fallback, as when a tokenizer can't be downloaded."""
+    with patch("backend.tokens._tokenizer", return_value=None):
+        yield
+
+
+def test_model_family():
+    assert model_family("vertex_ai/gemini-2.5-flash") == "gemini"
+    assert model_family("vertex_ai/claude-sonnet-4@20250514") == "claude"
+    assert model_family("vertex_ai/meta/llama-3.1-405b") == "llama"
+    assert model_family("gpt-4o") == "other"
+
+
+class TestCalibration:
+    def test_default_until_enough_usage(self):
+        record_usage(MODEL, 300, 100)
+        assert chars_per_token(MODEL) == 4.0
+
+    def test_measured_ratio(self):
+        record_usage(MODEL, 3 * MIN_CALIBRATION_TOKENS, MIN_CALIBRATION_TOKENS)
+        assert chars_per_token(MODEL) == pytest.approx(3.0)
+        assert chars_per_token("vertex_ai/gemini-other") == 4.0
+
+    def test_ignores_empty_usage(self):
+        record_usage(MODEL, 0, 100)
+        record_usage(MODEL, 100, 0)
+        assert chars_per_token(MODEL) == 4.0
+
+    def test_completions_calibrate(self):
+        config = ModelConfig(model_id="gemini-2.0-flash", display_name="G", vendor="Google")
+        response = make_response(
+            "A", prompt_tokens=MIN_CALIBRATION_TOKENS, completion_tokens=1
+        )
+        with patch("backend.llm.litellm.completion", return_value=response):
+            complete(config, [{"role": "user", "content": "x" * 5 * MIN_CALIBRATION_TOKENS}],
+                     use_cache=False)
+        assert chars_per_token(MODEL) == pytest.approx(5.0)
+
+
+def test_ratio_fallback_without_tokenizer(no_tokenizer):
+    assert count_tokens("x" * 400, MODEL) == 100
+    record_usage(MODEL, 2 * MIN_CALIBRATION_TOKENS, MIN_CALIBRATION_TOKENS)
+    assert count_tokens("x" * 400, MODEL) == 200
+
+
+class TestEstimateRowTokens:
+    def test_static_prompt_plus_row_length(self, no_tokenizer):
+        template = PromptTemplate("{label_options}\n{title}: {text}")
+        df = pd.DataFrame({"title": ["ab", "abcd"], "text": ["x" * 40, "x" * 80]})
+        tokens, prefix_tokens = estimate_row_tokens(df, template, ["Cat"], MODEL)
+        static = count_tokens("Cat\n: ", MODEL)
+        assert tokens.tolist() == [static + 10, static + 21]
+        assert prefix_tokens == count_tokens("Cat\n", MODEL)
+
+    def test_repeated_and_missing_columns(self, no_tokenizer):
+        template = PromptTemplate("{text} {text} {other}")
+        df = pd.DataFrame({"text": ["x" * 40]})
+        tokens, _ = estimate_row_tokens(df, template, ["Cat"], MODEL)
+        missing = len("[missing:other]") / 4
+        assert tokens.tolist() == [round(80 / 4 + missing) + count_tokens("  ", MODEL)]
+
+    def test_large_frame(self):
+        df = pd.DataFrame({"text": ["some row text"] * 200_000})
+        tokens, _ = estimate_row_tokens(df, PromptTemplate("{text}"), ["Cat"], MODEL)
+        assert len(tokens) == 200_000